@@ -1,10 +1,51 @@
 from django.contrib import admin
-from .models import Warehouse, Order, Pricing, Container, Marketplace, City, User, AdditionalService
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from rest_framework.exceptions import ValidationError
+from .models import (Warehouse, Order, OrderLine, Pricing, Container, Marketplace, City, User, AdditionalService,
+                     ClientRate, OrderIntake, NotificationOutbox)
+from .pricing import get_price_book, client_keys
+from .search import search_queryset
+from .repricing import build_draft_book, reprice_orders
 
 # Register your models here.
 admin.site.register(Marketplace)
 admin.site.register(City)
-admin.site.register(User)
+
+
+def render_rate_card(client):
+    """Итоговый прайс клиента (общие тарифы с индивидуальными ценами) в виде таблицы"""
+    rows = get_price_book().rate_card(client)
+    if not rows:
+        return '-'
+    warehouses = {w.id: w.name for w in Warehouse.objects.all()}
+    return format_html(
+        '<table><thead><tr><th>Тариф</th><th>Тип</th><th>Спецификация</th><th>Склад</th>'
+        '<th>Базовая цена</th><th>Цена за единицу</th><th></th></tr></thead><tbody>{}</tbody></table>',
+        format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>', (
+            (name, pricing_type, specification or '', warehouses.get(warehouse_id, ''), base_price, unit_price,
+             'индивидуальная' if personal else '')
+            for name, pricing_type, specification, warehouse_id, base_price, unit_price, personal in rows
+        ))
+    )
+
+
+class ClientRateInline(admin.TabularInline):
+    model = ClientRate
+    fk_name = 'user'
+    extra = 0
+    fields = ('pricing_type', 'specification', 'warehouse', 'service', 'base_price', 'unit_price', 'is_active')
+
+
+class ClientAdmin(admin.ModelAdmin):
+    list_display = ('username', 'company_name', 'phone', 'email', 'is_staff')
+    search_fields = ('username', 'company_name', 'phone', 'email')
+    readonly_fields = ('rate_card',)
+    inlines = [ClientRateInline]
+
+    @admin.display(description='Итоговый прайс клиента')
+    def rate_card(self, obj):
+        return render_rate_card(client_keys(obj.pk, obj.company_name)) if obj.pk else '-'
 
 class WarehouseAdmin(admin.ModelAdmin):
     list_display = ('name', 'marketplace', 'city', 'marketplace_name', 'city_name')
@@ -20,19 +61,40 @@ class WarehouseAdmin(admin.ModelAdmin):
     marketplace_name.short_description = "Маркетплейс"
     city_name.short_description = "Город"
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    can_delete = False
+    fields = ('kind', 'name', 'quantity', 'base_price', 'unit_price', 'total')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'client_name', 'phone_number', 'warehouse', 'status', 'total_price', 'created_at')
     search_fields = ('id', 'client_name', 'phone_number')
     list_filter = ('status', 'warehouse')
     readonly_fields = ('total_price',)
     filter_horizontal = ('services',)
+    inlines = [OrderLineInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу заказов вместо LIKE '%...%' по колонкам"""
+        if not search_term.strip():
+            return queryset, False
+        try:
+            return search_queryset(queryset, search_term), False
+        except ValidationError:
+            # Слишком короткий запрос индекс не ищет - обычный поиск по search_fields
+            return super().get_search_results(request, queryset, search_term)
     
     fieldsets = (
         ('Основная информация', {
             'fields': ('status', 'warehouse', 'total_price')
         }),
         ('Информация о клиенте', {
-            'fields': ('client_name', 'phone_number', 'company', 'email', 'telegram_user_id')
+            'fields': ('user', 'client_name', 'phone_number', 'company', 'email', 'telegram_user_id')
         }),
         ('Информация о грузе', {
             'fields': ('cargo_type', 'container_type', 'box_count', 'pallet_count', 
@@ -43,28 +105,108 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.action(description="Оценить выручку при активации выбранных тарифов")
+def simulate_revenue(modeladmin, request, queryset):
+    """
+    Пересчитывает все заказы так, как если бы выбранные записи были действующими
+    """
+    if queryset.model is Pricing:
+        # Выбранные тарифы добавляются как новые и перекрывают действующие с тем же ключом
+        draft = {'pricing': [
+            {**row, 'is_active': True} for row in queryset.values(
+                'name', 'pricing_type', 'specification', 'warehouse_id', 'base_price', 'unit_price',
+                'tier_basis', 'tier_from', 'step_size'
+            )
+        ]}
+    else:
+        # Услуги, еще не вступившие в действие, добавляются в черновик целиком
+        draft = {'services': [
+            {**row, 'is_active': True} for row in queryset.values(
+                'id', 'name', 'price', 'service_type', 'requires_location', 'tiered'
+            )
+        ]}
+
+    report = reprice_orders(build_draft_book(draft))
+    modeladmin.message_user(
+        request,
+        f"Заказов: {report.orders}. Выручка сейчас: {report.current} ₽, "
+        f"с выбранными тарифами: {report.draft} ₽, разница: {report.delta:+} ₽"
+    )
+    for key, count, current, draft_total, delta in report.rows('warehouse'):
+        if delta:
+            modeladmin.message_user(request, f"Склад {key}: заказов {count}, разница {delta:+} ₽")
+
 class PricingAdmin(admin.ModelAdmin):
-    list_display = ('name', 'pricing_type', 'specification', 'base_price', 'unit_price', 'warehouse', 'is_active')
-    list_filter = ('pricing_type', 'warehouse', 'is_active')
+    list_display = ('name', 'pricing_type', 'specification', 'tier_basis', 'tier_from', 'base_price', 'unit_price',
+                    'step_size', 'warehouse', 'is_active', 'valid_from', 'valid_to')
+    list_filter = ('pricing_type', 'tier_basis', 'warehouse', 'is_active', 'valid_from')
     search_fields = ('name', 'specification')
+    actions = [simulate_revenue]
 
 class AdditionalServiceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'service_type', 'price', 'requires_location', 'is_active')
+    list_display = ('name', 'service_type', 'price', 'requires_location', 'is_active', 'valid_from', 'valid_to')
     list_filter = ('service_type', 'requires_location', 'is_active')
     search_fields = ('name', 'description')
+    actions = [simulate_revenue]
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('name', 'service_type', 'price', 'is_active')
+            'fields': ('name', 'service_type', 'price', 'is_active', 'valid_from', 'valid_to')
         }),
         ('Дополнительные настройки', {
-            'fields': ('requires_location', 'description')
+            'fields': ('requires_location', 'tiered', 'description')
         }),
     )
 
+class ClientRateAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'user', 'company', 'pricing_type', 'specification', 'warehouse', 'service',
+                    'base_price', 'unit_price', 'is_active')
+    list_filter = ('pricing_type', 'warehouse', 'is_active')
+    search_fields = ('user__username', 'user__company_name', 'company')
+    autocomplete_fields = ('user',)
+    readonly_fields = ('rate_card',)
+
+    @admin.display(description='Итоговый прайс клиента')
+    def rate_card(self, obj):
+        if not obj.pk:
+            return '-'
+        company = obj.user.company_name if obj.user_id else obj.company
+        return render_rate_card(client_keys(obj.user_id, company))
+
+class OrderIntakeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'user', 'order', 'attempts', 'created_at', 'processed_at')
+    list_filter = ('status',)
+    readonly_fields = ('id', 'payload', 'user', 'order', 'attempts', 'error', 'claimed_by', 'claimed_at',
+                       'created_at', 'processed_at')
+    actions = ['requeue']
+
+    @admin.action(description='Вернуть в очередь')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status=OrderIntake.STATUS_DONE).update(
+            status=OrderIntake.STATUS_PENDING, attempts=0, claimed_by=None, claimed_at=None
+        )
+        self.message_user(request, f'Возвращено в очередь заявок: {updated}')
+
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'order', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('payload', 'order', 'attempts', 'last_error', 'claimed_by', 'created_at', 'sent_at')
+    actions = ['resend']
+
+    @admin.action(description='Отправить повторно')
+    def resend(self, request, queryset):
+        updated = queryset.update(
+            status=NotificationOutbox.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now(), claimed_by=None
+        )
+        self.message_user(request, f'Поставлено в очередь уведомлений: {updated}')
+
 # Регистрация моделей
 admin.site.register(Warehouse, WarehouseAdmin)
 admin.site.register(Order, OrderAdmin)
 admin.site.register(Pricing, PricingAdmin)
 admin.site.register(Container)
-admin.site.register(AdditionalService, AdditionalServiceAdmin)
\ No newline at end of file
+admin.site.register(AdditionalService, AdditionalServiceAdmin)
+admin.site.register(User, ClientAdmin)
+admin.site.register(ClientRate, ClientRateAdmin)
+admin.site.register(OrderIntake, OrderIntakeAdmin)
+admin.site.register(NotificationOutbox, NotificationOutboxAdmin)
\ No newline at end of file
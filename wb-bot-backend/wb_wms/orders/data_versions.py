@@ -0,0 +1,77 @@
+"""
+Версии данных, общие для всех процессов: тарифы, справочники.
+
+Версия - случайная строка в таблице DataVersion. Она меняется в той же
+транзакции, что и данные (signals.py, load_pricing_data), поэтому откат
+изменения откатывает и версию, а новая версия никогда не совпадает с
+прежней.
+
+Процесс перечитывает версию не чаще раза в DATA_VERSION_CHECK_INTERVAL
+секунд: изменение, сделанное другим процессом (воркером веб-сервера,
+командой, обработчиком очереди), становится видно не позже чем через этот
+интервал. Свои изменения процесс видит сразу.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import DataVersion
+
+# Версии, прочитанные процессом: имя -> (версия, момент чтения по time.monotonic())
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def _check_interval():
+    return getattr(settings, 'DATA_VERSION_CHECK_INTERVAL', 2)
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _read_version(name):
+    version = DataVersion.objects.filter(name=name).values_list('version', flat=True).first()
+    if version is None:
+        try:
+            with transaction.atomic():
+                version = DataVersion.objects.create(name=name, version=_new_version()).version
+        except IntegrityError:
+            # Строку успел создать другой процесс
+            version = DataVersion.objects.values_list('version', flat=True).get(name=name)
+    return version
+
+
+def get_version(name):
+    """Текущая версия данных name"""
+    now = time.monotonic()
+    cached = _versions.get(name)
+    if cached is not None and now - cached[1] < _check_interval():
+        return cached[0]
+    version = _read_version(name)
+    with _versions_lock:
+        _versions[name] = (version, now)
+    return version
+
+
+def bump_version(*names):
+    """Помечает данные как измененные (в текущей транзакции)"""
+    for name in names:
+        version = _new_version()
+        if not DataVersion.objects.filter(name=name).update(version=version):
+            try:
+                with transaction.atomic():
+                    DataVersion.objects.create(name=name, version=version)
+            except IntegrityError:
+                DataVersion.objects.filter(name=name).update(version=version)
+        with _versions_lock:
+            _versions.pop(name, None)
+
+
+def forget_versions():
+    """Забывает прочитанные версии: следующее обращение прочитает их из БД"""
+    with _versions_lock:
+        _versions.clear()
@@ -0,0 +1,205 @@
+"""
+Идемпотентное создание заказов по заголовку Idempotency-Key.
+
+Первый запрос с ключом выполняется как обычно, его ответ сохраняется в
+таблице IdempotencyKey. Повтор с тем же ключом в пределах окна
+IDEMPOTENCY_KEY_TTL возвращает сохраненный ответ, не выполняя расчет,
+запись заказа и уведомление. Просроченные ключи удаляются в фоне.
+
+Ключ действует в пределах эндпоинта и клиента (request_client): два клиента
+с одинаковым ключом не получают ответы друг друга. Повтор, пришедший во
+время обработки, получает 409; если запрос оборвался и не сохранил ответ,
+повтор после IDEMPOTENCY_KEY_LEASE забирает ключ и выполняется заново.
+"""
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+# Как часто процесс запускает фоновую очистку просроченных ключей, сек
+PURGE_INTERVAL = 3600
+
+_last_purge = time.monotonic()
+_purge_lock = threading.Lock()
+
+
+def key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def key_lease():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 120))
+
+
+def request_fingerprint(body):
+    """Хеш тела запроса: повтор с тем же ключом должен совпадать с оригиналом"""
+    return hashlib.sha256(body or b'').hexdigest()
+
+
+def request_client(request):
+    """
+    Клиент, в пределах которого действует ключ: авторизованный пользователь,
+    иначе пользователь Telegram из данных заказа. Анонимные запросы без него
+    делят общее пространство ключей - их отличает сверка тела запроса.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    try:
+        data = json.loads(request.body or b'null')
+    except ValueError:
+        return ''
+    if not isinstance(data, dict):
+        return ''
+    for section in (data.get('client'), data.get('clientData'), data):
+        telegram_user_id = section.get('telegram_user_id') if isinstance(section, dict) else None
+        if telegram_user_id:
+            return f'telegram:{telegram_user_id}'[:100]
+    return ''
+
+
+def purge_expired_keys(now=None):
+    """Удаляет ключи старше окна повтора; возвращает количество удаленных"""
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=(now or timezone.now()) - key_ttl()).delete()
+    return deleted
+
+
+def _purge_in_background():
+    try:
+        deleted = purge_expired_keys()
+        if deleted:
+            logger.info(f"Purged {deleted} expired idempotency keys")
+    except Exception as e:
+        logger.error(f"Error purging idempotency keys: {str(e)}")
+    finally:
+        connection.close()
+
+
+def schedule_purge():
+    """Не чаще раза в PURGE_INTERVAL запускает очистку в фоновом потоке"""
+    global _last_purge
+
+    with _purge_lock:
+        if time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return
+        _last_purge = time.monotonic()
+    threading.Thread(target=_purge_in_background, name='idempotency-purge', daemon=True).start()
+
+
+def _response(request, data, status_code, headers=None):
+    if isinstance(request, Request):
+        return Response(data, status=status_code, headers=headers)
+    response = JsonResponse(data, status=status_code, safe=False)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def _response_data(response):
+    if isinstance(response, Response):
+        return response.data
+    return json.loads(response.content or b'null')
+
+
+def idempotent(endpoint):
+    """
+    Декоратор представления создания заказа (функции или метода ViewSet).
+
+    Без заголовка Idempotency-Key запрос выполняется как обычно.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if hasattr(arg, 'META'))
+            key = request.META.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _response(request, {'error': f'Idempotency-Key is longer than {MAX_KEY_LENGTH} characters'}, 400)
+
+            fingerprint = request_fingerprint(request.body)
+            scope = {'key': key, 'endpoint': endpoint, 'client': request_client(request)}
+            window_start = timezone.now() - key_ttl()
+
+            stored = IdempotencyKey.objects.filter(**scope).first()
+            if stored is not None and stored.created_at < window_start:
+                stored.delete()
+                stored = None
+
+            if stored is None:
+                try:
+                    with transaction.atomic():
+                        stored = IdempotencyKey.objects.create(**scope, request_hash=fingerprint)
+                except IntegrityError:
+                    # Параллельный запрос с тем же ключом успел создать запись
+                    stored = IdempotencyKey.objects.filter(**scope).first()
+                    if stored is None:
+                        return _response(request, {'error': 'A request with this Idempotency-Key is in progress'}, 409)
+                else:
+                    return _execute(view, args, kwargs, stored)
+
+            if stored.request_hash != fingerprint:
+                return _response(
+                    request, {'error': 'Idempotency-Key has already been used with a different request'}, 422
+                )
+            if stored.status_code is None:
+                if not _take_over(stored):
+                    return _response(request, {'error': 'A request with this Idempotency-Key is in progress'}, 409)
+                logger.warning(f"Idempotency key {key} ({endpoint}) taken over after an interrupted request")
+                return _execute(view, args, kwargs, stored)
+
+            logger.info(f"Replaying stored response for idempotency key {key} ({endpoint})")
+            return _response(request, stored.response, stored.status_code, {'Idempotent-Replayed': 'true'})
+
+        return wrapper
+    return decorator
+
+
+def _take_over(stored):
+    """
+    Забирает ключ, запрос которого оборвался без ответа (процесс упал или
+    прерван по таймауту): ключ в обработке дольше IDEMPOTENCY_KEY_LEASE.
+    Условный UPDATE отдает ключ только одному из параллельных повторов.
+    """
+    now = timezone.now()
+    taken = IdempotencyKey.objects.filter(
+        pk=stored.pk, status_code__isnull=True, claimed_at__lt=now - key_lease()
+    ).update(claimed_at=now)
+    if taken:
+        stored.claimed_at = now
+    return bool(taken)
+
+
+def _execute(view, args, kwargs, stored):
+    try:
+        response = view(*args, **kwargs)
+    except Exception:
+        stored.delete()
+        raise
+
+    if response.status_code >= 500:
+        # Ошибку сервера можно повторить с тем же ключом
+        stored.delete()
+    else:
+        stored.status_code = response.status_code
+        stored.response = _response_data(response)
+        stored.save(update_fields=['status_code', 'response'])
+
+    schedule_purge()
+    return response
@@ -0,0 +1,170 @@
+"""
+Асинхронный прием заказов.
+
+API проверяет форму, сохраняет ее в очереди (OrderIntake) и сразу
+отвечает 202 с идентификатором заявки. Обработчик (manage.py
+process_orders) забирает заявки пачками, создает заказы тем же
+OrderSerializer, что и синхронный API, и в той же транзакции ставит
+уведомление в Telegram в очередь отправки (NotificationOutbox).
+
+Несколько обработчиков могут работать параллельно: заявка достается
+тому, чей UPDATE первым перевел ее из pending в processing.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import OrderIntake, Warehouse
+from .notifications import build_order_notification, enqueue_notification
+from .serializers import OrderSerializer
+
+logger = logging.getLogger(__name__)
+
+INTAKE_BATCH_SIZE = 50
+MAX_ATTEMPTS = 3
+# Через сколько секунд заявка, зависшая в processing (обработчик упал), возвращается в очередь
+REQUEUE_AFTER = 600
+
+
+def validate_order_payload(data):
+    """
+    Быстрая проверка формы перед постановкой в очередь: список ошибок
+    """
+    if not isinstance(data, dict):
+        return ['Ожидается JSON-объект']
+
+    errors = []
+    delivery = data.get('delivery') or {}
+    warehouse_id = delivery.get('warehouse') if isinstance(delivery, dict) else None
+    if warehouse_id in (None, ''):
+        errors.append('delivery.warehouse: обязательное поле')
+    elif not str(warehouse_id).isdigit() or not Warehouse.objects.filter(pk=warehouse_id).exists():
+        errors.append(f'delivery.warehouse: неизвестный склад {warehouse_id!r}')
+
+    cargo_type = data.get('cargoType') or {}
+    if not isinstance(cargo_type, dict) or not (cargo_type.get('type') or cargo_type.get('selectedTypes')):
+        errors.append('cargoType: не указан тип груза')
+
+    client_data = data.get('clientData') or {}
+    if not isinstance(client_data, dict):
+        errors.append('clientData: ожидается объект')
+    else:
+        if not (client_data.get('name') or client_data.get('clientName')):
+            errors.append('clientData.name: обязательное поле')
+        if not client_data.get('phone'):
+            errors.append('clientData.phone: обязательное поле')
+    return errors
+
+
+def _error_message(error):
+    detail = getattr(error, 'detail', None)
+    if isinstance(detail, list):
+        return '; '.join(str(item) for item in detail)
+    return str(detail if detail is not None else error)
+
+
+def submit_order(data, user=None):
+    """Ставит форму заказа в очередь и возвращает заявку"""
+    intake = OrderIntake.objects.create(
+        payload=data,
+        user=user if user is not None and user.is_authenticated else None,
+    )
+    logger.info(f"Order intake {intake.pk} queued")
+    return intake
+
+
+def requeue_stale(older_than=REQUEUE_AFTER):
+    """Возвращает в очередь заявки, зависшие в обработке; возвращает их количество"""
+    return OrderIntake.objects.filter(
+        status=OrderIntake.STATUS_PROCESSING,
+        claimed_at__lt=timezone.now() - timedelta(seconds=older_than),
+    ).update(status=OrderIntake.STATUS_PENDING, claimed_by=None, claimed_at=None)
+
+
+def stalled_count(older_than=REQUEUE_AFTER):
+    """
+    Заявки, которые ждут в очереди дольше older_than секунд: если они есть,
+    обработчик (manage.py process_orders) не запущен или не справляется
+    """
+    return OrderIntake.objects.filter(
+        status=OrderIntake.STATUS_PENDING,
+        created_at__lt=timezone.now() - timedelta(seconds=older_than),
+    ).count()
+
+
+def claim_batch(batch_size=INTAKE_BATCH_SIZE):
+    """
+    Забирает пачку заявок в обработку.
+
+    Заявки переводятся в processing одним UPDATE с условием status=pending,
+    поэтому параллельный обработчик не получит те же заявки.
+    """
+    token = uuid.uuid4().hex
+    pending_ids = list(
+        OrderIntake.objects.filter(status=OrderIntake.STATUS_PENDING)
+        .order_by('created_at').values_list('pk', flat=True)[:batch_size]
+    )
+    if not pending_ids:
+        return []
+    OrderIntake.objects.filter(pk__in=pending_ids, status=OrderIntake.STATUS_PENDING).update(
+        status=OrderIntake.STATUS_PROCESSING,
+        claimed_by=token,
+        claimed_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    return list(OrderIntake.objects.filter(claimed_by=token).select_related('user').order_by('created_at'))
+
+
+def _record_failure(intake, error, permanent):
+    """Сохраняет ошибку заявки: failed для окончательной, иначе обратно в очередь"""
+    intake.status = OrderIntake.STATUS_FAILED if permanent else OrderIntake.STATUS_PENDING
+    intake.error = _error_message(error)
+    intake.claimed_by = None
+    intake.processed_at = timezone.now() if permanent else None
+    intake.save(update_fields=['status', 'error', 'claimed_by', 'processed_at'])
+
+
+def process_intake(intake, max_attempts=MAX_ATTEMPTS):
+    """
+    Создает заказ по заявке. Возвращает заказ или None при ошибке.
+
+    Ошибка в данных формы (ValidationError) повтором не исправится -
+    заявка сразу помечается failed. Прочие ошибки повторяются,
+    после max_attempts неудачных попыток заявка помечается failed.
+    """
+    try:
+        with transaction.atomic():
+            serializer = OrderSerializer(data=intake.payload, context={'user': intake.user})
+            serializer.is_valid(raise_exception=True)
+            order = serializer.save()
+            intake.status = OrderIntake.STATUS_DONE
+            intake.order = order
+            intake.error = None
+            intake.processed_at = timezone.now()
+            intake.save(update_fields=['status', 'order', 'error', 'processed_at'])
+            enqueue_notification(build_order_notification(order, intake.payload), order=order)
+    except ValidationError as e:
+        logger.warning(f"Order intake {intake.pk} rejected: {_error_message(e)}")
+        _record_failure(intake, e, permanent=True)
+        return None
+    except Exception as e:
+        logger.error(f"Error processing order intake {intake.pk} (attempt {intake.attempts}): {_error_message(e)}")
+        _record_failure(intake, e, permanent=intake.attempts >= max_attempts)
+        return None
+    return order
+
+
+def process_batch(batch_size=INTAKE_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """Обрабатывает одну пачку заявок: (создано заказов, ошибок)"""
+    created = failed = 0
+    for intake in claim_batch(batch_size):
+        if process_intake(intake, max_attempts) is None:
+            failed += 1
+        else:
+            created += 1
+    return created, failed
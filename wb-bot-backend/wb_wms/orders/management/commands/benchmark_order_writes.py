@@ -0,0 +1,104 @@
+import json
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from orders.models import Order, Warehouse
+from orders.order_writer import ORDER_WRITE_BATCH_SIZE, OrderDraft, write_order, write_orders
+from orders.pricing import Quote, get_price_book, order_quote_request
+
+
+class Rollback(Exception):
+    """Откат транзакции замера: тестовые заказы в БД не остаются"""
+
+
+def _literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def legacy_insert(cursor, order):
+    """INSERT, собранный форматированием строки (как прежний create_order)"""
+    now = timezone.now()
+    cursor.execute(f"""
+        INSERT INTO orders_order (
+            id, status, created_at, warehouse_id, cargo_type, container_type, box_count, pallet_count,
+            client_name, phone_number, total_price, additional_services, pickup_address
+        ) VALUES (
+            {_literal(uuid.uuid4().hex)}, {_literal(order.status)}, {_literal(now.isoformat())},
+            {_literal(order.warehouse_id)}, {_literal(order.cargo_type)}, {_literal(order.container_type)},
+            {_literal(order.box_count)}, {_literal(order.pallet_count)}, {_literal(order.client_name)},
+            {_literal(order.phone_number)}, {_literal(order.total_price)}, {_literal(json.dumps([]))},
+            {_literal(order.pickup_address)}
+        )
+    """)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость записи заказов: SQL из строк и order_writer по одному / пачками (заказов/сек)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000, help='Количество заказов в каждом замере')
+        parser.add_argument('--batch-size', type=int, default=ORDER_WRITE_BATCH_SIZE, help='Размер пачки INSERT')
+
+    def handle(self, *args, **options):
+        warehouse = Warehouse.objects.first()
+        if warehouse is None:
+            raise CommandError('Нет ни одного склада - заказы записать некуда')
+        count = max(options['orders'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        book = get_price_book()
+        quote = book.quote(order_quote_request(warehouse.id, 'box', None, 3, 0))
+
+        def drafts(quote=quote):
+            return [
+                OrderDraft(Order(
+                    status='new', warehouse_id=warehouse.id, cargo_type='box', box_count=3, pallet_count=0,
+                    client_name=f"Бенчмарк {i}", phone_number='+70000000000', total_price=quote.total,
+                    pickup_address="ул. Льва Толстого, д. 1, офис 'Б'",
+                ), quote, ())
+                for i in range(count)
+            ]
+
+        def legacy():
+            with connection.cursor() as cursor:
+                for draft in drafts():
+                    legacy_insert(cursor, draft.order)
+
+        def single():
+            for draft in drafts():
+                write_order(*draft)
+
+        def batched_orders_only():
+            write_orders(drafts(Quote([], None)), batch_size=batch_size)
+
+        def batched():
+            write_orders(drafts(), batch_size=batch_size)
+
+        self.stdout.write(f'Заказов в замере: {count}, строк расчета на заказ: {len(quote.lines)}')
+        for title, run in (
+            ('SQL из строк, по одному (только заказ)', legacy),
+            (f'executemany, пачками по {batch_size} (только заказ)', batched_orders_only),
+            ('write_order, по одному (заказ + строки)', single),
+            (f'write_orders, пачками по {batch_size} (заказ + строки)', batched),
+        ):
+            elapsed = self._measure(run)
+            self.stdout.write(f'{title}: {elapsed:.3f} с, {count / elapsed:,.0f} заказов/с')
+
+    @staticmethod
+    def _measure(run):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                run()
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            return elapsed
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.notifications import DISPATCH_BATCH_SIZE, MAX_ATTEMPTS, NotificationDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Доставляет уведомления о заказах из очереди в Telegram-бот'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DISPATCH_BATCH_SIZE, help='Уведомлений за один проход')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='Попыток отправки до статуса failed')
+        parser.add_argument('--timeout', type=float, help='Таймаут запроса к боту, сек (по умолчанию NOTIFICATION_TIMEOUT)')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Пауза при пустой очереди, сек')
+        parser.add_argument('--once', action='store_true', help='Отправить накопившиеся уведомления и завершиться')
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        dispatcher = NotificationDispatcher(
+            batch_size=batch_size, max_attempts=options['max_attempts'], timeout=options['timeout']
+        )
+        total_sent = total_failed = 0
+
+        while True:
+            sent, failed = dispatcher.dispatch_batch()
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Отправлено уведомлений: {sent}, ошибок: {failed}')
+
+            if sent + failed < batch_size:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Очередь уведомлений обработана. Отправлено: {total_sent}, ошибок: {total_failed}'
+        ))
@@ -0,0 +1,54 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from orders.models import Order
+from orders.order_export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_queryset, stream_export
+from rest_framework.exceptions import ValidationError
+
+
+class Command(BaseCommand):
+    help = 'Выгружает заказы в CSV / NDJSON / XLSX потоком (фильтры - как у списка заказов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки (.csv, .ndjson, .xlsx) или "-" для вывода в stdout')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--filter', action='append', default=[], metavar='ПАРАМЕТР=ЗНАЧЕНИЕ',
+                            help='Фильтр или сортировка списка заказов, например status=completed, '
+                                 'created_from=2026-09-01, sort=created_at (можно повторять)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Заказов в одной пачке чтения')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower() or 'csv'
+        if file_format == 'jsonl':
+            file_format = 'ndjson'
+        if file_format not in EXPORT_FORMATS:
+            raise CommandError(f"Неизвестный формат {file_format}, укажите --format ({', '.join(EXPORT_FORMATS)})")
+
+        params = QueryDict(mutable=True)
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f'Фильтр задается как ПАРАМЕТР=ЗНАЧЕНИЕ: {item}')
+            params.appendlist(name.strip(), value.strip())
+        try:
+            orders = export_queryset(Order.objects.all(), params)
+        except ValidationError as e:
+            errors = '; '.join(f'{name}: {detail}' for name, detail in e.detail.items())
+            raise CommandError(f'Некорректный фильтр: {errors}')
+
+        chunks = stream_export(orders, file_format, chunk_size=max(options['chunk_size'], 1))
+        if path == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        try:
+            with open(path, 'wb') as export_file:
+                for chunk in chunks:
+                    export_file.write(chunk)
+        except OSError as e:
+            raise CommandError(f'Не удалось записать файл: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Выгрузка сохранена: {path}'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import User
+from orders.order_import import IMPORT_FORMATS, IMPORT_BATCH_SIZE, detect_format, import_orders
+
+
+class Command(BaseCommand):
+    help = 'Импортирует заказы из файла CSV / NDJSON пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с заказами (.csv, .ndjson, .jsonl)')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Количество заказов в транзакции')
+        parser.add_argument('--user', help='Имя пользователя-клиента (для индивидуальных тарифов)')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as orders_file:
+                result = import_orders(orders_file, file_format, user=user, batch_size=max(options['batch_size'], 1))
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать файл: {e}')
+        except UnicodeDecodeError as e:
+            raise CommandError(f'Файл не в кодировке UTF-8: {e}')
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(f"Строка {error['row']}: {'; '.join(error['errors'])}"))
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано заказов: {result.created}, строк с ошибками: {len(result.errors)}'
+        ))
@@ -1,14 +1,26 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from orders.models import Pricing, Warehouse
+from orders.pricing import bump_tariff_version
 from decimal import Decimal
 
 class Command(BaseCommand):
-    help = 'Загружает начальные данные о ценах'
+    help = 'Публикует прайс-лист: добавляет новые тарифы и закрывает действующие'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--valid-from', help='Дата и время начала действия прайс-листа (ISO 8601), по умолчанию - сейчас')
 
     def handle(self, *args, **options):
-        # Очищаем существующие данные
-        Pricing.objects.all().delete()
-        self.stdout.write(self.style.SUCCESS('Удалены существующие данные о ценах'))
+        valid_from = timezone.now()
+        if options['valid_from']:
+            valid_from = parse_datetime(options['valid_from'])
+            if valid_from is None:
+                raise CommandError(f"Некорректная дата начала действия: {options['valid_from']}")
+            if timezone.is_naive(valid_from):
+                valid_from = timezone.make_aware(valid_from)
 
         # Цены на коробки
         box_prices = [
@@ -60,6 +72,8 @@ class Command(BaseCommand):
                 'name': 'Монопаллета 1/2/3 арт. 0-200кг',
                 'pricing_type': 'pallet',
                 'specification': '0-200 кг',
+                'tier_basis': 'weight',
+                'tier_from': Decimal('0'),
                 'base_price': Decimal('3500'),
                 'unit_price': Decimal('0'),
                 'description': 'Монопаллета 1/2/3 артикула до 200 кг'
@@ -68,6 +82,8 @@ class Command(BaseCommand):
                 'name': 'Монопаллета 1/2/3 арт. 200-300кг',
                 'pricing_type': 'pallet',
                 'specification': '200-300 кг',
+                'tier_basis': 'weight',
+                'tier_from': Decimal('200'),
                 'base_price': Decimal('4000'),
                 'unit_price': Decimal('0'),
                 'description': 'Монопаллета 1/2/3 артикула 200-300 кг'
@@ -76,6 +92,8 @@ class Command(BaseCommand):
                 'name': 'Монопаллета 1/2/3 арт. 300-400кг',
                 'pricing_type': 'pallet',
                 'specification': '300-400 кг',
+                'tier_basis': 'weight',
+                'tier_from': Decimal('300'),
                 'base_price': Decimal('4500'),
                 'unit_price': Decimal('0'),
                 'description': 'Монопаллета 1/2/3 артикула 300-400 кг'
@@ -84,6 +102,8 @@ class Command(BaseCommand):
                 'name': 'Монопаллета 1/2/3 арт. 400-500кг',
                 'pricing_type': 'pallet',
                 'specification': '400-500 кг',
+                'tier_basis': 'weight',
+                'tier_from': Decimal('400'),
                 'base_price': Decimal('5000'),
                 'unit_price': Decimal('0'),
                 'description': 'Монопаллета 1/2/3 артикула 400-500 кг'
@@ -92,6 +112,9 @@ class Command(BaseCommand):
                 'name': 'Монопаллета 1/2/3 арт. более 500кг',
                 'pricing_type': 'pallet',
                 'specification': 'Другой вес',
+                'tier_basis': 'weight',
+                'tier_from': Decimal('500'),
+                'step_size': Decimal('100'),
                 'base_price': Decimal('5000'),
                 'unit_price': Decimal('1000'),  # За каждые дополнительные 100кг
                 'description': 'Монопаллета 1/2/3 артикула более 500 кг, +1000 руб. за каждые 100 кг'
@@ -102,16 +125,18 @@ class Command(BaseCommand):
         pickup_services = [
             {
                 'name': 'Забор груза по городу (1-10 коробок)',
-                'pricing_type': 'additional',
-                'specification': 'pickup_city_small',
+                'pricing_type': 'pickup',
+                'tier_basis': 'boxes',
+                'tier_from': Decimal('1'),
                 'base_price': Decimal('500'),
                 'unit_price': Decimal('0'),
                 'description': 'Забор груза по городу от 1 до 10 коробок'
             },
             {
                 'name': 'Забор груза по городу (11+ коробок)',
-                'pricing_type': 'additional',
-                'specification': 'pickup_city_large',
+                'pricing_type': 'pickup',
+                'tier_basis': 'boxes',
+                'tier_from': Decimal('11'),
                 'base_price': Decimal('1000'),
                 'unit_price': Decimal('0'),
                 'description': 'Забор груза по городу 11 и более коробок'
@@ -151,6 +176,8 @@ class Command(BaseCommand):
         ]
 
         # Дополнительные услуги - Паллетирование и грузчики
+        # Грузчики и забор груза по городу - ступени по количеству коробок,
+        # ступень выбирается при расчете автоматически (AdditionalService.tiered)
         additional_services = [
             {
                 'name': 'Паллетирование (1 паллет до 1 куба)',
@@ -170,32 +197,36 @@ class Command(BaseCommand):
             },
             {
                 'name': 'Услуги грузчика (до 20 коробок)',
-                'pricing_type': 'additional',
-                'specification': 'loader_20',
+                'pricing_type': 'loader',
+                'tier_basis': 'boxes',
+                'tier_from': Decimal('1'),
                 'base_price': Decimal('500'),
                 'unit_price': Decimal('0'),
                 'description': 'Услуги грузчика для перемещения до 20 коробок'
             },
             {
                 'name': 'Услуги грузчика (21-40 коробок)',
-                'pricing_type': 'additional',
-                'specification': 'loader_40',
+                'pricing_type': 'loader',
+                'tier_basis': 'boxes',
+                'tier_from': Decimal('21'),
                 'base_price': Decimal('1000'),
                 'unit_price': Decimal('0'),
                 'description': 'Услуги грузчика для перемещения от 21 до 40 коробок'
             },
             {
                 'name': 'Услуги грузчика (41-60 коробок)',
-                'pricing_type': 'additional',
-                'specification': 'loader_60',
+                'pricing_type': 'loader',
+                'tier_basis': 'boxes',
+                'tier_from': Decimal('41'),
                 'base_price': Decimal('1500'),
                 'unit_price': Decimal('0'),
                 'description': 'Услуги грузчика для перемещения от 41 до 60 коробок'
             },
             {
                 'name': 'Услуги грузчика (61+ коробок)',
-                'pricing_type': 'additional',
-                'specification': 'loader_61plus',
+                'pricing_type': 'loader',
+                'tier_basis': 'boxes',
+                'tier_from': Decimal('61'),
                 'base_price': Decimal('2000'),
                 'unit_price': Decimal('0'),
                 'description': 'Услуги грузчика для перемещения от 61 и более коробок'
@@ -205,23 +236,29 @@ class Command(BaseCommand):
         # Объединяем все цены
         all_pricing_data = box_prices + pallet_prices + pickup_services + additional_services
 
-        # Создаем объекты в базе данных
-        for price_data in all_pricing_data:
-            Pricing.objects.create(**price_data)
-            self.stdout.write(f"Добавлен тариф: {price_data['name']}")
-
         # Добавляем цены доставки для каждого склада
         # Предполагаем, что базовая цена доставки 2000 руб для любого склада
-        warehouses = Warehouse.objects.all()
-        for warehouse in warehouses:
-            Pricing.objects.create(
-                name=f'Доставка на склад {warehouse.name}',
-                pricing_type='delivery',
-                warehouse=warehouse,
-                base_price=Decimal('2000'),
-                unit_price=Decimal('0'),
-                description=f'Базовая стоимость доставки на склад {warehouse.name}'
-            )
-            self.stdout.write(f"Добавлен тариф доставки для склада: {warehouse.name}")
+        for warehouse in Warehouse.objects.all():
+            all_pricing_data.append({
+                'name': f'Доставка на склад {warehouse.name}',
+                'pricing_type': 'delivery',
+                'warehouse': warehouse,
+                'base_price': Decimal('2000'),
+                'unit_price': Decimal('0'),
+                'description': f'Базовая стоимость доставки на склад {warehouse.name}'
+            })
 
-        self.stdout.write(self.style.SUCCESS('Успешно загружены все тарифы')) 
\ No newline at end of file
+        # Новый прайс-лист добавляется, а действующий закрывается в той же транзакции:
+        # калькулятор в любой момент видит ровно один полный набор тарифов
+        with transaction.atomic():
+            closed = Pricing.objects.filter(valid_from__lt=valid_from).filter(
+                Q(valid_to__isnull=True) | Q(valid_to__gt=valid_from)
+            ).update(valid_to=valid_from)
+            Pricing.objects.bulk_create([Pricing(**price_data, valid_from=valid_from) for price_data in all_pricing_data])
+            bump_tariff_version()
+
+        for price_data in all_pricing_data:
+            self.stdout.write(f"Добавлен тариф: {price_data['name']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Прайс-лист опубликован с {timezone.localtime(valid_from):%d.%m.%Y %H:%M}, закрыто прежних тарифов: {closed}'
+        )) 
\ No newline at end of file
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.intake import INTAKE_BATCH_SIZE, MAX_ATTEMPTS, REQUEUE_AFTER, process_batch, requeue_stale
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь заявок на заказ (асинхронный прием заказов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=INTAKE_BATCH_SIZE, help='Заявок за один проход')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='Попыток обработки заявки до статуса failed')
+        parser.add_argument('--requeue-after', type=int, default=REQUEUE_AFTER,
+                            help='Через сколько секунд вернуть в очередь зависшую заявку')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Пауза при пустой очереди, сек')
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        total_created = total_failed = 0
+
+        while True:
+            requeued = requeue_stale(options['requeue_after'])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Возвращено в очередь зависших заявок: {requeued}'))
+
+            created, failed = process_batch(batch_size, options['max_attempts'])
+            total_created += created
+            total_failed += failed
+            if created or failed:
+                self.stdout.write(f'Создано заказов: {created}, ошибок: {failed}')
+
+            if created + failed < batch_size:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Очередь обработана. Создано заказов: {total_created}, ошибок: {total_failed}'
+        ))
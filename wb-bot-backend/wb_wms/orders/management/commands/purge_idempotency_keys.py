@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Удаляет ключи идемпотентности старше IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'Удалено ключей идемпотентности: {deleted}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders.order_stats import REBUILD_BATCH_SIZE, rebuild_order_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводку заказов по дням (OrderDailyStats) по всем заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help='Строк сводки в одном INSERT')
+
+    def handle(self, *args, **options):
+        count = rebuild_order_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Сводка пересобрана: {count} строк'))
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import Warehouse
+from orders.repricing import build_draft_book, reprice_orders
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает исторические заказы по черновику тарифов и показывает изменение выручки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('draft', help='JSON-файл с изменениями тарифов (pricing / services)')
+        parser.add_argument('--json', action='store_true', help='Вывести отчет в формате JSON')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Размер пачки при чтении заказов')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['draft'], encoding='utf-8') as draft_file:
+                draft = json.load(draft_file)
+        except (OSError, json.JSONDecodeError) as e:
+            raise CommandError(f'Не удалось прочитать черновик тарифов: {e}')
+
+        try:
+            draft_book = build_draft_book(draft)
+        except (TypeError, ValueError, ArithmeticError) as e:
+            raise CommandError(f'Некорректный черновик тарифов: {e}')
+
+        report = reprice_orders(draft_book, chunk_size=options['chunk_size'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report.as_dict(), ensure_ascii=False, indent=2))
+            return
+
+        warehouses = {w.id: str(w) for w in Warehouse.objects.select_related('marketplace')}
+        titles = {'warehouse': 'По складам', 'cargo_type': 'По типу груза', 'month': 'По месяцам'}
+
+        for grouping, title in titles.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            for key, count, current, draft_total, delta in report.rows(grouping):
+                label = warehouses.get(key, key) if grouping == 'warehouse' else key
+                self.stdout.write(f'  {label}: заказов {count}, было {current} ₽, станет {draft_total} ₽, разница {delta:+} ₽')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего заказов: {report.orders}, было {report.current} ₽, станет {report.draft} ₽, разница {report.delta:+} ₽'
+        ))
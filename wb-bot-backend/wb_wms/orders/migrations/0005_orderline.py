@@ -0,0 +1,109 @@
+# Generated by Django 4.2 on 2026-10-18 22:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_additionalservice_order_pickup_address_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderLine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("delivery", "Доставка"),
+                            ("box", "Коробки"),
+                            ("pallet", "Паллеты"),
+                            ("service", "Дополнительная услуга"),
+                        ],
+                        max_length=20,
+                        verbose_name="Вид",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Название"
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(default=1, verbose_name="Количество"),
+                ),
+                (
+                    "base_price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=10,
+                        verbose_name="Базовая цена",
+                    ),
+                ),
+                (
+                    "unit_price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=10,
+                        verbose_name="Цена за единицу",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=10, verbose_name="Сумма"
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lines",
+                        to="orders.order",
+                        verbose_name="Заказ",
+                    ),
+                ),
+                (
+                    "pricing",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="orders.pricing",
+                        verbose_name="Тариф",
+                    ),
+                ),
+                (
+                    "service",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="orders.additionalservice",
+                        verbose_name="Дополнительная услуга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Строка заказа",
+                "verbose_name_plural": "Строки заказа",
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_orderline"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="additionalservice",
+            name="tiered",
+            field=models.BooleanField(
+                default=False,
+                help_text="Стоимость берется из ступенчатых тарифов того же типа",
+                verbose_name="Цена по ступеням тарифов",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pricing",
+            name="step_size",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Цена за единицу начисляется за каждый начатый шаг сверх границы ступени",
+                max_digits=10,
+                null=True,
+                verbose_name="Шаг надбавки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pricing",
+            name="tier_basis",
+            field=models.CharField(
+                blank=True,
+                choices=[("boxes", "Количество коробок"), ("weight", "Вес, кг")],
+                max_length=20,
+                null=True,
+                verbose_name="Основание ступени",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pricing",
+            name="tier_from",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                max_digits=10,
+                null=True,
+                verbose_name="Ступень от",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-18 23:52
+
+from django.db import migrations, models
+import datetime
+import django.utils.timezone
+
+# Существующие тарифы считаются действующими для всей истории заказов
+HISTORY_START = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def backdate_existing_rates(apps, schema_editor):
+    for model_name in ("Pricing", "AdditionalService"):
+        apps.get_model("orders", model_name).objects.update(valid_from=HISTORY_START)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_pricing_tiers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="additionalservice",
+            name="valid_from",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Действует с"
+            ),
+        ),
+        migrations.AddField(
+            model_name="additionalservice",
+            name="valid_to",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Действует до"
+            ),
+        ),
+        migrations.AddField(
+            model_name="pricing",
+            name="valid_from",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Действует с"
+            ),
+        ),
+        migrations.AddField(
+            model_name="pricing",
+            name="valid_to",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Действует до"
+            ),
+        ),
+        migrations.RunPython(backdate_existing_rates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="additionalservice",
+            index=models.Index(
+                fields=["valid_to", "valid_from"], name="orders_service_validity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pricing",
+            index=models.Index(
+                fields=["valid_to", "valid_from"], name="orders_pricing_validity_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,142 @@
+# Generated by Django 4.2 on 2026-10-19 00:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0007_tariff_validity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="orders",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Клиент",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ClientRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "company",
+                    models.CharField(
+                        blank=True,
+                        help_text="Цена для всех клиентов компании (если клиент не указан)",
+                        max_length=255,
+                        null=True,
+                        verbose_name="Компания",
+                    ),
+                ),
+                (
+                    "pricing_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("box", "Коробка"),
+                            ("pallet", "Паллета"),
+                            ("delivery", "Доставка"),
+                            ("pickup", "Забор груза"),
+                            ("palletizing", "Паллетирование"),
+                            ("loader", "Услуги грузчика"),
+                            ("other", "Другое"),
+                        ],
+                        max_length=50,
+                        null=True,
+                        verbose_name="Тип тарифа",
+                    ),
+                ),
+                (
+                    "specification",
+                    models.CharField(
+                        blank=True,
+                        max_length=100,
+                        null=True,
+                        verbose_name="Спецификация",
+                    ),
+                ),
+                (
+                    "base_price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=10,
+                        verbose_name="Базовая цена",
+                    ),
+                ),
+                (
+                    "unit_price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=10,
+                        verbose_name="Цена за единицу",
+                    ),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(default=True, verbose_name="Активен"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "service",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="orders.additionalservice",
+                        verbose_name="Дополнительная услуга",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rates",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Клиент",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="orders.warehouse",
+                        verbose_name="Склад",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Индивидуальный тариф",
+                "verbose_name_plural": "Индивидуальные тарифы",
+                "ordering": ["user", "company", "pricing_type", "service"],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2 on 2026-10-19 00:48
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0008_client_rates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, verbose_name="Ключ")),
+                ("endpoint", models.CharField(max_length=100, verbose_name="Эндпоинт")),
+                (
+                    "request_hash",
+                    models.CharField(max_length=64, verbose_name="Хеш запроса"),
+                ),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        blank=True, null=True, verbose_name="Код ответа"
+                    ),
+                ),
+                (
+                    "response",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                        verbose_name="Ответ",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="Дата создания",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ключ идемпотентности",
+                "verbose_name_plural": "Ключи идемпотентности",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="idempotencykey",
+            constraint=models.UniqueConstraint(
+                fields=("key", "endpoint"), name="orders_idempotency_key_unique"
+            ),
+        ),
+    ]
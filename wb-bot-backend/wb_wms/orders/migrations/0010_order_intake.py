@@ -0,0 +1,112 @@
+# Generated by Django 4.2 on 2026-10-19 01:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0009_idempotency_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderIntake",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("payload", models.JSONField(verbose_name="Данные формы")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "В очереди"),
+                            ("processing", "Обрабатывается"),
+                            ("done", "Заказ создан"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Попыток обработки"
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(blank=True, null=True, verbose_name="Ошибка"),
+                ),
+                (
+                    "claimed_by",
+                    models.CharField(
+                        blank=True, max_length=32, null=True, verbose_name="Обработчик"
+                    ),
+                ),
+                (
+                    "claimed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Взята в обработку"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата обработки"
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="orders.order",
+                        verbose_name="Заказ",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Клиент",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заявка на заказ",
+                "verbose_name_plural": "Очередь заявок на заказ",
+                "ordering": ["created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="orderintake",
+            index=models.Index(
+                fields=["status", "created_at"], name="orders_intake_queue_idx"
+            ),
+        ),
+    ]
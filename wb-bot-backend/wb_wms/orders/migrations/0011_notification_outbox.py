@@ -0,0 +1,109 @@
+# Generated by Django 4.2 on 2026-10-19 09:15
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0010_order_intake"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "payload",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        verbose_name="Данные уведомления",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает отправки"),
+                            ("sent", "Отправлено"),
+                            ("failed", "Не доставлено"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Попыток отправки"
+                    ),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Следующая попытка",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Последняя ошибка"
+                    ),
+                ),
+                (
+                    "claimed_by",
+                    models.CharField(
+                        blank=True, max_length=32, null=True, verbose_name="Обработчик"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата отправки"
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="orders.order",
+                        verbose_name="Заказ",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Уведомление",
+                "verbose_name_plural": "Исходящие уведомления",
+                "ordering": ["created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="notificationoutbox",
+            index=models.Index(
+                fields=["status", "next_attempt_at"], name="orders_outbox_due_idx"
+            ),
+        ),
+    ]
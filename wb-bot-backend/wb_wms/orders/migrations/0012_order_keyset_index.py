@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-19 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0011_notification_outbox"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="orders_order_keyset_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0012_order_keyset_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["status", "-created_at"], name="orders_order_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["warehouse", "-created_at"], name="orders_order_warehouse_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("telegram_user_id__isnull", False)),
+                fields=["telegram_user_id"],
+                name="orders_order_telegram_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pricing",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["pricing_type", "specification"],
+                name="orders_pricing_spec_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pricing",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["pricing_type", "warehouse"],
+                name="orders_pricing_warehouse_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0013_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["cargo_type", "-created_at"], name="orders_order_cargo_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["phone_number"], name="orders_order_phone_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["total_price", "id"], name="orders_order_price_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-19 14:40
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from orders.search import create_search_index
+
+    create_search_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from orders.search import drop_search_index
+
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0014_order_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 15:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0015_order_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="additionalservice",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата изменения",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2 on 2026-10-19 15:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    from orders.order_stats import rebuild_order_stats
+
+    rebuild_order_stats(
+        apps.get_model("orders", "Order"), apps.get_model("orders", "OrderDailyStats")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0016_additionalservice_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("new", "Новый"),
+                            ("processing", "В обработке"),
+                            ("completed", "Выполнен"),
+                            ("canceled", "Отменен"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус заказа",
+                    ),
+                ),
+                (
+                    "cargo_type",
+                    models.CharField(max_length=50, verbose_name="Тип груза"),
+                ),
+                ("order_count", models.IntegerField(default=0, verbose_name="Заказов")),
+                ("box_count", models.IntegerField(default=0, verbose_name="Коробок")),
+                ("pallet_count", models.IntegerField(default=0, verbose_name="Паллет")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Выручка",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="orders.warehouse",
+                        verbose_name="Склад",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика заказов за день",
+                "verbose_name_plural": "Статистика заказов по дням",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="orderdailystats",
+            constraint=models.UniqueConstraint(
+                fields=("date", "warehouse", "status", "cargo_type"),
+                name="orders_daily_stats_key",
+            ),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0017_order_daily_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=50, unique=True, verbose_name="Данные"),
+                ),
+                ("version", models.CharField(max_length=32, verbose_name="Версия")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+                ),
+            ],
+            options={
+                "verbose_name": "Версия данных",
+                "verbose_name_plural": "Версии данных",
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0018_data_version"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="idempotencykey",
+            name="orders_idempotency_key_unique",
+        ),
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="client",
+            field=models.CharField(
+                blank=True, default="", max_length=100, verbose_name="Клиент"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="idempotencykey",
+            constraint=models.UniqueConstraint(
+                fields=("key", "endpoint", "client"),
+                name="orders_idempotency_key_unique",
+            ),
+        ),
+    ]
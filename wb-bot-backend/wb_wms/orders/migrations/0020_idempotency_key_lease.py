@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-19 16:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0019_idempotency_key_client"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="claimed_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Взят в обработку"
+            ),
+        ),
+    ]
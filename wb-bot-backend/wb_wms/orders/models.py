@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+import copy
 import uuid
 
 STATUS = [
@@ -79,6 +81,13 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+# Поля заказа, от которых зависит стоимость (услуги M2M см. в signals.py)
+PRICING_FIELDS = frozenset([
+    'warehouse', 'warehouse_id', 'cargo_type', 'container_type',
+    'box_count', 'pallet_count', 'weight', 'additional_services', 'user', 'user_id',
+])
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('new', 'Новый'),
@@ -111,6 +120,9 @@ class Order(models.Model):
     # Поле status_updated_at используется вместо updated_at
     status_updated_at = None
     
+    # Стоимость уже рассчитана (например, по подписанному токену расчета) - не пересчитывать
+    skip_pricing = False
+    
     # Информация о доставке
     warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT, verbose_name='Склад доставки')
     
@@ -140,97 +152,183 @@ class Order(models.Model):
     
     # Ссылка на пользователя Telegram (если заказ создан через бота)
     telegram_user_id = models.BigIntegerField(blank=True, null=True, verbose_name='ID пользователя Telegram')
+    # Авторизованный клиент: по нему применяются индивидуальные тарифы (ClientRate)
+    user = models.ForeignKey('User', on_delete=models.SET_NULL, blank=True, null=True, related_name='orders',
+                             verbose_name='Клиент')
     
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # Постраничная выдача списка заказов по ключу (orders.pagination.KeysetPagination)
+            models.Index(fields=['-created_at', '-id'], name='orders_order_keyset_idx'),
+            # Фильтры экранов заказов: статус / склад, новые сверху
+            models.Index(fields=['status', '-created_at'], name='orders_order_status_idx'),
+            models.Index(fields=['warehouse', '-created_at'], name='orders_order_warehouse_idx'),
+            models.Index(fields=['cargo_type', '-created_at'], name='orders_order_cargo_idx'),
+            models.Index(fields=['phone_number'], name='orders_order_phone_idx'),
+            # Сортировка списка по стоимости (orders.order_filters.ORDER_SORTS)
+            models.Index(fields=['total_price', 'id'], name='orders_order_price_idx'),
+            # Заказы клиента из Telegram-бота; у большинства заказов поле пустое
+            models.Index(fields=['telegram_user_id'], name='orders_order_telegram_idx',
+                         condition=models.Q(telegram_user_id__isnull=False)),
+        ]
     
     def __str__(self):
         return f'Заказ №{self.id} - {self.client_name}'
 
+    def calculate_quote(self, book=None):
+        """
+        Рассчитывает стоимость заказа на основе тарифов (со строками расчета).
+
+        По умолчанию используются действующие тарифы; для расчета по тарифам
+        другого момента времени передается справочник (см. historical_quote).
+        Для заказа клиента учитываются его индивидуальные тарифы.
+        """
+        from .pricing import get_price_book, order_quote_request
+
+        book = book or get_price_book()
+
+        # Услуги из связи ManyToMany (у нового заказа их еще нет)
+        service_ids = [] if self._state.adding else list(
+            Order.services.through.objects.filter(order_id=self.pk).values_list('additionalservice_id', flat=True)
+        )
+
+        request = order_quote_request(
+            self.warehouse_id, self.cargo_type, self.container_type,
+            self.box_count, self.pallet_count,
+            # Старое поле additional_services и новая связь с AdditionalService
+            tuple(self.additional_services or []) + tuple(service_ids),
+            weight=self.weight,
+            client=book.client_for(self.user) if self.user_id else None,
+        )
+        return book.quote(request)
+
+    def historical_quote(self):
+        """Стоимость заказа по тарифам, действовавшим на момент его создания"""
+        from .pricing import price_book_at
+
+        return self.calculate_quote(book=price_book_at(self.created_at))
+
     def calculate_price(self):
         """
         Рассчитывает стоимость заказа на основе тарифов
         """
-        total_price = 0
-        
-        # Расчет стоимости доставки
-        if hasattr(self, 'warehouse') and self.warehouse:
-            delivery_pricing = Pricing.objects.filter(
-                pricing_type='delivery',
-                warehouse=self.warehouse
-            ).first()
-            
-            if delivery_pricing:
-                total_price += delivery_pricing.base_price
-        
-        # Расчет стоимости груза в зависимости от типа (коробки или паллеты)
-        if self.cargo_type == 'box' and self.box_count:
-            box_pricing = Pricing.objects.filter(
-                pricing_type='box',
-                specification=self.container_type
-            ).first()
-            
-            if box_pricing:
-                total_price += (box_pricing.base_price + (box_pricing.unit_price * self.box_count))
-                
-        elif self.cargo_type == 'pallet' and self.pallet_count:
-            pallet_pricing = Pricing.objects.filter(
-                pricing_type='pallet',
-                specification=self.container_type
-            ).first()
-            
-            if pallet_pricing:
-                total_price += (pallet_pricing.base_price + (pallet_pricing.unit_price * self.pallet_count))
-        
-        # Расчет стоимости дополнительных услуг (из старого поля additional_services)
-        if self.additional_services:
-            for service_id in self.additional_services:
-                pricing_type = service_id.split('_')[0] if isinstance(service_id, str) and '_' in service_id else None
-                
-                if isinstance(service_id, int) or (isinstance(service_id, str) and service_id.isdigit()):
-                    # Если ID числовой, ищем по ID
-                    service_id = int(service_id)
-                    service_pricing = Pricing.objects.filter(id=service_id).first()
-                    if service_pricing:
-                        total_price += service_pricing.base_price
-                elif pricing_type:
-                    # Если ID в формате "тип_спецификация", ищем по этим полям
-                    service_pricing = Pricing.objects.filter(
-                        pricing_type=pricing_type,
-                        specification=service_id.split('_', 1)[1]
-                    ).first()
-                    
-                    if service_pricing:
-                        total_price += service_pricing.base_price
-        
-        # Расчет стоимости по новой связи ManyToMany с AdditionalService
-        if hasattr(self, 'services'):
-            for service in self.services.filter(is_active=True):
-                total_price += service.price
-        
-        return total_price
+        return self.calculate_quote().total
+
+    def stored_quote(self):
+        """Расчет из сохраненных строк заказа (без обращения к тарифам)"""
+        from .pricing import Quote
+        return Quote([line.as_quote_line() for line in self.lines.all()], None)
+
+    def save_lines(self, quote, replace=True):
+        """Сохраняет строки расчета заказа (по умолчанию заменяя прежние)"""
+        if replace:
+            self.lines.all().delete()
+        OrderLine.objects.bulk_create([OrderLine.from_quote_line(self, line) for line in quote.lines])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def _remember_loaded_values(self):
+        # Запоминаем значения полей, чтобы при сохранении записывать только измененные
+        self._loaded_values = {
+            field.attname: copy.deepcopy(self.__dict__[field.attname])
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def get_dirty_fields(self):
+        """
+        Имена полей, измененных после загрузки заказа из БД
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and self.__dict__.get(field.attname) != loaded[field.attname]
+        ]
+
+    def update_price(self):
+        """Пересчитывает стоимость, записывает поле total_price и строки расчета"""
+        from .order_stats import record_order_change, saved_stats_values, stored_stats_values
+
+        quote = self.calculate_quote()
+        self.total_price = quote.total
+        with transaction.atomic():
+            before = stored_stats_values(self)
+            super().save(update_fields=['total_price'])
+            record_order_change(before, saved_stats_values(self, before, ['total_price']))
+        self.save_lines(quote)
+        self._remember_loaded_values()
 
     def save(self, *args, **kwargs):
-        # При сохранении заказа автоматически рассчитываем стоимость
-        # При создании может возникнуть ошибка, если еще нет ID
-        try:
-            self.total_price = self.calculate_price()
-        except Exception as e:
-            import traceback
-            print(f"Error calculating price: {e}")
-            print(traceback.format_exc())
-            # Если не удалось рассчитать стоимость, используем 0
-            self.total_price = 0
-            
+        update_fields = kwargs.get('update_fields')
+
+        # Существующий заказ: записываем только измененные поля
+        if not self._state.adding and update_fields is None and not args and not kwargs.get('force_insert'):
+            update_fields = self.get_dirty_fields()
+            if not update_fields:
+                return
+
+        # Стоимость пересчитываем только при изменении влияющих на нее полей
+        adding = self._state.adding
+        quote = None
+        needs_pricing = adding or update_fields is None or PRICING_FIELDS.intersection(update_fields)
+        if needs_pricing and not self.skip_pricing:
+            try:
+                quote = self.calculate_quote()
+                self.total_price = quote.total
+            except Exception as e:
+                import traceback
+                print(f"Error calculating price: {e}")
+                print(traceback.format_exc())
+                # Если не удалось рассчитать стоимость, используем 0
+                self.total_price = 0
+            if update_fields is not None:
+                update_fields = set(update_fields) | {'total_price'}
+
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+
+        from .order_stats import record_order_change, saved_stats_values, stored_stats_values, touches_stats
+
         try:
-            super().save(*args, **kwargs)
+            if not touches_stats(self, update_fields):
+                # Поля сводки не меняются - только UPDATE заказа
+                super().save(*args, **kwargs)
+            else:
+                # Сводка по дням (OrderDailyStats) обновляется в той же транзакции
+                with transaction.atomic():
+                    before = stored_stats_values(self)
+                    super().save(*args, **kwargs)
+                    record_order_change(before, saved_stats_values(self, before, update_fields))
         except Exception as e:
             import traceback
             print(f"Error saving order: {e}")
             print(traceback.format_exc())
             raise
+        if quote is not None:
+            self.save_lines(quote, replace=not adding)
+        self._remember_loaded_values()
+
+class EffectiveDatedQuerySet(models.QuerySet):
+    """
+    Тарифы с периодом действия [valid_from, valid_to)
+    """
+
+    def effective_at(self, at=None):
+        """Активные записи, действующие в момент at (по умолчанию - сейчас)"""
+        at = at or timezone.now()
+        return self.filter(is_active=True, valid_from__lte=at).filter(
+            models.Q(valid_to__isnull=True) | models.Q(valid_to__gt=at)
+        )
+
 
 class Pricing(models.Model):
     PRICING_TYPES = (
@@ -242,6 +340,11 @@ class Pricing(models.Model):
         ('loader', 'Услуги грузчика'),
         ('other', 'Другое'),
     )
+
+    TIER_BASES = (
+        ('boxes', 'Количество коробок'),
+        ('weight', 'Вес, кг'),
+    )
     
     name = models.CharField(max_length=255, verbose_name='Название')
     pricing_type = models.CharField(max_length=50, choices=PRICING_TYPES, verbose_name='Тип тарифа')
@@ -250,11 +353,32 @@ class Pricing(models.Model):
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Цена за единицу')
     description = models.TextField(blank=True, null=True, verbose_name='Описание')
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, blank=True, null=True, verbose_name='Склад')
+    # Ступенчатый тариф: действует от tier_from до границы следующей ступени
+    tier_basis = models.CharField(max_length=20, choices=TIER_BASES, blank=True, null=True,
+                                  verbose_name='Основание ступени')
+    tier_from = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                    verbose_name='Ступень от')
+    step_size = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                    verbose_name='Шаг надбавки',
+                                    help_text='Цена за единицу начисляется за каждый начатый шаг сверх границы ступени')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
+    # Новый прайс-лист добавляется новыми строками, старые закрываются valid_to
+    valid_from = models.DateTimeField(default=timezone.now, verbose_name='Действует с')
+    valid_to = models.DateTimeField(blank=True, null=True, verbose_name='Действует до')
+
+    objects = EffectiveDatedQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Тариф'
         verbose_name_plural = 'Тарифы'
+        indexes = [
+            models.Index(fields=['valid_to', 'valid_from'], name='orders_pricing_validity_idx'),
+            # Поиск тарифа: по спецификации груза или по складу, только среди активных
+            models.Index(fields=['pricing_type', 'specification'], name='orders_pricing_spec_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['pricing_type', 'warehouse'], name='orders_pricing_warehouse_idx',
+                         condition=models.Q(is_active=True)),
+        ]
         
     def __str__(self):
         if self.warehouse:
@@ -277,16 +401,291 @@ class AdditionalService(models.Model):
     service_type = models.CharField(max_length=50, choices=SERVICE_TYPES, blank=True, null=True, 
                                   verbose_name='Тип услуги')
     requires_location = models.BooleanField(default=False, verbose_name='Требует адрес')
+    tiered = models.BooleanField(default=False, verbose_name='Цена по ступеням тарифов',
+                                 help_text='Стоимость берется из ступенчатых тарифов того же типа')
     description = models.TextField(blank=True, null=True, verbose_name='Описание')
     is_active = models.BooleanField(default=True, verbose_name='Активна')
+    valid_from = models.DateTimeField(default=timezone.now, verbose_name='Действует с')
+    valid_to = models.DateTimeField(blank=True, null=True, verbose_name='Действует до')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    objects = EffectiveDatedQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Дополнительная услуга'
         verbose_name_plural = 'Дополнительные услуги'
         ordering = ['service_type', 'name']
+        indexes = [
+            models.Index(fields=['valid_to', 'valid_from'], name='orders_service_validity_idx'),
+        ]
     
     def __str__(self):
         return f'{self.name} ({self.get_service_type_display() if self.service_type else "Без типа"})'
 
 
+class ClientRate(models.Model):
+    """
+    Индивидуальная цена клиента (пользователя или компании).
+
+    Перекрывает тариф с тем же ключом (тип, спецификация, склад) или цену
+    дополнительной услуги. Ключ, а не ссылка на Pricing, сохраняется при
+    публикации нового прайс-листа.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name='rates',
+                             verbose_name='Клиент')
+    company = models.CharField(max_length=255, blank=True, null=True, verbose_name='Компания',
+                               help_text='Цена для всех клиентов компании (если клиент не указан)')
+    pricing_type = models.CharField(max_length=50, choices=Pricing.PRICING_TYPES, blank=True, null=True,
+                                    verbose_name='Тип тарифа')
+    specification = models.CharField(max_length=100, blank=True, null=True, verbose_name='Спецификация')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, blank=True, null=True, verbose_name='Склад')
+    service = models.ForeignKey(AdditionalService, on_delete=models.CASCADE, blank=True, null=True,
+                                verbose_name='Дополнительная услуга')
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Базовая цена')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Цена за единицу')
+    is_active = models.BooleanField(default=True, verbose_name='Активен')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Индивидуальный тариф'
+        verbose_name_plural = 'Индивидуальные тарифы'
+        ordering = ['user', 'company', 'pricing_type', 'service']
+
+    def __str__(self):
+        client = self.user or self.company
+        if self.service_id:
+            return f'{client}: {self.service.name}'
+        return f'{client}: {self.get_pricing_type_display()} {self.specification or ""}'.rstrip()
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        if bool(self.user_id) == bool(self.company):
+            raise ValidationError('Укажите либо клиента, либо компанию')
+        if bool(self.service_id) == bool(self.pricing_type):
+            raise ValidationError('Укажите либо тип тарифа, либо дополнительную услугу')
+
+
+class OrderLineQuerySet(models.QuerySet):
+    def revenue_by_service(self):
+        """Выручка по дополнительным услугам (один GROUP BY)"""
+        return (
+            self.filter(kind='service')
+            .values('service_id', 'pricing_id', 'name')
+            .annotate(orders=models.Count('order', distinct=True), revenue=models.Sum('total'))
+            .order_by('-revenue')
+        )
+
+
+class OrderLine(models.Model):
+    """
+    Строка расчета стоимости заказа, сохраняется при создании заказа
+    """
+    KINDS = (
+        ('delivery', 'Доставка'),
+        ('box', 'Коробки'),
+        ('pallet', 'Паллеты'),
+        ('service', 'Дополнительная услуга'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines', verbose_name='Заказ')
+    kind = models.CharField(max_length=20, choices=KINDS, verbose_name='Вид')
+    pricing = models.ForeignKey(Pricing, on_delete=models.SET_NULL, blank=True, null=True, verbose_name='Тариф')
+    service = models.ForeignKey(AdditionalService, on_delete=models.SET_NULL, blank=True, null=True,
+                                verbose_name='Дополнительная услуга')
+    name = models.CharField(max_length=255, blank=True, verbose_name='Название')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Базовая цена')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Цена за единицу')
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Сумма')
+
+    objects = OrderLineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Строка заказа'
+        verbose_name_plural = 'Строки заказа'
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.get_kind_display()}: {self.name} x{self.quantity} = {self.total}'
+
+    @classmethod
+    def from_quote_line(cls, order, line):
+        return cls(
+            order=order,
+            kind=line.kind,
+            pricing_id=line.pricing_id,
+            service_id=line.service_id,
+            name=line.name,
+            quantity=line.quantity,
+            base_price=line.base_price,
+            unit_price=line.unit_price,
+            total=line.total,
+        )
+
+    def as_quote_line(self):
+        from .pricing import QuoteLine
+        return QuoteLine(
+            self.kind, self.pricing_id, self.service_id, self.name, self.quantity,
+            self.base_price, self.unit_price, self.total,
+        )
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ идемпотентности запроса создания заказа и сохраненный ответ.
+
+    Пока ответ не сохранен (status_code пуст), запрос считается выполняющимся.
+    """
+    key = models.CharField(max_length=255, verbose_name='Ключ')
+    endpoint = models.CharField(max_length=100, verbose_name='Эндпоинт')
+    # Ключи разных клиентов не пересекаются (см. orders.idempotency.request_client)
+    client = models.CharField(max_length=100, blank=True, default='', verbose_name='Клиент')
+    request_hash = models.CharField(max_length=64, verbose_name='Хеш запроса')
+    # Когда запрос взял ключ в обработку; без ответа дольше IDEMPOTENCY_KEY_LEASE ключ забирает повтор
+    claimed_at = models.DateTimeField(default=timezone.now, verbose_name='Взят в обработку')
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Код ответа')
+    response = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder, verbose_name='Ответ')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'endpoint', 'client'], name='orders_idempotency_key_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.endpoint}: {self.key} ({self.client or "аноним"})'
+
+
+class OrderIntake(models.Model):
+    """
+    Заявка на заказ в очереди асинхронного приема.
+
+    API только проверяет и сохраняет данные формы; заказ создает
+    обработчик очереди (manage.py process_orders).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_DONE, 'Заказ создан'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    payload = models.JSONField(verbose_name='Данные формы')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+                             verbose_name='Клиент')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+                              verbose_name='Заказ')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки')
+    error = models.TextField(blank=True, null=True, verbose_name='Ошибка')
+    claimed_by = models.CharField(max_length=32, blank=True, null=True, verbose_name='Обработчик')
+    claimed_at = models.DateTimeField(blank=True, null=True, verbose_name='Взята в обработку')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата обработки')
+
+    class Meta:
+        verbose_name = 'Заявка на заказ'
+        verbose_name_plural = 'Очередь заявок на заказ'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='orders_intake_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'Заявка {self.id} ({self.get_status_display()})'
+
+
+class NotificationOutbox(models.Model):
+    """
+    Исходящее уведомление Telegram-боту.
+
+    Записывается в той же транзакции, что и заказ; доставляет его
+    отдельный процесс (manage.py dispatch_notifications).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Не доставлено'),
+    )
+
+    payload = models.JSONField(encoder=DjangoJSONEncoder, verbose_name='Данные уведомления')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+                              verbose_name='Заказ')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')
+    claimed_by = models.CharField(max_length=32, blank=True, null=True, verbose_name='Обработчик')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Исходящие уведомления'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='orders_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'Уведомление {self.pk} ({self.get_status_display()})'
+
+
+class DataVersion(models.Model):
+    """
+    Версия набора данных (тарифы, справочники), общая для всех процессов.
+
+    Меняется в той же транзакции, что и сами данные (см. orders.data_versions).
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name='Данные')
+    version = models.CharField(max_length=32, verbose_name='Версия')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+class OrderDailyStats(models.Model):
+    """
+    Сводка заказов по дням: количество, коробки, паллеты и выручка в разрезе
+    (дата создания, склад, статус, тип груза).
+
+    Обновляется приращениями при записи заказа (orders.order_stats), полностью
+    пересобирается командой rebuild_order_stats.
+    """
+    date = models.DateField(verbose_name='Дата')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='daily_stats',
+                                  verbose_name='Склад')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Статус заказа')
+    cargo_type = models.CharField(max_length=50, verbose_name='Тип груза')
+    order_count = models.IntegerField(default=0, verbose_name='Заказов')
+    box_count = models.IntegerField(default=0, verbose_name='Коробок')
+    pallet_count = models.IntegerField(default=0, verbose_name='Паллет')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+
+    class Meta:
+        verbose_name = 'Статистика заказов за день'
+        verbose_name_plural = 'Статистика заказов по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'warehouse', 'status', 'cargo_type'],
+                                    name='orders_daily_stats_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.warehouse_id} {self.status} {self.cargo_type}: {self.order_count}'
@@ -0,0 +1,178 @@
+"""
+Уведомления о новых заказах в Telegram-бот.
+
+Уведомление не отправляется из веб-запроса: enqueue_notification
+записывает его в таблицу NotificationOutbox в той же транзакции, что и
+заказ, а доставляет отдельный процесс (manage.py dispatch_notifications)
+через одну keep-alive сессию с таймаутом, повторами и экспоненциальной
+задержкой между попытками.
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_BATCH_SIZE = 50
+MAX_ATTEMPTS = 8
+# Задержка перед повтором: BACKOFF_BASE * 2^(попытка - 1), не больше BACKOFF_MAX, сек
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+# Через сколько секунд уведомление, взятое упавшим обработчиком, снова доступно для отправки
+CLAIM_TIMEOUT = 300
+
+
+def notification_url():
+    return f"{settings.TELEGRAM_BOT_URL.rstrip('/')}/api/send_notification"
+
+
+def _count(quantities, key):
+    try:
+        return int(quantities.get(key, 0))
+    except (ValueError, TypeError):
+        return 0
+
+
+def build_order_notification(order, request_data, quote=None):
+    """
+    Данные уведомления о заказе: параметры груза и клиента из формы,
+    стоимость - из сохраненных строк заказа
+    """
+    cargo_type_data = request_data.get('cargoType', {})
+    cargo_types = cargo_type_data.get('selectedTypes', [])
+    box_sizes = cargo_type_data.get('selectedBoxSizes', [])
+    pallet_weights = cargo_type_data.get('selectedPalletWeights', [])
+    quantities = cargo_type_data.get('quantities') or {}
+    client_data = request_data.get('clientData', {})
+
+    if quote is None:
+        quote = order.stored_quote()
+    service_names = [line.name for line in quote.lines if line.kind == 'service']
+
+    return {
+        "order_id": str(order.pk),
+        'warehouse_name': str(order.warehouse) if order.warehouse_id else "Не указан",
+        'cargo_type': ', '.join(cargo_types) if cargo_types else "Не указан",
+        'box_size': ', '.join(box_sizes) if box_sizes else "Не указан",
+        'box_count': _count(quantities, 'Коробка'),
+        'pallet_weight': ', '.join(pallet_weights) if pallet_weights else "Не указан",
+        'pallet_count': _count(quantities, 'Паллета'),
+        'company_name': client_data.get('companyName', 'Не указана'),
+        'client_name': client_data.get('clientName', 'Не указан'),
+        'client_email': client_data.get('email', 'Не указан'),
+        'client_phone': client_data.get('phone', 'Не указан'),
+        "telegram_user_id": client_data.get('telegram_user_id'),
+        'cost': str(order.total_price),
+        'delivery_price': str(quote.delivery),
+        'additional_services': ', '.join(service_names),
+        'comments': client_data.get('comments', 'Нет комментариев'),
+        'pickup_address': request_data.get('pickupAddress', '')
+    }
+
+
+def enqueue_notification(notification, order=None):
+    """
+    Ставит уведомление в очередь отправки.
+
+    Вызывается внутри транзакции создания заказа: при откате заказа
+    уведомление тоже не сохранится.
+    """
+    return NotificationOutbox.objects.create(payload=notification, order=order)
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой (с небольшим разбросом, чтобы повторы не шли залпом)"""
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(1, 1.2))
+
+
+class NotificationDispatcher:
+    """
+    Доставляет уведомления из очереди боту.
+
+    Соединения с ботом переиспользуются (одна requests.Session с пулом),
+    каждый запрос ограничен таймаутом. Уведомление забирается в отправку
+    условным UPDATE, поэтому несколько обработчиков не отправят его дважды.
+    """
+
+    def __init__(self, batch_size=DISPATCH_BATCH_SIZE, max_attempts=MAX_ATTEMPTS, timeout=None, session=None):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.timeout = timeout if timeout is not None else settings.NOTIFICATION_TIMEOUT
+        self.url = notification_url()
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def claim_batch(self):
+        """Забирает пачку уведомлений, время отправки которых наступило"""
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        due_ids = list(
+            NotificationOutbox.objects.filter(status=NotificationOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at').values_list('pk', flat=True)[:self.batch_size]
+        )
+        if not due_ids:
+            return []
+        NotificationOutbox.objects.filter(
+            pk__in=due_ids, status=NotificationOutbox.STATUS_PENDING, next_attempt_at__lte=now
+        ).update(claimed_by=token, next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT))
+        return list(NotificationOutbox.objects.filter(claimed_by=token).order_by('created_at'))
+
+    def deliver(self, notification):
+        """Отправляет одно уведомление; возвращает текст ошибки или None"""
+        try:
+            response = self.session.post(self.url, json=notification.payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            return str(e)
+        if response.status_code >= 400:
+            return f'HTTP {response.status_code}: {response.text[:500]}'
+        # Бот сообщает об ошибке отправки в Telegram телом ответа со статусом 200
+        try:
+            body = response.json()
+        except ValueError:
+            return None
+        if isinstance(body, dict) and body.get('status') == 'error':
+            return body.get('message') or 'Bot returned status "error"'
+        return None
+
+    def dispatch_batch(self):
+        """Отправляет одну пачку: (отправлено, ошибок)"""
+        sent_ids = []
+        failed = 0
+        for notification in self.claim_batch():
+            error = self.deliver(notification)
+            if error is None:
+                sent_ids.append(notification.pk)
+                continue
+
+            failed += 1
+            notification.attempts += 1
+            notification.last_error = error
+            notification.claimed_by = None
+            if notification.attempts >= self.max_attempts:
+                notification.status = NotificationOutbox.STATUS_FAILED
+                logger.error(f"Notification {notification.pk} failed after {notification.attempts} attempts: {error}")
+            else:
+                notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+                logger.warning(f"Notification {notification.pk} attempt {notification.attempts} failed: {error}")
+            notification.save(update_fields=['attempts', 'last_error', 'claimed_by', 'status', 'next_attempt_at'])
+
+        if sent_ids:
+            NotificationOutbox.objects.filter(pk__in=sent_ids).update(
+                status=NotificationOutbox.STATUS_SENT, sent_at=timezone.now(), claimed_by=None,
+                attempts=F('attempts') + 1,
+            )
+        return len(sent_ids), failed
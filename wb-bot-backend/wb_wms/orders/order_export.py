@@ -0,0 +1,250 @@
+"""
+Выгрузка заказов в CSV / NDJSON / XLSX потоком.
+
+Заказы читаются из базы курсором пачками (QuerySet.iterator(chunk_size)),
+склад, маркетплейс, город и клиент - в том же запросе, услуги - одним
+запросом на пачку. Файл отдается по частям по мере чтения, поэтому память
+не зависит от количества заказов. Фильтры и сортировка - как у списка
+заказов (order_filters).
+
+XLSX собирается без сторонних библиотек: лист пишется в zip-архив потоком
+(строки inlineStr, без общей таблицы строк), архив - без перемотки назад.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .order_filters import filter_orders, order_sort
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ('csv', 'ndjson', 'xlsx')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Колонки выгрузки (порядок колонок CSV / XLSX, ключи NDJSON)
+EXPORT_COLUMNS = (
+    'id', 'created_at', 'status', 'warehouse_id', 'warehouse', 'marketplace', 'city', 'cargo_type',
+    'container_type', 'box_count', 'pallet_count', 'length', 'width', 'height', 'weight', 'user_id',
+    'client_name', 'client_company', 'client_phone', 'client_email', 'telegram_user_id', 'pickup_address',
+    'services', 'service_names', 'total_price',
+)
+
+
+def _client(order):
+    # Клиент с учетной записью - из профиля, иначе из полей заказа (как client_info в OrderSerializer)
+    if order.user_id:
+        user = order.user
+        return user.username, user.company_name, user.phone, user.email
+    return order.client_name, order.company or '', order.phone_number, order.email or ''
+
+
+def _services(order):
+    services = sorted(order.services.all(), key=lambda service: service.pk)
+    return ';'.join(str(service.pk) for service in services), '; '.join(service.name for service in services)
+
+
+def _datetime(value):
+    return timezone.localtime(value).isoformat(sep=' ', timespec='seconds') if value else None
+
+
+def order_row(order):
+    """Плоская строка выгрузки: колонка -> значение"""
+    warehouse = order.warehouse
+    client_name, client_company, client_phone, client_email = _client(order)
+    service_ids, service_names = _services(order)
+    return {
+        'id': str(order.pk),
+        'created_at': _datetime(order.created_at),
+        'status': order.status,
+        'warehouse_id': order.warehouse_id,
+        'warehouse': warehouse.name,
+        'marketplace': warehouse.marketplace.name,
+        'city': warehouse.city.name,
+        'cargo_type': order.cargo_type,
+        'container_type': order.container_type,
+        'box_count': order.box_count,
+        'pallet_count': order.pallet_count,
+        'length': order.length,
+        'width': order.width,
+        'height': order.height,
+        'weight': order.weight,
+        'user_id': order.user_id,
+        'client_name': client_name,
+        'client_company': client_company,
+        'client_phone': client_phone,
+        'client_email': client_email,
+        'telegram_user_id': order.telegram_user_id,
+        'pickup_address': order.pickup_address,
+        'services': service_ids,
+        'service_names': service_names,
+        'total_price': order.total_price,
+    }
+
+
+def export_queryset(queryset, params):
+    """
+    Заказы для выгрузки с фильтрами и сортировкой из параметров запроса;
+    некорректный параметр - ValidationError (до начала выгрузки)
+    """
+    queryset, _ = filter_orders(queryset, params)
+    return (
+        queryset.order_by(*order_sort(params))
+        .select_related('warehouse__marketplace', 'warehouse__city', 'user')
+        .prefetch_related('services')
+    )
+
+
+def iter_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield order_row(order)
+
+
+def _csv_value(value):
+    return '' if value is None else value
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM - чтобы Excel открыл файл в UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def stream_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=_json_value))
+        if len(lines) == chunk_size:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+class _ZipStream:
+    """Файловый объект для ZipFile без seek: записанное забирается частями"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Заказы" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+# Управляющие символы недопустимы в XML
+XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, (int, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(XML_ILLEGAL_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    output = _ZipStream()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(EXPORT_COLUMNS)
+            ).encode())
+            for count, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(row[column] for column in EXPORT_COLUMNS).encode())
+                if count % chunk_size == 0:
+                    yield output.pop()
+            sheet.write(b'</sheetData></worksheet>')
+    yield output.pop()
+
+
+STREAMS = {'csv': stream_csv, 'ndjson': stream_ndjson, 'xlsx': stream_xlsx}
+
+
+def stream_export(queryset, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Содержимое файла выгрузки частями (bytes)"""
+    return STREAMS[file_format](iter_rows(queryset, chunk_size), chunk_size)
+
+
+def export_filename(file_format):
+    return f"orders-{timezone.localtime():%Y%m%d-%H%M}.{file_format}"
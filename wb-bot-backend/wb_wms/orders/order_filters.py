@@ -0,0 +1,152 @@
+"""
+Фильтры и сортировка списка заказов (GET /orders/, выгрузка).
+
+Каждый фильтр ложится на индекс заказа:
+    status          - orders_order_status_idx (status, -created_at)
+    warehouse       - orders_order_warehouse_idx (warehouse, -created_at)
+    marketplace,
+    city            - склады выбираются подзапросом, дальше - как warehouse
+    created_from,
+    created_to      - orders_order_keyset_idx (-created_at, -id)
+    cargo_type      - orders_order_cargo_idx (cargo_type, -created_at)
+    telegram_user_id - orders_order_telegram_idx (частичный)
+    phone           - orders_order_phone_idx
+
+Сортировка - только по ключам из ORDER_SORTS, каждому соответствует
+индекс, по которому работает постраничная выдача по ключу: created_at -
+orders_order_keyset_idx, total_price - orders_order_price_idx.
+"""
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Order, Warehouse
+
+# Ключ сортировки -> порядок (поле, id) для KeysetPagination
+ORDER_SORTS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    '-total_price': ('-total_price', '-id'),
+    'total_price': ('total_price', 'id'),
+}
+DEFAULT_ORDER_SORT = '-created_at'
+
+STATUSES = {status for status, _ in Order.STATUS_CHOICES}
+CARGO_TYPES = ('box', 'pallet', 'mixed')
+
+
+def _list_param(params, name):
+    """Значения параметра: ?status=new&status=processing или ?status=new,processing"""
+    values = []
+    for value in params.getlist(name):
+        values.extend(item.strip() for item in value.split(',') if item.strip())
+    return values
+
+
+def _int_list_param(params, name):
+    values = _list_param(params, name)
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise ValidationError({name: 'Expected integer ids'})
+
+
+def datetime_param(params, name):
+    """
+    Момент времени из даты (YYYY-MM-DD) или даты-времени ISO 8601:
+    (момент, передана ли только дата) или (None, False)
+    """
+    value = params.get(name)
+    if not value:
+        return None, False
+    try:
+        # Сначала дата: parse_datetime принимает и "YYYY-MM-DD" (как полночь)
+        date = parse_date(value)
+        moment = None if date else parse_datetime(value)
+    except ValueError:
+        moment = date = None
+    if moment is None and date is None:
+        raise ValidationError({name: 'Expected date (YYYY-MM-DD) or ISO 8601 datetime'})
+    if moment is None:
+        moment = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, date is not None
+
+
+def filter_orders(queryset, params):
+    """
+    Применяет фильтры из параметров запроса.
+
+    Возвращает (queryset, примененные фильтры); некорректный параметр -
+    ValidationError (400).
+    """
+    applied = {}
+
+    statuses = _list_param(params, 'status')
+    if statuses:
+        unknown = sorted(set(statuses) - STATUSES)
+        if unknown:
+            raise ValidationError({'status': f"Unknown status: {', '.join(unknown)}"})
+        queryset = queryset.filter(status__in=statuses)
+        applied['status'] = statuses
+
+    warehouse_ids = _int_list_param(params, 'warehouse')
+    if warehouse_ids:
+        queryset = queryset.filter(warehouse_id__in=warehouse_ids)
+        applied['warehouse'] = warehouse_ids
+
+    # Маркетплейс и город - через склады: заказы отбираются по индексу склада
+    for name in ('marketplace', 'city'):
+        ids = _int_list_param(params, name)
+        if ids:
+            warehouses = Warehouse.objects.filter(**{f'{name}_id__in': ids}).values('id')
+            queryset = queryset.filter(warehouse_id__in=warehouses)
+            applied[name] = ids
+
+    created_from, _ = datetime_param(params, 'created_from')
+    if created_from:
+        queryset = queryset.filter(created_at__gte=created_from)
+        applied['created_from'] = created_from.isoformat()
+    created_to, date_only = datetime_param(params, 'created_to')
+    if created_to:
+        # Дата - весь день включительно, дата-время - граница включительно
+        if date_only:
+            queryset = queryset.filter(created_at__lt=created_to + datetime.timedelta(days=1))
+        else:
+            queryset = queryset.filter(created_at__lte=created_to)
+        applied['created_to'] = created_to.isoformat()
+
+    cargo_types = _list_param(params, 'cargo_type')
+    if cargo_types:
+        unknown = sorted(set(cargo_types) - set(CARGO_TYPES))
+        if unknown:
+            raise ValidationError({'cargo_type': f"Unknown cargo type: {', '.join(unknown)}"})
+        queryset = queryset.filter(cargo_type__in=cargo_types)
+        applied['cargo_type'] = cargo_types
+
+    telegram_user_id = params.get('telegram_user_id')
+    if telegram_user_id:
+        try:
+            telegram_user_id = int(telegram_user_id)
+        except ValueError:
+            raise ValidationError({'telegram_user_id': 'Expected integer'})
+        queryset = queryset.filter(telegram_user_id=telegram_user_id)
+        applied['telegram_user_id'] = telegram_user_id
+
+    phone = params.get('phone', '').strip()
+    if phone:
+        queryset = queryset.filter(phone_number=phone)
+        applied['phone'] = phone
+
+    return queryset, applied
+
+
+def order_sort(params):
+    """Порядок (поле, id) по параметру sort; неизвестный ключ - ValidationError"""
+    sort = params.get('sort') or DEFAULT_ORDER_SORT
+    if sort not in ORDER_SORTS:
+        raise ValidationError({'sort': f"Unsupported sort key, expected one of: {', '.join(ORDER_SORTS)}"})
+    return ORDER_SORTS[sort]
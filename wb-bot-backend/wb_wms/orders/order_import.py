@@ -0,0 +1,259 @@
+"""
+Массовый импорт заказов из CSV / NDJSON.
+
+Файл читается построчно, без загрузки целиком в память; каждая строка
+проверяется отдельно, стоимость считается по одному снимку справочника
+тарифов. Заказы, строки расчета и связи с услугами записываются пачками
+(order_writer.write_orders), каждая пачка - в своей короткой транзакции,
+чтобы не держать блокировку записи SQLite на весь файл.
+
+Колонки (CSV) / ключи (NDJSON):
+    warehouse_id, cargo_type (box / pallet), container_type, box_count,
+    pallet_count, weight, client_name, phone_number, company, email,
+    pickup_address, services (id услуг; в CSV через ";")
+"""
+import csv
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .models import Order, Warehouse
+from .order_writer import OrderDraft, write_orders
+from .pricing import get_price_book, order_quote_request
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_FORMATS = ('csv', 'ndjson')
+CARGO_TYPES = ('box', 'pallet')
+
+
+def detect_format(filename=None, content_type=None):
+    """Формат файла по расширению или Content-Type (по умолчанию CSV)"""
+    filename = (filename or '').lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if filename.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return 'csv'
+
+
+def _text_lines(stream):
+    """Строки файла как текст (поток байтов читается построчно)"""
+    for line in stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def iter_rows(stream, file_format='csv'):
+    """
+    Строки файла: (номер строки, данные или None, ошибка разбора или None)
+    """
+    lines = _text_lines(stream)
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, None, f'Некорректный JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_num, None, 'Ожидается JSON-объект'
+            continue
+        yield line_num, row, None
+
+
+def _value(row, key):
+    value = row.get(key)
+    return value.strip() if isinstance(value, str) else value
+
+
+def _count(row, key, errors):
+    value = _value(row, key)
+    if value in (None, ''):
+        return 0
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        errors.append(f'{key}: ожидается целое число, получено {value!r}')
+        return 0
+    if count < 0:
+        errors.append(f'{key}: количество не может быть отрицательным')
+    return count
+
+
+def _service_ids(row, errors):
+    value = row.get('services')
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = [item for item in value.replace(',', ';').split(';') if item.strip()]
+    if not isinstance(value, list):
+        errors.append('services: ожидается список id услуг')
+        return []
+    ids = []
+    for item in value:
+        try:
+            ids.append(int(str(item).strip()))
+        except ValueError:
+            errors.append(f'services: некорректный id услуги {item!r}')
+    return ids
+
+
+class ImportResult:
+    """
+    Итог импорта: созданные заказы и ошибки по строкам
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.order_ids = []
+        self.errors = []
+
+    def add_error(self, row_num, errors):
+        self.errors.append({'row': row_num, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'order_ids': [str(order_id) for order_id in self.order_ids],
+            'errors': self.errors,
+        }
+
+
+class OrderImporter:
+    """
+    Проверяет строки файла и записывает заказы пачками.
+
+    Справочник тарифов, склады и клиент определяются один раз на импорт.
+    """
+
+    def __init__(self, user=None, batch_size=IMPORT_BATCH_SIZE, book=None):
+        self.user = user if user is not None and user.is_authenticated else None
+        self.batch_size = batch_size
+        self.book = book or get_price_book()
+        self.client = self.book.client_for(self.user)
+        self.warehouse_ids = set(Warehouse.objects.values_list('id', flat=True))
+        self.result = ImportResult()
+        self._batch = []
+
+    def build(self, row):
+        """
+        Заказ и расчет по строке файла: OrderDraft, список ошибок
+        """
+        errors = []
+
+        warehouse_id = _value(row, 'warehouse_id') or _value(row, 'warehouse')
+        try:
+            warehouse_id = int(warehouse_id)
+        except (TypeError, ValueError):
+            warehouse_id = None
+        if warehouse_id not in self.warehouse_ids:
+            errors.append(f"warehouse_id: неизвестный склад {row.get('warehouse_id', row.get('warehouse'))!r}")
+
+        cargo_type = _value(row, 'cargo_type')
+        if cargo_type not in CARGO_TYPES:
+            errors.append(f'cargo_type: ожидается одно из {", ".join(CARGO_TYPES)}')
+
+        box_count = _count(row, 'box_count', errors)
+        pallet_count = _count(row, 'pallet_count', errors)
+
+        weight = _value(row, 'weight')
+        if weight in (None, ''):
+            weight = None
+        else:
+            try:
+                weight = Decimal(str(weight))
+            except InvalidOperation:
+                errors.append(f'weight: ожидается число, получено {weight!r}')
+                weight = None
+
+        client_name = _value(row, 'client_name')
+        phone_number = _value(row, 'phone_number')
+        if not client_name:
+            errors.append('client_name: обязательное поле')
+        if not phone_number:
+            errors.append('phone_number: обязательное поле')
+
+        email = _value(row, 'email') or None
+        if email:
+            try:
+                validate_email(email)
+            except ValidationError:
+                errors.append(f'email: некорректный адрес {email!r}')
+
+        service_ids = _service_ids(row, errors)
+        for service_id in service_ids:
+            if self.book.service(service_id) is None:
+                errors.append(f'services: неизвестная услуга {service_id}')
+
+        if errors:
+            return None, errors
+
+        container_type = _value(row, 'container_type') or None
+        quote = self.book.quote(order_quote_request(
+            warehouse_id, cargo_type, container_type, box_count, pallet_count, service_ids,
+            weight=weight, client=self.client,
+        ))
+        order = Order(
+            status='new',
+            warehouse_id=warehouse_id,
+            cargo_type=cargo_type,
+            container_type=container_type,
+            box_count=box_count,
+            pallet_count=pallet_count,
+            weight=weight,
+            client_name=client_name,
+            phone_number=phone_number,
+            company=_value(row, 'company') or None,
+            email=email,
+            pickup_address=_value(row, 'pickup_address') or None,
+            total_price=quote.total,
+            user=self.user,
+        )
+        return OrderDraft(order, quote, service_ids), []
+
+    def add(self, row_num, row):
+        built, errors = self.build(row)
+        if errors:
+            self.result.add_error(row_num, errors)
+            return
+        self._batch.append(built)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленную пачку заказов в одной транзакции"""
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        orders = write_orders(batch, batch_size=self.batch_size)
+
+        self.result.created += len(orders)
+        self.result.order_ids.extend(order.pk for order in orders)
+        logger.info(f"Imported batch of {len(orders)} orders")
+
+    def run(self, stream, file_format='csv'):
+        for row_num, row, error in iter_rows(stream, file_format):
+            if error:
+                self.result.add_error(row_num, [error])
+            else:
+                self.add(row_num, row)
+        self.flush()
+        return self.result
+
+
+def import_orders(stream, file_format='csv', user=None, batch_size=IMPORT_BATCH_SIZE):
+    """Импортирует заказы из потока CSV / NDJSON и возвращает ImportResult"""
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f'Неподдерживаемый формат: {file_format}')
+    return OrderImporter(user=user, batch_size=batch_size).run(stream, file_format)
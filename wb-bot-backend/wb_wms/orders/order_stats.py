@@ -0,0 +1,235 @@
+"""
+Сводка заказов по дням (OrderDailyStats).
+
+Строка сводки - (дата создания, склад, статус, тип груза) с количеством
+заказов, коробок, паллет и выручкой. Сводка обновляется приращениями в той
+же транзакции, что и заказ:
+    - новые заказы - order_writer.write_orders и Order.save;
+    - изменение статуса, груза или стоимости - Order.save / update_price
+      (заказ переносится из прежней строки сводки в новую: UPDATE двух строк
+      сводки или INSERT новой вдобавок к UPDATE заказа; запись остальных
+      полей заказа сводку не трогает);
+    - удаление - сигнал post_delete (signals.py).
+QuerySet.update() и bulk_create() сводку не обновляют; после массовых правок
+в обход модели ее пересобирает rebuild_order_stats (manage.py rebuild_order_stats).
+
+Дата - день создания заказа в часовом поясе проекта (TIME_ZONE).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from .models import Order, OrderDailyStats
+from .order_filters import CARGO_TYPES, STATUSES, _int_list_param, _list_param
+
+# Поля заказа, от которых зависит его строка сводки
+STATS_FIELDS = ('created_at', 'warehouse_id', 'status', 'cargo_type', 'box_count', 'pallet_count', 'total_price')
+STATS_GROUPS = ('date', 'warehouse', 'status', 'cargo_type')
+REBUILD_BATCH_SIZE = 1000
+
+
+def stats_entry(values):
+    """(ключ строки сводки, вклад заказа) по значениям STATS_FIELDS; None - заказа нет"""
+    if values is None or values['created_at'] is None:
+        return None
+    key = (timezone.localdate(values['created_at']), values['warehouse_id'], values['status'], values['cargo_type'])
+    return key, (1, values['box_count'] or 0, values['pallet_count'] or 0, Decimal(values['total_price'] or 0))
+
+
+def order_stats_values(order):
+    return {name: getattr(order, name) for name in STATS_FIELDS}
+
+
+def touches_stats(order, update_fields=None):
+    """Меняет ли запись заказа с update_fields его строку сводки"""
+    if order._state.adding or update_fields is None:
+        return True
+    return any(order._meta.get_field(name).attname in STATS_FIELDS for name in update_fields)
+
+
+def stored_stats_values(order):
+    """
+    Значения STATS_FIELDS заказа в БД до записи (None - заказа в БД еще нет).
+
+    Берутся из значений, загруженных вместе с заказом; если заказ загружен
+    без части полей (.only(), .defer()), - одним SELECT.
+    """
+    if order._state.adding:
+        return None
+    loaded = getattr(order, '_loaded_values', None) or {}
+    if all(name in loaded for name in STATS_FIELDS):
+        return {name: loaded[name] for name in STATS_FIELDS}
+    return Order.objects.filter(pk=order.pk).values(*STATS_FIELDS).first()
+
+
+def saved_stats_values(order, before, update_fields=None):
+    """Значения STATS_FIELDS в БД после записи заказа с update_fields"""
+    if before is None or update_fields is None:
+        return order_stats_values(order)
+    written = {order._meta.get_field(name).attname for name in update_fields}
+    return {name: getattr(order, name) if name in written else before[name] for name in STATS_FIELDS}
+
+
+def _add(deltas, entry, sign):
+    if entry is None:
+        return
+    key, contribution = entry
+    total = deltas[key]
+    for i, value in enumerate(contribution):
+        total[i] += sign * value
+
+
+def apply_deltas(deltas):
+    """Прибавляет приращения к строкам сводки (создавая недостающие строки)"""
+    for (date, warehouse_id, status, cargo_type), (count, boxes, pallets, revenue) in deltas.items():
+        if not (count or boxes or pallets or revenue):
+            continue
+        lookup = {'date': date, 'warehouse_id': warehouse_id, 'status': status, 'cargo_type': cargo_type}
+        increments = {
+            'order_count': F('order_count') + count,
+            'box_count': F('box_count') + boxes,
+            'pallet_count': F('pallet_count') + pallets,
+            'revenue': F('revenue') + revenue,
+        }
+        if OrderDailyStats.objects.filter(**lookup).update(**increments) or count <= 0:
+            # Строки нет, а заказ из нее убывает (например, склад удаляется
+            # вместе со сводкой) - отрицательную строку не создаем
+            continue
+        try:
+            with transaction.atomic():
+                OrderDailyStats.objects.create(
+                    **lookup, order_count=count, box_count=boxes, pallet_count=pallets, revenue=revenue
+                )
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            OrderDailyStats.objects.filter(**lookup).update(**increments)
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0, 0, 0, Decimal(0)])
+
+
+def record_orders_created(orders):
+    """Добавляет в сводку новые заказы"""
+    deltas = _new_deltas()
+    for order in orders:
+        _add(deltas, stats_entry(order_stats_values(order)), 1)
+    apply_deltas(deltas)
+
+
+def record_order_change(before, after):
+    """
+    Переносит заказ в сводке: before / after - значения STATS_FIELDS до и после
+    записи (None - заказа не было / больше нет)
+    """
+    old, new = stats_entry(before), stats_entry(after)
+    if old == new:
+        return
+    deltas = _new_deltas()
+    _add(deltas, old, -1)
+    _add(deltas, new, 1)
+    apply_deltas(deltas)
+
+
+def rebuild_order_stats(order_model=Order, stats_model=OrderDailyStats, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Пересобирает сводку целиком одним агрегирующим запросом по заказам.
+
+    Модели передаются явно, чтобы функцию можно было вызвать из миграции.
+    Возвращает количество строк сводки.
+    """
+    rows = (
+        order_model.objects.annotate(date=TruncDate('created_at'))
+        .values('date', 'warehouse_id', 'status', 'cargo_type')
+        .annotate(
+            order_count=Count('pk'),
+            stats_box_count=Coalesce(Sum('box_count'), Value(0), output_field=IntegerField()),
+            stats_pallet_count=Coalesce(Sum('pallet_count'), Value(0), output_field=IntegerField()),
+            revenue=Coalesce(Sum('total_price'), Value(Decimal(0)), output_field=DecimalField()),
+        )
+        .order_by()
+    )
+    created = 0
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(stats_model(
+                date=row['date'], warehouse_id=row['warehouse_id'], status=row['status'],
+                cargo_type=row['cargo_type'], order_count=row['order_count'],
+                box_count=row['stats_box_count'], pallet_count=row['stats_pallet_count'], revenue=row['revenue'],
+            ))
+            if len(batch) == batch_size:
+                stats_model.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        stats_model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def _date_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValidationError({name: 'Expected date (YYYY-MM-DD)'})
+    return date
+
+
+def order_stats(params):
+    """
+    Сводка для дашборда - только из OrderDailyStats, без чтения заказов.
+
+    Параметры: date_from, date_to (YYYY-MM-DD, включительно), warehouse,
+    status, cargo_type (через запятую или повторением), group_by - разрезы из
+    STATS_GROUPS (по умолчанию все). Возвращает {'results': [...], 'totals': {...}}.
+    """
+    queryset = OrderDailyStats.objects.all()
+    date_from, date_to = _date_param(params, 'date_from'), _date_param(params, 'date_to')
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+
+    warehouse_ids = _int_list_param(params, 'warehouse')
+    if warehouse_ids:
+        queryset = queryset.filter(warehouse_id__in=warehouse_ids)
+    for name, known in (('status', STATUSES), ('cargo_type', set(CARGO_TYPES))):
+        values = _list_param(params, name)
+        unknown = sorted(set(values) - known)
+        if unknown:
+            raise ValidationError({name: f"Unknown value: {', '.join(unknown)}"})
+        if values:
+            queryset = queryset.filter(**{f'{name}__in': values})
+
+    groups = _list_param(params, 'group_by') or list(STATS_GROUPS)
+    unknown = sorted(set(groups) - set(STATS_GROUPS))
+    if unknown:
+        raise ValidationError({'group_by': f"Unknown group: {', '.join(unknown)}, expected {', '.join(STATS_GROUPS)}"})
+    columns = [f'{group}_id' if group == 'warehouse' else group for group in STATS_GROUPS if group in groups]
+
+    sums = {
+        'order_count': Sum('order_count'),
+        'box_count': Sum('box_count'),
+        'pallet_count': Sum('pallet_count'),
+        'revenue': Sum('revenue'),
+    }
+    results = list(
+        queryset.values(*columns).annotate(**sums).filter(order_count__gt=0).order_by(*columns)
+    )
+    totals = queryset.aggregate(**sums)
+    return {
+        'results': results,
+        'totals': {name: value or 0 for name, value in totals.items()},
+    }
@@ -0,0 +1,85 @@
+"""
+Запись новых заказов.
+
+Единая точка записи для API, импорта и очереди приема заказов: заказ,
+строки расчета и связи с услугами пишутся параметризованными INSERT
+(текст запроса один на таблицу, значения - параметрами), пачки заказов -
+через executemany в одной транзакции. Значения готовятся полями моделей
+(get_db_prep_save), поэтому запись одинаково работает на SQLite и
+PostgreSQL. Первичный ключ заказа - UUID, он генерируется в приложении,
+так что last_insert_rowid() / RETURNING не нужны. Сводка по дням
+(OrderDailyStats) обновляется в той же транзакции.
+"""
+from collections import namedtuple
+
+from django.db import models, transaction
+
+from .models import Order, OrderLine
+from .order_stats import record_orders_created
+
+ORDER_WRITE_BATCH_SIZE = 500
+
+# Заказ (еще не сохраненный), его расчет и id дополнительных услуг
+OrderDraft = namedtuple('OrderDraft', 'order quote service_ids')
+
+
+def _insert_sql(db, model, fields):
+    quote_name = db.ops.quote_name
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+
+
+def _insert_many(db, cursor, model, objs, batch_size):
+    """
+    Вставляет объекты одним параметризованным INSERT через executemany.
+
+    Автоинкрементные ключи (строки расчета, связи с услугами) не
+    заполняются и обратно не читаются - они нигде не используются.
+    """
+    fields = [field for field in model._meta.concrete_fields if not isinstance(field, models.AutoField)]
+    sql = _insert_sql(db, model, fields)
+    for start in range(0, len(objs), batch_size):
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(field.pre_save(obj, True), db) for field in fields]
+            for obj in objs[start:start + batch_size]
+        ])
+
+
+def write_orders(drafts, batch_size=ORDER_WRITE_BATCH_SIZE):
+    """
+    Записывает заказы со строками расчета и услугами в одной транзакции.
+
+    Стоимость заказа (total_price) должна быть уже рассчитана - при записи
+    она не пересчитывается. Возвращает список сохраненных заказов.
+    """
+    drafts = list(drafts)
+    if not drafts:
+        return []
+    orders = [draft.order for draft in drafts]
+    through = Order.services.through
+    # Соединение берется один раз: обращение к django.db.connection в цикле заметно дороже
+    db = transaction.get_connection()
+
+    with transaction.atomic(), db.cursor() as cursor:
+        _insert_many(db, cursor, Order, orders, batch_size)
+        _insert_many(db, cursor, OrderLine, [
+            OrderLine.from_quote_line(draft.order, line) for draft in drafts for line in draft.quote.lines
+        ], batch_size)
+        _insert_many(db, cursor, through, [
+            through(order_id=draft.order.pk, additionalservice_id=service_id)
+            for draft in drafts for service_id in sorted(set(draft.service_ids))
+        ], batch_size)
+        record_orders_created(orders)
+
+    for order in orders:
+        order._state.adding = False
+        order._state.db = db.alias
+    return orders
+
+
+def write_order(order, quote, service_ids=()):
+    """Записывает один заказ (см. write_orders)"""
+    return write_orders([OrderDraft(order, quote, service_ids)])[0]
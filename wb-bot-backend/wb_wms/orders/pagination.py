@@ -0,0 +1,121 @@
+"""
+Постраничная выдача по ключу (keyset / cursor pagination).
+
+Страница выбирается условием по последней строке предыдущей страницы:
+    created_at < :created_at OR (created_at = :created_at AND id < :id)
+в порядке (-created_at, -id), поэтому стоимость запроса не зависит от
+глубины страницы (в отличие от OFFSET). Представление может задать
+другой порядок методом get_ordering() - (поле, id) в одном направлении.
+Курсор непрозрачен для клиента: это base64 от (поле сортировки, значение,
+id) последней строки.
+"""
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по паре (поле сортировки, id).
+
+    Параметры запроса: cursor - курсор следующей страницы из ответа,
+    page_size - размер страницы (по умолчанию ORDER_LIST_PAGE_SIZE, не больше max_page_size).
+    """
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.next_cursor = None
+        self.request = None
+        self.page_queryset = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            page_size = settings.ORDER_LIST_PAGE_SIZE
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, view):
+        if view is not None and hasattr(view, 'get_ordering'):
+            return tuple(view.get_ordering())
+        return self.ordering
+
+    @staticmethod
+    def encode_cursor(field, value, pk):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        raw = json.dumps([field, str(value), str(pk)]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model, field):
+        """
+        Значение поля сортировки и id из курсора; NotFound для поврежденного
+        курсора или курсора, выданного при другой сортировке
+        """
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            cursor_field, value, pk = json.loads(raw)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor_field != field:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            value = model._meta.get_field(field).to_python(value)
+            pk = model._meta.pk.to_python(pk)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        field = ordering[0].lstrip('-')
+        descending = ordering[0].startswith('-')
+        queryset = queryset.order_by(*ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(cursor, queryset.model, field)
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+            )
+
+        # Лишняя строка показывает, есть ли следующая страница
+        self.page_queryset = queryset[:page_size + 1]
+        page = list(self.page_queryset)
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            self.next_cursor = self.encode_cursor(field, getattr(last, field), last.pk)
+        else:
+            self.next_cursor = None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.next_cursor),
+            ('results', data),
+        ]))
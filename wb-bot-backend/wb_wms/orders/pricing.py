@@ -0,0 +1,642 @@
+"""
+Скомпилированный справочник тарифов.
+
+PriceBook загружает все действующие тарифы (Pricing) и дополнительные услуги
+(AdditionalService) в словари и рассчитывает стоимость без обращений к БД.
+Справочник пересобирается, когда меняется версия тарифов (DataVersion,
+см. data_versions.py и signals.py) или наступает начало / окончание действия
+какого-либо тарифа.
+
+PriceHistory хранит все периоды действия тарифов и отдает справочник,
+действовавший в произвольный момент времени (для исторических заказов).
+"""
+import logging
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from decimal import Decimal, ROUND_CEILING
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .data_versions import bump_version, get_version
+
+logger = logging.getLogger(__name__)
+
+# Имя версии тарифов в DataVersion
+TARIFFS = 'tariffs'
+
+# Значения по умолчанию, если подходящий тариф не найден
+DEFAULT_DELIVERY_PRICE = Decimal('2000.00')
+DEFAULT_BOX_PRICE = Decimal('500.00')
+DEFAULT_PALLET_PRICE = Decimal('2000.00')
+
+CARGO_DEFAULTS = {
+    'box': DEFAULT_BOX_PRICE,
+    'pallet': DEFAULT_PALLET_PRICE,
+}
+
+Tariff = namedtuple('Tariff', [
+    'id', 'name', 'pricing_type', 'specification', 'warehouse_id', 'base_price', 'unit_price',
+    'tier_basis', 'tier_from', 'step_size',
+])
+
+ServiceRate = namedtuple('ServiceRate', [
+    'id', 'name', 'price', 'service_type', 'requires_location', 'tiered',
+])
+
+# Индивидуальная цена клиента: client - ключ карты (см. client_keys)
+ClientRateRow = namedtuple('ClientRateRow', [
+    'id', 'client', 'pricing_type', 'specification', 'warehouse_id', 'service_id', 'base_price', 'unit_price',
+])
+
+# Строка расчета: kind - delivery / box / pallet / service
+QuoteLine = namedtuple('QuoteLine', [
+    'kind', 'pricing_id', 'service_id', 'name', 'quantity', 'base_price', 'unit_price', 'total',
+])
+
+# client - ключи индивидуальных карт клиента, найденных в справочнике (PriceBook.client_for)
+QuoteRequest = namedtuple('QuoteRequest', [
+    'warehouse_id', 'cargo_type', 'box_count', 'pallet_count', 'box_spec', 'pallet_spec', 'service_ids',
+    'weight', 'client',
+], defaults=[None, None])
+
+
+def _as_int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _as_decimal(value):
+    try:
+        return Decimal(str(value)) if value not in (None, '') else None
+    except ArithmeticError:
+        return None
+
+
+# Типы груза мини-приложения (cargoType.type, cargoType.selectedTypes)
+CARGO_TYPE_NAMES = {'Коробка': 'box', 'Паллета': 'pallet'}
+
+
+def _cargo_type(declared, box_count, pallet_count, selected=()):
+    """
+    Тип груза заказа: указанный явно, иначе по ненулевым количествам
+    (коробки и паллеты вместе - mixed), иначе по единственному выбранному типу
+    """
+    if declared:
+        return declared
+    counted = [kind for kind, count in (('box', box_count), ('pallet', pallet_count)) if count > 0]
+    if counted:
+        return counted[0] if len(counted) == 1 else 'mixed'
+    selected = {CARGO_TYPE_NAMES.get(name) for name in selected} - {None}
+    return selected.pop() if len(selected) == 1 else None
+
+
+def client_keys(user_id=None, company=None):
+    """Ключи карт клиента в порядке приоритета: пользователь, затем компания"""
+    keys = []
+    if user_id:
+        keys.append(f'user:{user_id}')
+    if company and company.strip():
+        keys.append(f'company:{company.strip().casefold()}')
+    return tuple(keys)
+
+
+def parse_quote_request(data, client=None):
+    """
+    Приводит данные формы калькулятора или заказа к QuoteRequest.
+
+    Поддерживаются оба формата, которые присылает мини-приложение:
+    плоский (cargo.box_count, cargo.container_type) и формат заказа
+    (cargoType.quantities, selectedBoxSizes, selectedPalletWeights).
+    Клиент берется не из данных формы, а из запроса (см. PriceBook.client_for).
+    """
+    delivery_data = data.get('delivery') or {}
+    cargo_data = data.get('cargoType') or data.get('cargo') or {}
+    service_ids = data.get('additionalServices', data.get('additional_services')) or []
+
+    warehouse_id = _as_int(delivery_data.get('warehouse_id') or delivery_data.get('warehouse'), None)
+
+    if 'quantities' in cargo_data:
+        quantities = cargo_data.get('quantities') or {}
+        box_count = _as_int(quantities.get('Коробка'))
+        pallet_count = _as_int(quantities.get('Паллета'))
+        box_sizes = cargo_data.get('selectedBoxSizes') or []
+        pallet_weights = cargo_data.get('selectedPalletWeights') or []
+        box_spec = box_sizes[0] if box_sizes else None
+        pallet_spec = pallet_weights[0] if pallet_weights else None
+        # Мини-приложение присылает selectedTypes, type - только старые формы
+        cargo_type = _cargo_type(CARGO_TYPE_NAMES.get(cargo_data.get('type')), box_count, pallet_count,
+                                 cargo_data.get('selectedTypes') or ())
+    else:
+        box_count = _as_int(cargo_data.get('box_count'))
+        pallet_count = _as_int(cargo_data.get('pallet_count'))
+        box_spec = pallet_spec = cargo_data.get('container_type') or None
+        cargo_type = _cargo_type(cargo_data.get('cargo_type'), box_count, pallet_count)
+
+    weight = cargo_data.get('weight', (cargo_data.get('dimensions') or {}).get('weight'))
+
+    return QuoteRequest(
+        warehouse_id=warehouse_id,
+        cargo_type=cargo_type,
+        box_count=max(box_count, 0),
+        pallet_count=max(pallet_count, 0),
+        box_spec=box_spec,
+        pallet_spec=pallet_spec,
+        service_ids=tuple(service_ids),
+        weight=_as_decimal(weight),
+        client=client,
+    )
+
+
+def order_quote_request(warehouse_id, cargo_type, container_type, box_count, pallet_count, service_ids=(),
+                        weight=None, client=None):
+    """QuoteRequest для сохраненного заказа (поля модели Order); mixed - коробки и паллеты вместе"""
+    return QuoteRequest(
+        warehouse_id=warehouse_id,
+        cargo_type=cargo_type,
+        box_count=(box_count or 0) if cargo_type in ('box', 'mixed') else 0,
+        pallet_count=(pallet_count or 0) if cargo_type in ('pallet', 'mixed') else 0,
+        box_spec=container_type,
+        pallet_spec=container_type,
+        service_ids=tuple(service_ids),
+        weight=_as_decimal(weight),
+        client=client,
+    )
+
+
+class Quote:
+    """
+    Результат расчета стоимости: строки и итоговые суммы
+    """
+
+    def __init__(self, lines, version, weight=None):
+        self.lines = lines
+        self.version = version
+        # Вес груза, по которому выбраны ступени тарифов (сохраняется в заказе)
+        self.weight = weight
+
+    def _sum(self, kinds):
+        return sum((line.total for line in self.lines if line.kind in kinds), Decimal('0.00'))
+
+    @property
+    def delivery(self):
+        return self._sum(('delivery',))
+
+    @property
+    def cargo(self):
+        return self._sum(('box', 'pallet'))
+
+    @property
+    def additional_services(self):
+        return self._sum(('service',))
+
+    @property
+    def total(self):
+        return self._sum(('delivery', 'box', 'pallet', 'service')).quantize(Decimal('0.01'))
+
+    def line(self, kind):
+        for line in self.lines:
+            if line.kind == kind:
+                return line
+        return None
+
+    def as_response(self):
+        """Ответ в формате эндпоинта calculate-price/"""
+        return {
+            'total_price': self.total,
+            'currency': 'RUB',
+            'details': {
+                'delivery': str(self.delivery),
+                'cargo': str(self.cargo),
+                'additional_services': str(self.additional_services),
+            }
+        }
+
+
+def load_dated_rates(validity=Q()):
+    """
+    Активные тарифы и услуги с периодом действия: [(valid_from, valid_to, Tariff)], [(.., ServiceRate)]
+    """
+    from .models import Pricing, AdditionalService
+
+    tariffs = [
+        (row[-2], row[-1], Tariff(*row[:-2])) for row in Pricing.objects.filter(validity, is_active=True).values_list(
+            *Tariff._fields, 'valid_from', 'valid_to'
+        )
+    ]
+    services = [
+        (row[-2], row[-1], ServiceRate(*row[:-2])) for row in AdditionalService.objects.filter(validity, is_active=True).values_list(
+            *ServiceRate._fields, 'valid_from', 'valid_to'
+        )
+    ]
+    return tariffs, services
+
+
+def load_client_rates():
+    """Активные индивидуальные цены клиентов одним запросом"""
+    from .models import ClientRate
+
+    rates = []
+    for rate_id, user_id, company, *values in ClientRate.objects.filter(is_active=True).values_list(
+        'id', 'user_id', 'company', 'pricing_type', 'specification', 'warehouse_id', 'service_id',
+        'base_price', 'unit_price'
+    ):
+        # У цены указан либо клиент, либо компания (см. ClientRate.clean)
+        keys = client_keys(user_id, company)
+        if keys:
+            rates.append(ClientRateRow(rate_id, keys[0], *values))
+    return rates
+
+
+def _effective(rows, at):
+    return [rate for valid_from, valid_to, rate in rows if valid_from <= at and (valid_to is None or at < valid_to)]
+
+
+def load_rates(at=None):
+    """
+    Тарифы и услуги, действующие в момент at (по умолчанию - сейчас), и время
+    ближайшего изменения (начала или окончания действия какой-либо записи)
+    """
+    at = at or timezone.now()
+    # Уже закрытые записи не читаем; будущие нужны для времени следующего изменения
+    tariffs, services = load_dated_rates(Q(valid_to__isnull=True) | Q(valid_to__gt=at))
+    changes = [
+        bound for valid_from, valid_to, _ in tariffs + services
+        for bound in (valid_from, valid_to) if bound is not None and bound > at
+    ]
+    return _effective(tariffs, at), _effective(services, at), min(changes, default=None)
+
+
+class PriceBook:
+    """
+    Неизменяемый снимок активных тарифов и дополнительных услуг.
+
+    Индексы повторяют правила выбора Pricing.objects.filter(...).first():
+    при нескольких подходящих тарифах берется тариф с наименьшим id.
+
+    Ступенчатые тарифы (tier_basis + tier_from) хранятся отсортированными
+    границами по (pricing_type, warehouse_id), ступень ищется бинарным поиском.
+    Цена ступени - за единицу груза, в том числе когда ступень выбрана не по
+    весу, а по спецификации (вес не передан).
+
+    Индивидуальные цены клиентов хранятся картами по ключу клиента и
+    проверяются раньше общих тарифов: карта пользователя, карта компании,
+    затем тарифы склада и общие - цепочка поисков в словарях.
+    """
+
+    def __init__(self, tariffs, services, version=None, valid_until=None, client_rates=()):
+        self.version = version
+        # Версия тарифов в БД, по которой собран справочник (см. get_price_book)
+        self.tariff_version = version
+        # Момент, после которого набор действующих тарифов меняется
+        self.valid_until = valid_until
+        self._by_id = {}
+        self._by_key = {}
+        self._by_type = {}
+        self._tiers = {}
+        self._services = {}
+        # ключ клиента -> ({(pricing_type, specification, warehouse_id): Tariff}, {service_id: ServiceRate})
+        self._cards = {}
+
+        for tariff in sorted(tariffs, key=lambda t: t.id):
+            self._by_id[tariff.id] = tariff
+            # (pricing_type, specification, warehouse_id) и его обобщения
+            self._by_key.setdefault((tariff.pricing_type, tariff.specification, tariff.warehouse_id), tariff)
+            self._by_key.setdefault((tariff.pricing_type, tariff.specification, None), tariff)
+            self._by_key.setdefault((tariff.pricing_type, None, tariff.warehouse_id), tariff)
+            self._by_type.setdefault(tariff.pricing_type, tariff)
+            if tariff.tier_basis and tariff.tier_from is not None:
+                self._tiers.setdefault((tariff.pricing_type, tariff.warehouse_id), []).append(tariff)
+
+        for key, rules in self._tiers.items():
+            # Основание ступеней группы определяется первым тарифом
+            basis = rules[0].tier_basis
+            rules = sorted((rule for rule in rules if rule.tier_basis == basis), key=lambda rule: rule.tier_from)
+            self._tiers[key] = (basis, [rule.tier_from for rule in rules], rules)
+
+        for service in services:
+            self._services[service.id] = service
+
+        for rate in sorted(client_rates, key=lambda r: r.id):
+            card_tariffs, card_services = self._cards.setdefault(rate.client, ({}, {}))
+            if rate.service_id:
+                service = self._services.get(rate.service_id)
+                if service:
+                    card_services.setdefault(rate.service_id, service._replace(price=rate.base_price, tiered=False))
+            elif rate.pricing_type:
+                base = self.tariff(rate.pricing_type, rate.specification, rate.warehouse_id)
+                card_tariffs.setdefault((rate.pricing_type, rate.specification, rate.warehouse_id), Tariff(
+                    None, base.name if base else '', rate.pricing_type, rate.specification, rate.warehouse_id,
+                    rate.base_price, rate.unit_price, None, None, None,
+                ))
+
+    @classmethod
+    def load(cls, version=None, at=None):
+        """Загружает тарифы, услуги, действующие в момент at, и цены клиентов тремя запросами"""
+        tariffs, services, valid_until = load_rates(at)
+        return cls(tariffs, services, version=version, valid_until=valid_until, client_rates=load_client_rates())
+
+    def is_expired(self, now=None):
+        """Наступило начало или окончание действия какого-либо тарифа"""
+        return self.valid_until is not None and (now or timezone.now()) >= self.valid_until
+
+    def client_for(self, user):
+        """
+        Ключи карт авторизованного клиента, для которых есть индивидуальные цены.
+
+        None, если карт нет: расчеты таких клиентов совпадают с общими и
+        делят с ними кеш.
+        """
+        if user is None or not getattr(user, 'is_authenticated', False):
+            return None
+        return self.client_for_keys(user.pk, user.company_name)
+
+    def client_for_keys(self, user_id=None, company=None):
+        """Как client_for, но по id пользователя и названию его компании"""
+        keys = tuple(key for key in client_keys(user_id, company) if key in self._cards)
+        return keys or None
+
+    def _client_tariff(self, client, pricing_type, specification=None, warehouse_id=None):
+        for card in client or ():
+            card_tariffs = self._cards.get(card, ({}, {}))[0]
+            for key in ((pricing_type, specification, warehouse_id), (pricing_type, specification, None),
+                        (pricing_type, None, warehouse_id), (pricing_type, None, None)):
+                if key in card_tariffs:
+                    return card_tariffs[key]
+        return None
+
+    def _client_service(self, client, service_id):
+        for card in client or ():
+            service = self._cards.get(card, ({}, {}))[1].get(service_id)
+            if service:
+                return service
+        return None
+
+    def tariff(self, pricing_type, specification=None, warehouse_id=None, client=None):
+        """
+        Ищет тариф: сначала цена клиента, затем точное совпадение, затем
+        любой тариф этого типа
+        """
+        tariff = self._client_tariff(client, pricing_type, specification, warehouse_id)
+        if tariff:
+            return tariff
+        if specification is not None or warehouse_id is not None:
+            tariff = self._by_key.get((pricing_type, specification, warehouse_id))
+            if tariff:
+                return tariff
+        return self._by_type.get(pricing_type)
+
+    def tier(self, pricing_type, warehouse_id, box_count=0, weight=None):
+        """
+        Ступень тарифа для количества коробок или веса.
+
+        Сначала ищутся ступени склада, затем общие. Возвращает None, если
+        ступеней нет или значение ниже первой границы.
+        """
+        for key in ((pricing_type, warehouse_id), (pricing_type, None)):
+            rules = self._tiers.get(key)
+            if not rules:
+                continue
+            basis, bounds, tariffs = rules
+            value = Decimal(box_count) if basis == 'boxes' else weight
+            if value is None:
+                return None
+            index = bisect_right(bounds, value) - 1
+            return tariffs[index] if index >= 0 else None
+        return None
+
+    @staticmethod
+    def tier_unit_price(tariff, box_count=0, weight=None):
+        """
+        Цена по ступени: базовая цена плюс надбавка за каждый начатый шаг
+        (step_size) сверх границы ступени
+        """
+        if not tariff.step_size:
+            return tariff.base_price
+        value = Decimal(box_count) if tariff.tier_basis == 'boxes' else (weight or Decimal('0'))
+        steps = ((value - tariff.tier_from) / tariff.step_size).to_integral_value(rounding=ROUND_CEILING)
+        return tariff.base_price + tariff.unit_price * max(steps, 0)
+
+    def tariff_by_id(self, pricing_id):
+        return self._by_id.get(_as_int(pricing_id, None))
+
+    def service(self, service_id, client=None):
+        service_id = _as_int(service_id, None)
+        return self._client_service(client, service_id) or self._services.get(service_id)
+
+    def services(self):
+        return list(self._services.values())
+
+    def rate_card(self, client):
+        """
+        Итоговый прайс клиента: общие тарифы и услуги с примененными
+        индивидуальными ценами. Строки (название, тип, спецификация, склад,
+        базовая цена, цена за единицу, индивидуальная ли цена).
+        """
+        rows = []
+        seen = set()
+        for tariff in self._by_id.values():
+            key = (tariff.pricing_type, tariff.specification, tariff.warehouse_id)
+            override = self._client_tariff(client, *key)
+            seen.add(key)
+            effective = override or tariff
+            rows.append((tariff.name, tariff.pricing_type, tariff.specification, tariff.warehouse_id,
+                         effective.base_price, effective.unit_price, override is not None))
+        for card in client or ():
+            for key, tariff in self._cards.get(card, ({}, {}))[0].items():
+                if key not in seen:
+                    seen.add(key)
+                    rows.append((tariff.name, *key, tariff.base_price, tariff.unit_price, True))
+        for service in self._services.values():
+            override = self._client_service(client, service.id)
+            rows.append((service.name, 'service', service.service_type, None,
+                         (override or service).price, Decimal('0.00'), override is not None))
+        return rows
+
+    def _cargo_line(self, kind, spec, quantity, warehouse_id=None, weight=None, client=None):
+        override = self._client_tariff(client, kind, spec, warehouse_id)
+        if override:
+            return QuoteLine(
+                kind, None, None, override.name, quantity,
+                override.base_price, override.unit_price,
+                override.base_price + override.unit_price * Decimal(quantity),
+            )
+
+        # Ступень выбирается по количеству коробок или по весу одной паллеты
+        unit_weight = weight / quantity if weight is not None and kind == 'pallet' else weight
+        tariff = self.tier(kind, warehouse_id, box_count=quantity, weight=unit_weight)
+        if not tariff:
+            tariff = self.tariff(kind, specification=spec)
+        if tariff and tariff.tier_basis:
+            # Ступень (найденная по весу или по спецификации, если веса нет) - цена за единицу,
+            # одна формула для расчета с весом и без него
+            unit_price = self.tier_unit_price(tariff, box_count=quantity, weight=unit_weight)
+            return QuoteLine(kind, tariff.id, None, tariff.name, quantity, Decimal('0.00'), unit_price,
+                             unit_price * Decimal(quantity))
+        if tariff:
+            return QuoteLine(
+                kind, tariff.id, None, tariff.name, quantity,
+                tariff.base_price, tariff.unit_price,
+                tariff.base_price + tariff.unit_price * Decimal(quantity),
+            )
+        default = CARGO_DEFAULTS[kind]
+        return QuoteLine(kind, None, None, '', quantity, Decimal('0.00'), default, default * Decimal(quantity))
+
+    def _service_line(self, service_id, request):
+        service = self.service(service_id, client=request.client)
+        if service:
+            # Цена услуги может зависеть от количества коробок / веса груза
+            tier = self.tier(service.service_type, request.warehouse_id,
+                             box_count=request.box_count, weight=request.weight) if service.tiered else None
+            if tier:
+                price = self.tier_unit_price(tier, box_count=request.box_count, weight=request.weight)
+                return QuoteLine('service', tier.id, service.id, f'{service.name}: {tier.name}', 1,
+                                 price, Decimal('0.00'), price)
+            return QuoteLine('service', None, service.id, service.name, 1, service.price, Decimal('0.00'), service.price)
+
+        # Устаревший формат: id тарифа или строка "тип_спецификация"
+        tariff = self.tariff_by_id(service_id)
+        if not tariff and isinstance(service_id, str) and '_' in service_id:
+            pricing_type, specification = service_id.split('_', 1)
+            tariff = self._by_key.get((pricing_type, specification, None))
+        if tariff:
+            return QuoteLine('service', tariff.id, None, tariff.name, 1, tariff.base_price, Decimal('0.00'), tariff.base_price)
+        return None
+
+    def quote(self, request):
+        """
+        Рассчитывает стоимость по QuoteRequest без запросов к БД
+        """
+        lines = []
+
+        # 1. Доставка
+        if request.warehouse_id:
+            tariff = self.tariff('delivery', warehouse_id=request.warehouse_id, client=request.client)
+            if tariff:
+                lines.append(QuoteLine(
+                    'delivery', tariff.id, None, tariff.name, 1, tariff.base_price, Decimal('0.00'), tariff.base_price
+                ))
+            else:
+                lines.append(QuoteLine(
+                    'delivery', None, None, '', 1, DEFAULT_DELIVERY_PRICE, Decimal('0.00'), DEFAULT_DELIVERY_PRICE
+                ))
+
+        # 2. Груз
+        if request.box_count > 0:
+            lines.append(self._cargo_line(
+                'box', request.box_spec, request.box_count, request.warehouse_id, client=request.client
+            ))
+        if request.pallet_count > 0:
+            lines.append(self._cargo_line(
+                'pallet', request.pallet_spec, request.pallet_count, request.warehouse_id, request.weight,
+                client=request.client
+            ))
+        if request.box_count == 0 and request.pallet_count == 0 and request.cargo_type in CARGO_DEFAULTS:
+            # Количество не указано - считаем одну единицу по базовой стоимости
+            default = CARGO_DEFAULTS[request.cargo_type]
+            lines.append(QuoteLine(request.cargo_type, None, None, '', 1, Decimal('0.00'), default, default))
+
+        # 3. Дополнительные услуги
+        for service_id in request.service_ids:
+            line = self._service_line(service_id, request)
+            if line:
+                lines.append(line)
+            else:
+                logger.info(f"Additional service {service_id} not found in price book")
+
+        return Quote(lines, self.version, request.weight)
+
+
+def get_tariff_version():
+    """Текущая версия тарифов (общая для всех процессов, хранится в БД)"""
+    return get_version(TARIFFS)
+
+
+def bump_tariff_version():
+    """
+    Помечает тарифы как измененные в текущей транзакции; справочники всех
+    процессов пересоберутся при следующей проверке версии
+    """
+    bump_version(TARIFFS)
+
+
+_price_book = None
+_price_book_lock = threading.Lock()
+
+
+def get_price_book():
+    """
+    Возвращает справочник тарифов для текущей версии.
+
+    Новый справочник собирается целиком и только затем подменяет старый,
+    поэтому параллельные расчеты всегда видят согласованный снимок.
+    Справочник собирается заново при смене версии тарифов в БД и при смене
+    периода действия тарифов. Версия справочника включает границу периода:
+    расчеты и токены прежнего периода не используются, а версия в БД
+    меняется только записью тарифов (сигналы, load_pricing_data).
+    """
+    global _price_book
+
+    version = get_tariff_version()
+    book = _price_book
+    if book is not None and book.tariff_version == version and not book.is_expired():
+        return book
+
+    with _price_book_lock:
+        book = _price_book
+        if book is None or book.tariff_version != version or book.is_expired():
+            book = PriceBook.load(version=version)
+            if book.valid_until is not None:
+                # Одинакова во всех процессах, собравших справочник в этом периоде
+                book.version = f'{version}:{int(book.valid_until.timestamp())}'
+            _price_book = book
+            logger.info(f"Price book rebuilt for tariff version {book.version}")
+        return book
+
+
+def price_book_at(at):
+    """Справочник тарифов, действовавших в момент at (без кеширования)"""
+    return PriceBook.load(version=f'at:{at.isoformat()}', at=at)
+
+
+class PriceHistory:
+    """
+    Все периоды действия тарифов в памяти.
+
+    Границы периодов (valid_from / valid_to) отсортированы, период момента
+    времени находится бинарным поиском, справочник периода собирается при
+    первом обращении. Загрузка - три запроса независимо от числа заказов.
+    """
+
+    def __init__(self, tariffs, services, client_rates=()):
+        self._tariffs = tariffs
+        self._services = services
+        # Индивидуальные цены не имеют периода действия - действующие применяются во всех периодах
+        self._client_rates = client_rates
+        self._bounds = sorted({
+            bound for valid_from, valid_to, _ in tariffs + services
+            for bound in (valid_from, valid_to) if bound is not None
+        })
+        self._books = {}
+
+    @classmethod
+    def load(cls):
+        return cls(*load_dated_rates(), client_rates=load_client_rates())
+
+    def period(self, at):
+        """Номер периода, в который попадает момент at"""
+        return bisect_right(self._bounds, at)
+
+    def book_at(self, at):
+        index = self.period(at)
+        book = self._books.get(index)
+        if book is None:
+            valid_until = self._bounds[index] if index < len(self._bounds) else None
+            book = self._books[index] = PriceBook(
+                _effective(self._tariffs, at), _effective(self._services, at),
+                version=f'period:{index}', valid_until=valid_until, client_rates=self._client_rates,
+            )
+        return book
@@ -0,0 +1,101 @@
+"""
+Кеш расчетов стоимости для calculate-price/.
+
+Ключ - хеш нормализованного QuoteRequest (услуги отсортированы) и версии
+тарифов, поэтому после изменения тарифов старые записи просто перестают
+использоваться и вытесняются по TTL / LRU бэкенда кеша.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+QUOTE_CACHE_ALIAS = 'quotes'
+
+
+class QuoteCacheStats:
+    """Счетчики попаданий и промахов (в рамках текущего процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+stats = QuoteCacheStats()
+
+
+def get_quote_cache():
+    alias = QUOTE_CACHE_ALIAS if QUOTE_CACHE_ALIAS in settings.CACHES else 'default'
+    return caches[alias]
+
+
+def quote_cache_key(request, version):
+    """
+    Канонический ключ расчета: не зависит от порядка услуг и формата формы.
+
+    В ключ входят только параметры, влияющие на цену: спецификация коробок
+    учитывается лишь при наличии коробок, тип груза - лишь когда количество
+    не указано. Вес входит в ключ, так как от него зависят ступени тарифов,
+    карты клиента - только если у клиента есть индивидуальные цены.
+    """
+    canonical = [
+        request.warehouse_id,
+        request.box_count,
+        request.pallet_count,
+        request.box_spec if request.box_count else None,
+        request.pallet_spec if request.pallet_count else None,
+        request.cargo_type if not (request.box_count or request.pallet_count) else None,
+        sorted(str(service_id) for service_id in request.service_ids),
+        str(request.weight.normalize()) if request.weight is not None else None,
+        list(request.client or ()),
+    ]
+    digest = hashlib.sha1(json.dumps(canonical, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f'quote:{version}:{digest}'
+
+
+def get_or_calculate_quote(book, request):
+    """Возвращает Quote из кеша или рассчитывает и сохраняет его"""
+    cache = get_quote_cache()
+    key = quote_cache_key(request, book.version)
+
+    quote = cache.get(key)
+    stats.record(quote is not None)
+    if quote is None:
+        quote = book.quote(request)
+        cache.set(key, quote)
+    return quote
+
+
+def cache_info():
+    """Статистика и параметры кеша для подбора его размера"""
+    alias = QUOTE_CACHE_ALIAS if QUOTE_CACHE_ALIAS in settings.CACHES else 'default'
+    config = settings.CACHES[alias]
+    return {
+        **stats.as_dict(),
+        'backend': config.get('BACKEND'),
+        'timeout': config.get('TIMEOUT', 300),
+        'max_entries': config.get('OPTIONS', {}).get('MAX_ENTRIES', 300),
+    }
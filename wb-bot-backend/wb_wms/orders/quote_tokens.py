@@ -0,0 +1,88 @@
+"""
+Подписанные токены расчета стоимости.
+
+calculate-price/ возвращает токен с подписанными строками расчета и
+версией тарифов. При создании заказа с действующим токеном стоимость
+берется из токена, если версия тарифов не изменилась и параметры заказа
+совпадают с рассчитанными.
+
+Калькулятор передает вес груза (от него зависят ступени тарифов), а форма
+заказа - нет. Заказ без веса принимает токен, рассчитанный с весом, при
+совпадении остальных параметров; вес из токена сохраняется в заказе
+(Quote.weight), чтобы последующие пересчеты выбирали те же ступени.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+
+from .pricing import Quote, QuoteLine, get_price_book, parse_quote_request
+from .quote_cache import quote_cache_key
+
+logger = logging.getLogger(__name__)
+
+QUOTE_TOKEN_SALT = 'orders.quote'
+DECIMAL_LINE_FIELDS = ('base_price', 'unit_price', 'total')
+
+
+def make_quote_token(quote, request):
+    """Подписывает строки расчета вместе с ключом запроса и версией тарифов"""
+    payload = {
+        'key': quote_cache_key(request, quote.version),
+        'version': quote.version,
+        'weight': str(request.weight) if request.weight is not None else None,
+        'lines': [
+            [str(value) if field in DECIMAL_LINE_FIELDS else value for field, value in line._asdict().items()]
+            for line in quote.lines
+        ],
+    }
+    if request.weight is not None:
+        payload['unweighted_key'] = quote_cache_key(request._replace(weight=None), quote.version)
+    return signing.dumps(payload, salt=QUOTE_TOKEN_SALT, compress=True)
+
+
+def load_quote_token(token, request, version):
+    """
+    Восстанавливает Quote из токена.
+
+    Возвращает None, если токен поддельный, просрочен, выписан для другой
+    версии тарифов или для других параметров заказа. Запрос без веса
+    сравнивается с параметрами токена без учета веса.
+    """
+    if not token:
+        return None
+    try:
+        payload = signing.loads(
+            token, salt=QUOTE_TOKEN_SALT, max_age=getattr(settings, 'QUOTE_TOKEN_MAX_AGE', 900)
+        )
+    except signing.BadSignature as e:
+        logger.info(f"Rejected quote token: {str(e)}")
+        return None
+
+    key = quote_cache_key(request, version)
+    if payload.get('key') != key and not (request.weight is None and payload.get('unweighted_key') == key):
+        logger.info("Quote token does not match current tariffs or order parameters")
+        return None
+
+    lines = []
+    for values in payload['lines']:
+        line = QuoteLine(*values)
+        lines.append(line._replace(**{field: Decimal(getattr(line, field)) for field in DECIMAL_LINE_FIELDS}))
+    weight = payload.get('weight')
+    return Quote(lines, payload['version'], Decimal(weight) if weight is not None else None)
+
+
+def resolve_order_quote(data, book=None, user=None):
+    """
+    Стоимость заказа: из токена quoteToken, если он действителен, иначе расчет по тарифам.
+
+    user - клиент из запроса (для индивидуальных цен). Возвращает (quote, from_token).
+    """
+    if book is None:
+        book = get_price_book()
+    request = parse_quote_request(data, client=book.client_for(user))
+    quote = load_quote_token(data.get('quoteToken') or data.get('quote_token'), request, book.version)
+    if quote is not None:
+        return quote, True
+    return book.quote(request), False
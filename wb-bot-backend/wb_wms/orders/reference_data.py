@@ -0,0 +1,230 @@
+"""
+Справочники для мини-приложения: склады, маркетплейсы со складами, типы
+контейнеров, дополнительные услуги и все они одним ответом (bootstrap).
+
+Ответ собирается один раз, сериализуется в байты (и сжимается gzip) и
+хранится в кеше вместе с ETag (хеш содержимого). Повторные запросы отдают
+готовые байты, а клиент с If-None-Match получает 304 без тела.
+
+Ключ кеша включает версии исходных данных справочника (orders.data_versions,
+общие для всех процессов): сигналы post_save / post_delete (signals.py) меняют
+версию в той же транзакции, что и данные, и следующий запрос собирает
+справочник заново. Ответ, собранный во время изменения, остается под старым
+ключом и не подменяет новый. Bootstrap зависит еще и от версии тарифов.
+
+Правки в обход сигналов (QuerySet.update, bulk_create, SQL) версию не меняют,
+поэтому ответ живет в кеше не дольше REFERENCE_CACHE_TTL; список услуг - еще и
+только до ближайшего начала или окончания действия какой-либо услуги.
+"""
+import gzip
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, Q
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from .data_versions import bump_version, get_version
+from .models import AdditionalService, Container, Marketplace, Warehouse
+from .pricing import TARIFFS, get_price_book
+from .serializers import WarehouseSerializer
+
+WAREHOUSES = 'warehouses'
+MARKETPLACES = 'marketplaces'
+CONTAINER_TYPES = 'container_types'
+ADDITIONAL_SERVICES = 'additional_services'
+BOOTSTRAP = 'bootstrap'
+
+# Меньшие ответы не сжимаются (как в GZipMiddleware)
+GZIP_MIN_LENGTH = 200
+GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def build_warehouses():
+    warehouses = Warehouse.objects.select_related('marketplace', 'city')
+    return WarehouseSerializer(warehouses, many=True).data, None
+
+
+def build_marketplaces():
+    """Маркетплейсы с вложенными складами (/orders/marketplaces/with_warehouses/)"""
+    marketplaces = Marketplace.objects.prefetch_related(
+        Prefetch('warehouse_set', queryset=Warehouse.objects.select_related('city'))
+    )
+    data = [{
+        'id': marketplace.id,
+        'name': marketplace.name,
+        'warehouses': [{
+            'id': w.id,
+            'name': w.name,
+            'city': w.city.name
+        } for w in marketplace.warehouse_set.all()]
+    } for marketplace in marketplaces]
+    return data, None
+
+
+def build_container_types():
+    data = {
+        'box_sizes': [{'id': size[0], 'label': size[1]} for size in Container.BOX_SIZES],
+        'pallet_weights': [{'id': weight[0], 'label': weight[1]} for weight in Container.PALLET_WEIGHT],
+        'container_types': [{'id': type[0], 'label': type[1]} for type in Container.CONTAINER_TYPES],
+    }
+    return data, None
+
+
+def load_services(now):
+    """
+    Действующие в момент now услуги (в порядке каталога) и ближайшее начало
+    или окончание действия какой-либо услуги - одним запросом
+    """
+    # Уже закрытые услуги не читаем; будущие нужны для времени следующего изменения
+    services = AdditionalService.objects.filter(is_active=True).filter(Q(valid_to__isnull=True) | Q(valid_to__gt=now))
+    effective, changes = [], []
+    for service in services:
+        if service.valid_from <= now:
+            effective.append(service)
+        changes.extend(bound for bound in (service.valid_from, service.valid_to) if bound is not None and bound > now)
+    return effective, min(changes, default=None)
+
+
+def group_services(services):
+    """Услуги по группам типов в порядке SERVICE_TYPES, услуги без типа - последней группой"""
+    groups = {}
+    for service in services:
+        groups.setdefault(service.service_type, []).append({
+            'id': service.id,
+            'name': service.name,
+            'price': f"{service.price} ₽",
+            'requires_location': service.requires_location,
+            'description': service.description
+        })
+
+    service_groups = [
+        {'title': type_display, 'services': groups[service_type]}
+        for service_type, type_display in AdditionalService.SERVICE_TYPES if service_type in groups
+    ]
+    if None in groups:
+        service_groups.append({'title': 'Другие услуги', 'services': groups[None]})
+    return service_groups
+
+
+def build_additional_services():
+    """Действующие услуги, сгруппированные по типам (одним запросом)"""
+    services, valid_until = load_services(timezone.now())
+    return {'serviceGroups': group_services(services)}, valid_until
+
+
+def services_delta(updated_since):
+    """
+    Изменения каталога услуг с момента updated_since (одним запросом).
+
+    serviceGroups - действующие услуги, измененные или вступившие в действие
+    после updated_since; service_ids - id всех действующих услуг (услуги, которых
+    в нем нет, клиент удаляет: так учитываются и удаленные, и завершившиеся);
+    updated_at - значение updated_since для следующего запроса.
+    """
+    now = timezone.now()
+    services, _ = load_services(now)
+    changed = [
+        service for service in services
+        if service.updated_at > updated_since or service.valid_from > updated_since
+    ]
+    return {
+        'serviceGroups': group_services(changed),
+        'service_ids': sorted(service.id for service in services),
+        'updated_at': now,
+    }
+
+
+def build_bootstrap():
+    """Все справочники калькулятора и версия тарифов - одним ответом"""
+    marketplaces, _ = build_marketplaces()
+    container_types, _ = build_container_types()
+    additional_services, valid_until = build_additional_services()
+    return {
+        'tariff_version': get_price_book().version,
+        'marketplaces': marketplaces,
+        'container_types': container_types,
+        'additional_services': additional_services,
+    }, valid_until
+
+
+BUILDERS = {
+    WAREHOUSES: build_warehouses,
+    MARKETPLACES: build_marketplaces,
+    CONTAINER_TYPES: build_container_types,
+    ADDITIONAL_SERVICES: build_additional_services,
+    BOOTSTRAP: build_bootstrap,
+}
+
+# Данные, при изменении которых справочник собирается заново
+SOURCES = {
+    WAREHOUSES: (WAREHOUSES,),
+    MARKETPLACES: (WAREHOUSES,),
+    CONTAINER_TYPES: (),
+    ADDITIONAL_SERVICES: (ADDITIONAL_SERVICES,),
+    BOOTSTRAP: (WAREHOUSES, ADDITIONAL_SERVICES, TARIFFS),
+}
+
+
+def _generation(name):
+    # Версия справочника тарифов меняется и на границе периода действия тарифов
+    return get_version(f'reference:{name}') if name != TARIFFS else get_price_book().version
+
+
+def invalidate_reference_data(*sources):
+    """
+    Помечает данные как измененные (в текущей транзакции); зависящие от них
+    справочники всех процессов соберутся заново
+    """
+    bump_version(*(f'reference:{name}' for name in sources))
+
+
+def _cache_ttl():
+    return getattr(settings, 'REFERENCE_CACHE_TTL', 300)
+
+
+def get_rendered(name):
+    """Готовый ответ справочника: (JSON в байтах, сжатый JSON или None, ETag)"""
+    generations = ':'.join(_generation(source) for source in SOURCES[name])
+    key = f'orders:reference:{name}:{generations}'
+    entry = cache.get(key)
+    if entry is None:
+        data, valid_until = BUILDERS[name]()
+        body = JSONRenderer().render(data)
+        compressed = gzip.compress(body, mtime=0) if len(body) >= GZIP_MIN_LENGTH else None
+        entry = (body, compressed, hashlib.sha256(body).hexdigest())
+        timeout = _cache_ttl()
+        if valid_until is not None:
+            timeout = min(timeout, max((valid_until - timezone.now()).total_seconds(), 1))
+        cache.set(key, entry, timeout)
+    return entry
+
+
+def reference_response(request, name):
+    """
+    Ответ справочника из кеша; 304, если ETag совпадает с If-None-Match.
+
+    Клиенту, принимающему gzip, отдается сжатое представление со своим ETag.
+    Cache-Control: no-cache - клиент хранит ответ, но каждый раз сверяет
+    его ETag с сервером.
+    """
+    body, compressed, digest = get_rendered(name)
+    gzipped = compressed is not None and GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    etag = f'"{digest}-gzip"' if gzipped else f'"{digest}"'
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    elif gzipped:
+        response = HttpResponse(compressed, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
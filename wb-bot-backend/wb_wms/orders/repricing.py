@@ -0,0 +1,227 @@
+"""
+Оценка выручки при изменении тарифов (what-if).
+
+Исторические заказы читаются столбцами (values_list + iterator), заказы
+с одинаковыми параметрами расчета группируются, и каждая уникальная
+комбинация рассчитывается один раз по текущему и по черновому
+справочнику тарифов.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Order, OrderLine, Pricing, AdditionalService
+from .pricing import PriceBook, PriceHistory, Tariff, ServiceRate, load_client_rates, order_quote_request
+
+PRICING_DEFAULTS = {
+    'name': '',
+    'specification': None,
+    'warehouse_id': None,
+    'base_price': Decimal('0.00'),
+    'unit_price': Decimal('0.00'),
+    'tier_basis': None,
+    'tier_from': None,
+    'step_size': None,
+    'is_active': True,
+}
+
+SERVICE_DEFAULTS = {
+    'name': '',
+    'price': Decimal('0.00'),
+    'service_type': None,
+    'requires_location': False,
+    'tiered': False,
+    'is_active': True,
+}
+
+
+def _pricing_key(row):
+    """
+    Ключ тарифа: ступень - (тип, склад, основание, граница ступени),
+    обычный тариф - (тип, спецификация, склад)
+    """
+    if row.get('tier_basis') and row.get('tier_from') is not None:
+        return (row['pricing_type'], row.get('warehouse_id'), row['tier_basis'], row['tier_from'])
+    return (row['pricing_type'], row.get('specification'), row.get('warehouse_id'))
+
+
+def _apply_changes(rows, changes, defaults, decimal_fields, key=None):
+    """
+    Применяет изменения черновика к строкам справочника.
+
+    Изменение с существующим id правит строку, без id - добавляет новую.
+    Новая строка заменяет строки с тем же ключом (key): иначе, например,
+    ступень с той же границей осталась бы в справочнике рядом с новой, и
+    выбор между ними зависел бы от порядка строк, а не от черновика.
+    """
+    new_id = 0
+    for change in changes:
+        change = dict(change)
+        if 'warehouse' in change:
+            change['warehouse_id'] = change.pop('warehouse')
+        for field in decimal_fields:
+            if change.get(field) is not None:
+                change[field] = Decimal(str(change[field]))
+
+        row_id = change.get('id')
+        if row_id in rows:
+            rows[row_id].update(change)
+        else:
+            new_id -= 1
+            row = {**defaults, **change, 'id': new_id}
+            if key is not None:
+                for superseded in [other for other, existing in rows.items() if key(existing) == key(row)]:
+                    del rows[superseded]
+            rows[new_id] = row
+    return rows
+
+
+def build_draft_book(draft):
+    """
+    Справочник действующих тарифов с примененными изменениями черновика
+    и действующими индивидуальными ценами клиентов.
+
+    Формат черновика:
+        {"pricing": [{"id": 3, "base_price": "2600"},
+                     {"pricing_type": "delivery", "warehouse": 2, "base_price": "3100"},
+                     {"id": 9, "is_active": false}],
+         "services": [{"id": 1, "price": "800"}]}
+    """
+    tariffs = {
+        row['id']: row for row in Pricing.objects.effective_at().values(
+            'id', 'name', 'pricing_type', 'specification', 'warehouse_id', 'base_price', 'unit_price',
+            'tier_basis', 'tier_from', 'step_size', 'is_active'
+        )
+    }
+    services = {
+        row['id']: row for row in AdditionalService.objects.effective_at().values(
+            'id', 'name', 'price', 'service_type', 'requires_location', 'tiered', 'is_active'
+        )
+    }
+    _apply_changes(tariffs, draft.get('pricing', []), PRICING_DEFAULTS,
+                   ('base_price', 'unit_price', 'tier_from', 'step_size'), key=_pricing_key)
+    _apply_changes(services, draft.get('services', []), SERVICE_DEFAULTS, ('price',))
+
+    return PriceBook(
+        [Tariff(**{f: row[f] for f in Tariff._fields}) for row in tariffs.values() if row['is_active']],
+        [ServiceRate(**{f: row[f] for f in ServiceRate._fields}) for row in services.values() if row['is_active']],
+        version='draft',
+        client_rates=load_client_rates(),
+    )
+
+
+class RepricingReport:
+    """
+    Выручка по текущим и черновым тарифам в разрезе склада, типа груза и месяца
+    """
+
+    GROUPINGS = ('warehouse', 'cargo_type', 'month')
+
+    def __init__(self):
+        self.orders = 0
+        self.current = Decimal('0.00')
+        self.draft = Decimal('0.00')
+        self.groups = {grouping: defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')]) for grouping in self.GROUPINGS}
+
+    @property
+    def delta(self):
+        return self.draft - self.current
+
+    def add(self, keys, count, current, draft):
+        self.orders += count
+        self.current += current
+        self.draft += draft
+        for grouping, key in zip(self.GROUPINGS, keys):
+            bucket = self.groups[grouping][key]
+            bucket[0] += count
+            bucket[1] += current
+            bucket[2] += draft
+
+    def rows(self, grouping):
+        """Строки (ключ, заказов, текущая выручка, новая выручка, разница)"""
+        return [
+            (key, count, current, draft, draft - current)
+            for key, (count, current, draft) in sorted(self.groups[grouping].items(), key=lambda item: str(item[0]))
+        ]
+
+    def as_dict(self):
+        return {
+            'orders': self.orders,
+            'current': str(self.current),
+            'draft': str(self.draft),
+            'delta': str(self.delta),
+            **{
+                grouping: [
+                    {'key': key, 'orders': count, 'current': str(current), 'draft': str(draft), 'delta': str(delta)}
+                    for key, count, current, draft, delta in self.rows(grouping)
+                ]
+                for grouping in self.GROUPINGS
+            }
+        }
+
+
+def reprice_orders(draft_book, queryset=None, history=None, chunk_size=2000):
+    """
+    Пересчитывает заказы по черновому справочнику и сравнивает с текущей выручкой.
+
+    Текущая выручка берется из сохраненных строк заказа (OrderLine); заказы
+    без строк (созданные до их появления) считаются по тарифам, действовавшим
+    на момент создания заказа. Заказы клиентов с индивидуальными ценами
+    считаются по их ценам в обоих справочниках.
+    """
+    if queryset is None:
+        queryset = Order.objects.all()
+    if history is None:
+        history = PriceHistory.load()
+
+    # Услуги всех заказов одним запросом к промежуточной таблице
+    order_services = defaultdict(list)
+    through = Order.services.through
+    for order_id, service_id in through.objects.filter(order__in=queryset).values_list('order_id', 'additionalservice_id'):
+        order_services[order_id].append(service_id)
+
+    # Сохраненные суммы заказов одним GROUP BY
+    stored_totals = dict(
+        OrderLine.objects.filter(order__in=queryset).order_by().values('order_id')
+        .annotate(amount=Sum('total')).values_list('order_id', 'amount')
+    )
+
+    # (параметры расчета, месяц, период тарифов) -> [заказов, сохраненная выручка, заказов без строк, момент в периоде]
+    groups = defaultdict(lambda: [0, Decimal('0.00'), 0, None])
+    rows = queryset.order_by().values_list(
+        'id', 'warehouse_id', 'cargo_type', 'container_type', 'box_count', 'pallet_count',
+        'weight', 'additional_services', 'created_at', 'user_id', 'user__company_name'
+    ).iterator(chunk_size=chunk_size)
+    for (order_id, warehouse_id, cargo_type, container_type, box_count, pallet_count, weight,
+         legacy_services, created_at, user_id, company) in rows:
+        service_ids = tuple(legacy_services or []) + tuple(sorted(order_services.get(order_id, ())))
+        # Клиенты без индивидуальных цен (client=None) считаются вместе с остальными
+        client = draft_book.client_for_keys(user_id, company) if user_id else None
+        params = (warehouse_id, cargo_type, container_type, box_count, pallet_count, service_ids, weight, client)
+        month = timezone.localtime(created_at).strftime('%Y-%m')
+        group = groups[(params, month, history.period(created_at))]
+        group[0] += 1
+        group[3] = created_at
+        if order_id in stored_totals:
+            group[1] += stored_totals[order_id]
+        else:
+            group[2] += 1
+
+    current_prices = {}
+    draft_prices = {}
+    report = RepricingReport()
+    for (params, month, period), (count, stored, unstored, created_at) in groups.items():
+        if params not in draft_prices:
+            draft_prices[params] = draft_book.quote(order_quote_request(*params)).total
+        current = Decimal('0.00')
+        if unstored:
+            if (params, period) not in current_prices:
+                book = history.book_at(created_at)
+                current_prices[(params, period)] = book.quote(order_quote_request(*params)).total
+            current = current_prices[(params, period)]
+        warehouse_id, cargo_type = params[0], params[1]
+        report.add((warehouse_id, cargo_type, month), count, stored + current * unstored, draft_prices[params] * count)
+
+    return report
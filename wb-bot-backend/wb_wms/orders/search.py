@@ -0,0 +1,214 @@
+"""
+Полнотекстовый поиск заказов: имя клиента, компания, телефон (в том числе
+фрагмент номера), email, адрес забора груза.
+
+SQLite: виртуальная таблица FTS5 orders_order_fts с триграммным токенизатором
+(поиск подстроки в любом месте слова, без учета регистра, в том числе
+кириллицы). Таблица заполняется триггерами на orders_order, поэтому индекс
+актуален при любой записи заказа - через ORM, QuerySet.update() и пакетные
+INSERT из order_writer. Ранжирование - bm25().
+
+PostgreSQL: GIN-индекс по выражению to_tsvector('simple', ...) (поддерживается
+самой СУБД) и триграммный индекс pg_trgm по цифрам телефона. Ранжирование -
+ts_rank().
+
+Индекс создается миграцией 0015_order_search_index (create_search_index).
+"""
+import re
+import uuid
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+
+from .models import Order
+
+SEARCH_RESULTS_LIMIT = 20
+MAX_SEARCH_RESULTS = 100
+# Триграммный индекс находит подстроки не короче трех символов
+MIN_TERM_LENGTH = 3
+# Сколько последних совпадений ранжируется в SQLite (bm25 считается для каждого)
+RANK_WINDOW = 1000
+
+FTS_TABLE = 'orders_order_fts'
+SEARCH_COLUMNS = ('client_name', 'company', 'phone_number', 'email', 'pickup_address')
+
+# Запрос из одних цифр и разделителей номера - поиск по телефону
+PHONE_QUERY_RE = re.compile(r'^[\d\s()+\-.]+$')
+TERM_STRIP = ',.;:!?"\'«»()'
+
+
+def _sqlite_digits(column):
+    """Цифры телефона средствами SQL (в триггерах SQLite нет регулярных выражений)"""
+    expression = column
+    for separator in (' ', '-', '(', ')', '+', '.'):
+        expression = f"replace({expression}, '{separator}', '')"
+    return expression
+
+
+def _sqlite_values(row):
+    return ', '.join([f'{row}.id', *(f'{row}.{column}' for column in SEARCH_COLUMNS),
+                      _sqlite_digits(f'{row}.phone_number')])
+
+
+# Строка индекса ищется по id заказа: колонка order_id тоже проиндексирована
+SQLITE_ROW_LOOKUP = (
+    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH 'order_id : \"' || old.id || '\"' "
+    f"AND order_id = old.id"
+)
+
+SQLITE_COLUMNS = ', '.join(['order_id', *SEARCH_COLUMNS, 'phone_digits'])
+
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({SQLITE_COLUMNS}, tokenize = 'trigram case_sensitive 0')",
+    f"INSERT INTO {FTS_TABLE} ({SQLITE_COLUMNS}) SELECT {_sqlite_values('orders_order')} FROM orders_order",
+    f"""CREATE TRIGGER orders_order_fts_insert AFTER INSERT ON orders_order BEGIN
+        INSERT INTO {FTS_TABLE} ({SQLITE_COLUMNS}) VALUES ({_sqlite_values('new')});
+    END""",
+    f"""CREATE TRIGGER orders_order_fts_update AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON orders_order BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN ({SQLITE_ROW_LOOKUP});
+        INSERT INTO {FTS_TABLE} ({SQLITE_COLUMNS}) VALUES ({_sqlite_values('new')});
+    END""",
+    f"""CREATE TRIGGER orders_order_fts_delete AFTER DELETE ON orders_order BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN ({SQLITE_ROW_LOOKUP});
+    END""",
+]
+
+SQLITE_DROP_SQL = [
+    'DROP TRIGGER IF EXISTS orders_order_fts_insert',
+    'DROP TRIGGER IF EXISTS orders_order_fts_update',
+    'DROP TRIGGER IF EXISTS orders_order_fts_delete',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_DOCUMENT = (
+    "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS) + ")"
+)
+POSTGRES_DIGITS = r"regexp_replace(phone_number, '\D', '', 'g')"
+
+POSTGRES_INDEX_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX orders_order_search_idx ON orders_order USING gin ({POSTGRES_DOCUMENT})',
+    f'CREATE INDEX orders_order_phone_trgm_idx ON orders_order USING gin ({POSTGRES_DIGITS} gin_trgm_ops)',
+]
+
+POSTGRES_DROP_SQL = [
+    'DROP INDEX IF EXISTS orders_order_search_idx',
+    'DROP INDEX IF EXISTS orders_order_phone_trgm_idx',
+]
+
+
+def search_index_exists(db=connection):
+    if db.vendor == 'sqlite':
+        return FTS_TABLE in db.introspection.table_names()
+    if db.vendor == 'postgresql':
+        with db.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'orders_order_search_idx'")
+            return cursor.fetchone() is not None
+    return False
+
+
+def create_search_index(db=connection):
+    """Создает поисковый индекс и заполняет его существующими заказами"""
+    statements = {'sqlite': SQLITE_INDEX_SQL, 'postgresql': POSTGRES_INDEX_SQL}.get(db.vendor)
+    if statements is None or search_index_exists(db):
+        return
+    with db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_search_index(db=connection):
+    statements = {'sqlite': SQLITE_DROP_SQL, 'postgresql': POSTGRES_DROP_SQL}.get(db.vendor, [])
+    with db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def parse_search_query(query):
+    """
+    Разбирает строку поиска: ('phone', цифры) или ('text', [слова]).
+
+    Слова короче MIN_TERM_LENGTH отбрасываются; если не осталось ни одного -
+    ValidationError (400).
+    """
+    query = (query or '').strip()
+    if PHONE_QUERY_RE.match(query):
+        digits = re.sub(r'\D', '', query)
+        if len(digits) >= MIN_TERM_LENGTH:
+            return 'phone', digits
+    terms = [term.strip(TERM_STRIP) for term in query.split()]
+    terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        raise ValidationError({'q': f'Search query must contain a word of at least {MIN_TERM_LENGTH} characters'})
+    return 'text', terms
+
+
+def _sqlite_match(kind, value):
+    if kind == 'phone':
+        return f'phone_digits : "{value}"'
+    phrases = ' AND '.join('"' + term.replace('"', '""') + '"' for term in value)
+    return f"{{order_id {' '.join(SEARCH_COLUMNS)}}} : ({phrases})"
+
+
+def _postgres_tsquery(terms):
+    lexemes = [re.sub(r"[^\w@.\-]", '', term) for term in terms]
+    return ' & '.join(f"'{lexeme}':*" for lexeme in lexemes if lexeme)
+
+
+def _search_sql(query, ranked):
+    """SQL выборки (id, rank) найденных заказов; ranked - с сортировкой по релевантности"""
+    kind, value = parse_search_query(query)
+    if connection.vendor == 'sqlite':
+        match = _sqlite_match(kind, value)
+        sql = f"SELECT order_id AS id, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        if not ranked:
+            return sql, [match]
+        # Ранжируются RANK_WINDOW последних совпадений: частое слово не сортирует весь индекс
+        sql += (
+            f" AND rowid >= coalesce((SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+            f" ORDER BY rowid DESC LIMIT 1 OFFSET {RANK_WINDOW}), 0) ORDER BY rank, rowid DESC"
+        )
+        return sql, [match, match]
+    if connection.vendor == 'postgresql':
+        if kind == 'phone':
+            sql = f"SELECT id, 1 AS rank FROM orders_order WHERE {POSTGRES_DIGITS} LIKE %s"
+            return sql + (' ORDER BY created_at DESC' if ranked else ''), [f'%{value}%']
+        tsquery = _postgres_tsquery(value)
+        if not tsquery:
+            raise ValidationError({'q': 'Search query has no searchable words'})
+        sql = (
+            f"SELECT id, ts_rank({POSTGRES_DOCUMENT}, to_tsquery('simple', %s)) AS rank FROM orders_order "
+            f"WHERE {POSTGRES_DOCUMENT} @@ to_tsquery('simple', %s)"
+        )
+        return sql + (' ORDER BY rank DESC, created_at DESC' if ranked else ''), [tsquery, tsquery]
+    raise NotImplementedError(f'Order search is not implemented for {connection.vendor}')
+
+
+def _order_id(query):
+    try:
+        return uuid.UUID((query or '').strip())
+    except ValueError:
+        return None
+
+
+def search_queryset(queryset, query):
+    """Заказы queryset, найденные по индексу (без ранжирования) - для админки и фильтров"""
+    order_id = _order_id(query)
+    if order_id is not None:
+        return queryset.filter(pk=order_id)
+    sql, params = _search_sql(query, ranked=False)
+    return queryset.filter(pk__in=RawSQL(f'SELECT id FROM ({sql}) AS found', params))
+
+
+def search_orders(queryset, query, limit=SEARCH_RESULTS_LIMIT):
+    """Найденные заказы в порядке релевантности: [(заказ, rank)]"""
+    order_id = _order_id(query)
+    if order_id is not None:
+        return [(order, 0) for order in queryset.filter(pk=order_id)]
+    sql, params = _search_sql(query, ranked=True)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} LIMIT %s', [*params, limit])
+        found = [(Order._meta.pk.to_python(pk), rank) for pk, rank in cursor.fetchall()]
+    orders = queryset.in_bulk([pk for pk, _ in found])
+    return [(orders[pk], rank) for pk, rank in found if pk in orders]
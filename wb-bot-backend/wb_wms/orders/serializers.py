@@ -1,9 +1,12 @@
 from rest_framework import serializers
-from .models import Order, Warehouse, Container, Marketplace, City, User, Pricing, AdditionalService
+from .models import Order, OrderLine, Warehouse, Container, Marketplace, City, User, Pricing, AdditionalService
+from .pricing import parse_quote_request
+from .quote_tokens import resolve_order_quote
+from .order_writer import write_order
 from rest_framework.response import Response
 from rest_framework import status
 from decimal import Decimal
-from django.db import connection
+from django.db import DatabaseError, connection
 from django.utils import timezone
 import uuid
 import json
@@ -28,7 +31,17 @@ class WarehouseSerializer(serializers.ModelSerializer):
         return Response(serializer.data)
     
     
+class OrderLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderLine
+        fields = ['id', 'kind', 'pricing', 'service', 'name', 'quantity', 'base_price', 'unit_price', 'total']
+
+
+PALLET_WEIGHTS = frozenset(weight for weight, _ in Container.PALLET_WEIGHT)
+
+
 class OrderSerializer(serializers.ModelSerializer):
+    lines = OrderLineSerializer(many=True, read_only=True)
     containers_info = serializers.SerializerMethodField()
     client_info = serializers.SerializerMethodField()
 
@@ -37,151 +50,65 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('created_at',)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Загружает связи, которые читает сериализатор: клиент - в том же
+        запросе, строки расчета и услуги - по одному запросу на все заказы
+        """
+        return queryset.select_related('user').prefetch_related('lines', 'services')
+
     def get_containers_info(self, obj):
-        if isinstance(obj, Order):
-            return [
-                {
-                    'type': container.container_type,
-                    'size': container.box_size if container.container_type == "Коробка" else container.pallet_weight,
-                    'quantity': container.quantity
-                }
-                for container in obj.containers.all()
-            ]
+        # Груз хранится в полях самого заказа (отдельной связи с Container нет)
+        if not isinstance(obj, Order):
+            return []
+        if obj.cargo_type == 'box':
+            return [{'type': 'Коробка', 'size': obj.container_type, 'quantity': obj.box_count or 0}]
+        if obj.cargo_type == 'pallet':
+            return [{'type': 'Паллета', 'size': obj.container_type, 'quantity': obj.pallet_count or 0}]
+        if obj.cargo_type == 'mixed':
+            # Коробки и паллеты вместе; единственная спецификация заказа относится к своему типу груза
+            pallet_size = obj.container_type in PALLET_WEIGHTS
+            containers = []
+            if obj.box_count:
+                containers.append({'type': 'Коробка', 'size': None if pallet_size else obj.container_type,
+                                   'quantity': obj.box_count})
+            if obj.pallet_count:
+                containers.append({'type': 'Паллета', 'size': obj.container_type if pallet_size else None,
+                                   'quantity': obj.pallet_count})
+            return containers
         return []
 
     def get_client_info(self, obj):
-        if isinstance(obj, Order):
+        if not isinstance(obj, Order):
+            return {}
+        # Клиент с учетной записью - из профиля (загружен select_related), иначе из полей заказа
+        if obj.user_id:
             return {
-                'company_name': obj.user_id.company_name,
-                'client_name': obj.user_id.username,
-                'email': obj.user_id.email,
-                'phone': obj.user_id.phone
+                'company_name': obj.user.company_name,
+                'client_name': obj.user.username,
+                'email': obj.user.email,
+                'phone': obj.user.phone
             }
-        return {}
+        return {
+            'company_name': obj.company or '',
+            'client_name': obj.client_name,
+            'email': obj.email or '',
+            'phone': obj.phone_number
+        }
 
     def to_internal_value(self, data):
         return data
 
+    def _request_user(self):
+        # Клиент из запроса или явно переданный (обработчик очереди заявок)
+        user = self.context.get('user') or getattr(self.context.get('request'), 'user', None)
+        return user if user is not None and user.is_authenticated else None
+
     def calculate_order_price(self, data):
-        """Рассчитать стоимость заказа"""
-        total_price = Decimal('0.00')
-        
-        # Извлекаем данные
-        delivery_data = data.get('delivery', {})
-        cargo_type_data = data.get('cargoType', {})
-        additional_services = data.get('additionalServices', [])
-        
-        # 1. Расчет стоимости доставки
-        if delivery_data and 'warehouse' in delivery_data:
-            warehouse_id = delivery_data['warehouse']
-            try:
-                # Ищем тариф доставки для выбранного склада
-                delivery_pricing = Pricing.objects.filter(
-                    pricing_type='delivery',
-                    warehouse__id=warehouse_id,
-                    is_active=True
-                ).first()
-                
-                if delivery_pricing:
-                    total_price += delivery_pricing.base_price
-            except Exception:
-                # Если тариф не найден, используем базовую стоимость
-                total_price += Decimal('2000.00')
-        
-        # 2. Расчет стоимости по типу груза
-        if cargo_type_data:
-            # Обработка коробок (всегда обрабатываем, если они есть)
-            if 'quantities' in cargo_type_data and 'Коробка' in cargo_type_data['quantities'] and int(cargo_type_data['quantities']['Коробка']) > 0:
-                # Определяем размер коробки
-                box_size = None
-                if 'selectedBoxSizes' in cargo_type_data and cargo_type_data['selectedBoxSizes']:
-                    box_size = cargo_type_data['selectedBoxSizes'][0]
-                
-                # Получаем количество
-                quantity = int(cargo_type_data['quantities']['Коробка'])
-                
-                if quantity > 0:
-                    # Ищем тариф для коробок указанного размера
-                    box_pricing = None
-                    if box_size:
-                        box_pricing = Pricing.objects.filter(
-                            pricing_type='box',
-                            specification=box_size,
-                            is_active=True
-                        ).first()
-                    
-                    # Если тариф для указанного размера не найден, ищем любой тариф для коробок
-                    if not box_pricing:
-                        box_pricing = Pricing.objects.filter(
-                            pricing_type='box',
-                            is_active=True
-                        ).first()
-                    
-                    if box_pricing:
-                        # Базовая цена + (цена за единицу * количество)
-                        box_cost = box_pricing.base_price + (box_pricing.unit_price * Decimal(quantity))
-                        total_price += box_cost
-                    else:
-                        # Если тариф не найден, используем базовую стоимость
-                        total_price += Decimal('500.00') * Decimal(quantity)
-            
-            # Обработка паллет (всегда обрабатываем, если они есть)
-            if 'quantities' in cargo_type_data and 'Паллета' in cargo_type_data['quantities'] and int(cargo_type_data['quantities']['Паллета']) > 0:
-                # Определяем вес паллеты
-                pallet_weight = None
-                if 'selectedPalletWeights' in cargo_type_data and cargo_type_data['selectedPalletWeights']:
-                    pallet_weight = cargo_type_data['selectedPalletWeights'][0]
-                
-                # Получаем количество
-                quantity = int(cargo_type_data['quantities']['Паллета'])
-                
-                if quantity > 0:
-                    # Ищем тариф для паллет указанного веса
-                    pallet_pricing = None
-                    if pallet_weight:
-                        pallet_pricing = Pricing.objects.filter(
-                            pricing_type='pallet',
-                            specification=pallet_weight,
-                            is_active=True
-                        ).first()
-                    
-                    # Если тариф для указанного веса не найден, ищем любой тариф для паллет
-                    if not pallet_pricing:
-                        pallet_pricing = Pricing.objects.filter(
-                            pricing_type='pallet',
-                            is_active=True
-                        ).first()
-                    
-                    if pallet_pricing:
-                        # Базовая цена + (цена за единицу * количество)
-                        pallet_cost = pallet_pricing.base_price + (pallet_pricing.unit_price * Decimal(quantity))
-                        total_price += pallet_cost
-                    else:
-                        # Если тариф не найден, используем базовую стоимость
-                        total_price += Decimal('2000.00') * Decimal(quantity)
-        
-        # 3. Расчет стоимости дополнительных услуг
-        for service_id in additional_services:
-            # Проверяем, есть ли такая услуга в новой таблице AdditionalService
-            service = AdditionalService.objects.filter(
-                id=service_id,
-                is_active=True
-            ).first()
-            
-            if service:
-                total_price += service.price
-            else:
-                # Если не нашли в новой модели, ищем в старой системе тарифов
-                service_pricing = Pricing.objects.filter(
-                    id=service_id,
-                    is_active=True
-                ).first()
-                
-                if service_pricing:
-                    total_price += service_pricing.base_price
-        
-        # Округляем до 2 знаков после запятой
-        return total_price.quantize(Decimal('0.01'))
+        """Рассчитать стоимость заказа (по токену расчета, если он действителен)"""
+        quote, _ = resolve_order_quote(data, user=self._request_user())
+        return quote.total
 
     def create(self, validated_data):
         try:
@@ -224,11 +151,27 @@ class OrderSerializer(serializers.ModelSerializer):
                 if 'Паллета' in cargo_type_data['quantities']:
                     pallet_count = int(cargo_type_data['quantities']['Паллета'])
             
-            # 4. Рассчитываем стоимость заказа
-            total_price = self.calculate_order_price(validated_data)
+            # Без type (мини-приложение присылает selectedTypes) - тип по количествам, как в расчете
+            if 'type' not in cargo_type_data:
+                quote_request = parse_quote_request(validated_data)
+                cargo_type = quote_request.cargo_type or 'mixed'
+                container_type = quote_request.pallet_spec if cargo_type == 'pallet' else quote_request.box_spec
+            
+            # 4. Рассчитываем стоимость заказа (по токену расчета, если он действителен)
+            user = self._request_user()
+            quote, _ = resolve_order_quote(validated_data, user=user)
+            total_price = quote.total
             
-            # 5. Создаем заказ через ORM
-            order = Order.objects.create(
+            # 5. Дополнительные услуги (только существующие)
+            service_ids = []
+            if additional_services:
+                service_ids = list(AdditionalService.objects.filter(
+                    id__in=[service_id for service_id in additional_services if str(service_id).isdigit()]
+                ).values_list('id', flat=True))
+
+            # 6. Записываем заказ со строками расчета и услугами
+            # Стоимость уже рассчитана по данным формы - повторно не пересчитываем
+            order = Order(
                 status='new',
                 total_price=total_price,
                 warehouse=warehouse,
@@ -236,25 +179,22 @@ class OrderSerializer(serializers.ModelSerializer):
                 container_type=container_type,
                 box_count=box_count,
                 pallet_count=pallet_count,
+                weight=quote.weight,
                 client_name=client_data.get('name', ''),
                 phone_number=client_data.get('phone', ''),
                 company=client_data.get('company', ''),
                 email=client_data.get('email', ''),
-                pickup_address=pickup_address
+                pickup_address=pickup_address,
+                user=user
             )
-            
-            # 6. Добавляем дополнительные услуги, если они есть
-            if additional_services:
-                for service_id in additional_services:
-                    try:
-                        service = AdditionalService.objects.get(id=service_id)
-                        order.services.add(service)
-                    except Exception as e:
-                        print(f"Error adding service {service_id} to order {order.id}: {e}")
+            order = write_order(order, quote, service_ids)
             
             # 7. Возвращаем созданный заказ
             return order
             
+        except DatabaseError:
+            # Сбой базы - не ошибка в данных заказа, запрос можно повторить
+            raise
         except Exception as e:
             import traceback
             print(f"Error creating order: {e}")
@@ -263,10 +203,10 @@ class OrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(f"Failed to create order: {e}")
     
     def update(self, instance, validated_data):
-        # Обновляем только статус, если он передан
+        # Обновляем только статус, если он передан (стоимость не пересчитывается)
         if 'status' in validated_data:
             instance.status = validated_data['status']
-            instance.save()
+            instance.save(update_fields=['status'])
         return instance
     
     def delete(self, instance):
@@ -305,7 +245,7 @@ class PricingSerializer(serializers.ModelSerializer):
         model = Pricing
         fields = ['id', 'name', 'pricing_type', 'specification', 
                   'warehouse', 'warehouse_name', 'base_price', 'unit_price', 
-                  'is_active', 'created_at', 'updated_at']
+                  'tier_basis', 'tier_from', 'step_size', 'is_active', 'valid_from', 'valid_to', 'created_at', 'updated_at']
         read_only_fields = ('created_at', 'updated_at')
 
 class AdditionalServiceSerializer(serializers.ModelSerializer):
@@ -315,7 +255,7 @@ class AdditionalServiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = AdditionalService
         fields = ['id', 'name', 'price', 'service_type', 'service_type_display', 
-                  'requires_location', 'description', 'is_active', 'created_at']
+                  'requires_location', 'tiered', 'description', 'is_active', 'valid_from', 'valid_to', 'created_at']
         read_only_fields = ('created_at',)
     
     
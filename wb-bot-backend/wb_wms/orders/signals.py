@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Order, Pricing, AdditionalService, ClientRate, Warehouse, City, Marketplace
+from .order_stats import order_stats_values, record_order_change
+from .pricing import bump_tariff_version
+from .reference_data import ADDITIONAL_SERVICES, WAREHOUSES, invalidate_reference_data
+
+
+@receiver([post_save, post_delete], sender=Pricing)
+@receiver([post_save, post_delete], sender=AdditionalService)
+@receiver([post_save, post_delete], sender=ClientRate)
+def tariffs_changed(sender, **kwargs):
+    """Меняет версию тарифов в той же транзакции, что и тарифы"""
+    bump_tariff_version()
+
+
+@receiver([post_save, post_delete], sender=Warehouse)
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=Marketplace)
+def warehouses_changed(sender, **kwargs):
+    """Сбрасывает кеш справочника складов (в нем названия городов и маркетплейсов)"""
+    invalidate_reference_data(WAREHOUSES)
+
+
+@receiver([post_save, post_delete], sender=AdditionalService)
+def services_changed(sender, **kwargs):
+    """Сбрасывает кеш справочника дополнительных услуг"""
+    invalidate_reference_data(ADDITIONAL_SERVICES)
+
+
+@receiver(m2m_changed, sender=Order.services.through)
+def order_services_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пересчитывает стоимость заказа при изменении списка услуг"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        if not instance.skip_pricing:
+            instance.update_price()
+    elif pk_set:
+        for order in Order.objects.filter(pk__in=pk_set):
+            order.update_price()
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    """Убирает удаленный заказ из сводки по дням"""
+    record_order_change(order_stats_values(instance), None)
@@ -0,0 +1,1387 @@
+import csv
+import gzip
+import io
+import json
+import re
+import time
+import zipfile
+from datetime import timedelta
+from urllib.parse import urlencode
+from unittest import SkipTest, mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .admin import render_rate_card
+from .data_versions import forget_versions, get_version
+from .intake import process_batch, submit_order
+from .models import (AdditionalService, City, ClientRate, DataVersion, IdempotencyKey, Marketplace,
+                     NotificationOutbox, Order, OrderDailyStats, OrderIntake, OrderLine, Pricing, User, Warehouse)
+from .order_export import CONTENT_TYPES, EXPORT_COLUMNS, export_queryset, iter_rows
+from .order_filters import ORDER_SORTS, filter_orders
+from .order_stats import rebuild_order_stats
+from .order_writer import OrderDraft, write_orders
+from .notifications import CLAIM_TIMEOUT, NotificationDispatcher, enqueue_notification, retry_delay
+from .pagination import KeysetPagination
+from .pricing import TARIFFS, Quote, client_keys, get_price_book, get_tariff_version, parse_quote_request
+from .quote_cache import get_quote_cache, quote_cache_key, stats as quote_cache_stats
+from .quote_tokens import load_quote_token, make_quote_token, resolve_order_quote
+from .repricing import build_draft_book, reprice_orders
+from .search import create_search_index, search_queryset
+from .serializers import OrderSerializer
+
+
+class OrderFixturesMixin:
+    """Склад и быстрая массовая запись заказов для тестов"""
+
+    @classmethod
+    def create_warehouse(cls):
+        marketplace = Marketplace.objects.create(name='Wildberries')
+        city = City.objects.create(name='Москва')
+        return Warehouse.objects.create(name='Коледино', marketplace=marketplace, city=city)
+
+    @classmethod
+    def create_orders(cls, warehouse, count, **fields):
+        fields = {'cargo_type': 'box', 'box_count': 1, 'phone_number': '+70000000000', 'total_price': 100, **fields}
+        return Order.objects.bulk_create([
+            Order(warehouse=warehouse, client_name=f'Клиент {i}', **fields) for i in range(count)
+        ])
+
+    @classmethod
+    def add_lines_and_services(cls, orders, service):
+        OrderLine.objects.bulk_create([
+            OrderLine(order=order, kind=kind, name=kind, total=50)
+            for order in orders for kind in ('delivery', 'service')
+        ])
+        through = Order.services.through
+        through.objects.bulk_create([through(order_id=order.pk, additionalservice_id=service.pk) for order in orders])
+
+
+class KeysetPaginationTests(OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.create_orders(cls.warehouse, 45)
+        # Часть заказов с одинаковым временем создания: порядок внутри них задает id
+        start = timezone.now() - timedelta(days=30)
+        for i, pk in enumerate(Order.objects.order_by('pk').values_list('pk', flat=True)):
+            Order.objects.filter(pk=pk).update(created_at=start + timedelta(minutes=i // 3))
+
+    def paginate(self, **params):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/orders/', params))
+        page = paginator.paginate_queryset(Order.objects.all(), request)
+        return paginator, page
+
+    def test_pages_cover_all_orders_once_in_order(self):
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        seen = []
+        cursor = None
+        while True:
+            paginator, page = self.paginate(page_size=10, **({'cursor': cursor} if cursor else {}))
+            seen.extend(order.pk for order in page)
+            cursor = paginator.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_query_count_is_constant_for_deep_pages(self):
+        cursor = None
+        for _ in range(4):
+            params = {'page_size': 10, **({'cursor': cursor} if cursor else {})}
+            with CaptureQueriesContext(connection) as queries:
+                paginator, page = self.paginate(**params)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+            cursor = paginator.next_cursor
+
+    def test_last_page_has_no_next_cursor(self):
+        paginator, page = self.paginate(page_size=45)
+        self.assertEqual(len(page), 45)
+        self.assertIsNone(paginator.next_cursor)
+        self.assertIsNone(paginator.get_next_link())
+
+    @override_settings(ORDER_LIST_PAGE_SIZE=7)
+    def test_page_size_default_and_limit(self):
+        self.assertEqual(len(self.paginate()[1]), 7)
+        self.assertEqual(len(self.paginate(page_size=0)[1]), 1)
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/orders/', {'page_size': 10 ** 6}))
+        self.assertEqual(paginator.get_page_size(request), KeysetPagination.max_page_size)
+
+    def test_next_link_carries_cursor(self):
+        paginator, page = self.paginate(page_size=5)
+        self.assertIn(f'cursor={paginator.next_cursor}', paginator.get_next_link())
+        self.assertIn('page_size=5', paginator.get_next_link())
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'W10', KeysetPagination.encode_cursor('created_at', timezone.now(), 'x'),
+                       KeysetPagination.encode_cursor('total_price', 100, Order.objects.first().pk)):
+            with self.assertRaises(NotFound):
+                self.paginate(cursor=cursor)
+
+
+class OrderQueryBudgetTests(OrderFixturesMixin, TestCase):
+    """
+    Список и карточка заказа читают связи одним запросом на связь,
+    независимо от количества заказов (без N+1)
+    """
+    # Заказы (+ клиент через JOIN), строки расчета, услуги
+    QUERY_BUDGET = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.service = AdditionalService.objects.create(name='Погрузка', price=700)
+        cls.user = User.objects.create(username='client', phone='+79990000000', company_name='ООО Ромашка')
+
+    def create_history(self, count):
+        orders = self.create_orders(self.warehouse, count // 2) + self.create_orders(
+            self.warehouse, count - count // 2, user=self.user
+        )
+        self.add_lines_and_services(orders, self.service)
+        return orders
+
+    def list_queries(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/orders/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], len(queries)
+
+    def test_list_query_count_does_not_grow_with_orders(self):
+        self.create_history(10)
+        results, small = self.list_queries(500)
+        self.assertEqual(len(results), 10)
+
+        self.create_history(490)
+        results, large = self.list_queries(500)
+        self.assertEqual(len(results), 500)
+
+        self.assertEqual(small, self.QUERY_BUDGET)
+        self.assertEqual(large, self.QUERY_BUDGET)
+
+    def test_list_serializes_relations(self):
+        self.create_history(2)
+        results, _ = self.list_queries(10)
+        by_user = {bool(order['user']): order for order in results}
+        self.assertEqual(by_user[True]['client_info']['company_name'], 'ООО Ромашка')
+        self.assertEqual(by_user[False]['client_info']['phone'], '+70000000000')
+        for order in results:
+            self.assertEqual(order['services'], [self.service.pk])
+            self.assertEqual(len(order['lines']), 2)
+            self.assertEqual(order['containers_info'], [{'type': 'Коробка', 'size': None, 'quantity': 1}])
+
+    def test_retrieve_query_budget(self):
+        order = self.create_history(2)[-1]
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(f'/orders/{order.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['client_info']['client_name'], 'client')
+
+
+class QueryPlanMixin:
+    """
+    Проверка плана запроса: EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (PostgreSQL)
+    не должен содержать полного просмотра таблицы.
+
+    Для страницы без фильтров (ORDER BY ... LIMIT) допустим просмотр индекса
+    в порядке сортировки: чтение останавливается на LIMIT строк.
+    """
+
+    def query_plan(self, queryset):
+        if connection.vendor == 'sqlite':
+            return queryset.explain()
+        if connection.vendor == 'postgresql':
+            # На маленьких тестовых таблицах PostgreSQL выбирает Seq Scan и при наличии индекса
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+        raise SkipTest(f'Query plan check is not implemented for {connection.vendor}')
+
+    def assertUsesIndex(self, queryset):
+        plan = self.query_plan(queryset)
+        ordered_page = queryset.query.high_mark is not None and not queryset.query.where
+        if connection.vendor == 'sqlite':
+            # SCAN - полный просмотр таблицы или всего индекса (в отличие от SEARCH по ключу)
+            full_scans = [
+                line for line in plan.splitlines()
+                if re.search(r'\bSCAN \w+', line) and not (ordered_page and 'USING INDEX' in line)
+            ]
+        else:
+            full_scans = [line for line in plan.splitlines() if 'Seq Scan' in line]
+        if full_scans:
+            self.fail(f'Full table scan in query plan:\n{plan}\n\nSQL: {queryset.query}')
+
+
+class HotQueryIndexTests(QueryPlanMixin, OrderFixturesMixin, TestCase):
+    """Частые запросы к тарифам и заказам идут по индексам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+
+    def test_pricing_by_specification(self):
+        self.assertUsesIndex(Pricing.objects.filter(pricing_type='box', specification='60x40x40 см', is_active=True))
+
+    def test_pricing_by_warehouse(self):
+        self.assertUsesIndex(Pricing.objects.filter(pricing_type='delivery', warehouse=self.warehouse, is_active=True))
+
+    def test_orders_by_status(self):
+        self.assertUsesIndex(Order.objects.filter(status='new').order_by('-created_at'))
+
+    def test_orders_by_warehouse(self):
+        self.assertUsesIndex(Order.objects.filter(warehouse=self.warehouse).order_by('-created_at'))
+
+    def test_orders_by_created_at(self):
+        self.assertUsesIndex(Order.objects.filter(created_at__gte=timezone.now() - timedelta(days=7)))
+
+    def test_orders_by_telegram_user(self):
+        self.assertUsesIndex(Order.objects.filter(telegram_user_id=123456789))
+
+    def test_full_scan_is_detected(self):
+        with self.assertRaises(AssertionError):
+            self.assertUsesIndex(Order.objects.filter(client_name='Клиент 1'))
+
+
+class OrderFilterTests(QueryPlanMixin, OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.other = Warehouse.objects.create(name='Электросталь', marketplace=cls.warehouse.marketplace,
+                                             city=City.objects.create(name='Электросталь'))
+        cls.create_orders(cls.warehouse, 6, status='new')
+        cls.create_orders(cls.other, 4, status='completed', telegram_user_id=42, phone_number='+79990000001')
+        for i, pk in enumerate(Order.objects.order_by('pk').values_list('pk', flat=True)):
+            Order.objects.filter(pk=pk).update(total_price=100 + i * 10)
+
+    def list_orders(self, **params):
+        response = self.client.get('/orders/', params)
+        return response.status_code, response.json()
+
+    def test_filters(self):
+        cases = [
+            ({'status': 'new'}, 6),
+            ({'status': 'new,completed'}, 10),
+            ({'warehouse': self.other.pk}, 4),
+            ({'city': self.other.city_id}, 4),
+            ({'marketplace': self.warehouse.marketplace_id, 'status': 'completed'}, 4),
+            ({'telegram_user_id': 42}, 4),
+            ({'phone': '+79990000001'}, 4),
+            ({'cargo_type': 'pallet'}, 0),
+            ({'created_from': timezone.localdate().isoformat(), 'created_to': timezone.localdate().isoformat()}, 10),
+            ({'created_to': (timezone.localdate() - timedelta(days=1)).isoformat()}, 0),
+        ]
+        for params, expected in cases:
+            status_code, data = self.list_orders(**params)
+            self.assertEqual(status_code, 200, params)
+            self.assertEqual(len(data['results']), expected, params)
+
+    def test_sort_by_price_pages_through_all_orders(self):
+        prices, cursor = [], None
+        while True:
+            status_code, data = self.list_orders(sort='-total_price', page_size=3, **({'cursor': cursor} if cursor else {}))
+            prices.extend(float(order['total_price']) for order in data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        self.assertEqual(len(prices), 10)
+
+    def test_invalid_parameters(self):
+        for params in ({'status': 'lost'}, {'warehouse': 'abc'}, {'created_from': '31.12.2025'}, {'sort': 'client_name'}):
+            status_code, data = self.list_orders(**params)
+            self.assertEqual(status_code, 400, params)
+            self.assertIn(next(iter(params)), data)
+
+    def test_filtered_pages_use_indexes(self):
+        params_list = [
+            {'status': 'new'},
+            {'warehouse': str(self.warehouse.pk)},
+            {'city': str(self.other.city_id)},
+            {'cargo_type': 'box'},
+            {'telegram_user_id': '42'},
+            {'phone': '+79990000001'},
+            {'created_from': '2026-01-01'},
+        ]
+        for ordering in ORDER_SORTS.values():
+            queryset = Order.objects.order_by(*ordering)[:51]
+            with self.subTest(ordering=ordering):
+                self.assertUsesIndex(queryset)
+        for params in params_list:
+            queryset, _ = filter_orders(Order.objects.all(), QueryDict(urlencode(params)))
+            with self.subTest(params=params):
+                self.assertUsesIndex(queryset.order_by('-created_at', '-id')[:51])
+
+
+
+class OrderExportTests(OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.service = AdditionalService.objects.create(name='Маркировка', price=10)
+        cls.user = User.objects.create(username='client', company_name='ООО Клиент', phone='+79990000000')
+        orders = cls.create_orders(cls.warehouse, 5, status='new')
+        cls.add_lines_and_services(orders, cls.service)
+        cls.create_orders(cls.warehouse, 3, status='completed', user=cls.user)
+
+    def export(self, **params):
+        response = self.client.get('/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export(status='new')
+        self.assertEqual(response['Content-Type'], CONTENT_TYPES['csv'])
+        rows = list(csv.DictReader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(list(rows[0]), list(EXPORT_COLUMNS))
+        self.assertEqual(rows[0]['warehouse'], 'Коледино')
+        self.assertEqual(rows[0]['marketplace'], 'Wildberries')
+        self.assertEqual(rows[0]['services'], str(self.service.pk))
+        self.assertEqual(rows[0]['service_names'], 'Маркировка')
+
+    def test_ndjson(self):
+        _, content = self.export(file_format='ndjson', status='completed')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['client_company'], 'ООО Клиент')
+        self.assertEqual(rows[0]['services'], '')
+
+    def test_xlsx(self):
+        _, content = self.export(file_format='xlsx', sort='created_at')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 9)
+        self.assertIn('Коледино', sheet)
+
+    def test_queries_per_chunk(self):
+        # Один запрос заказов (со складом и клиентом) и по запросу услуг на пачку
+        orders = export_queryset(Order.objects.all(), QueryDict())
+        with self.assertNumQueries(1 + 4):
+            rows = list(iter_rows(orders, chunk_size=2))
+        self.assertEqual(len(rows), 8)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/orders/export/', {'file_format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get('/orders/export/', {'status': 'lost'}).status_code, 400)
+
+class OrderSearchTests(OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Индекс создается миграцией; в тестовой БД, собранной без миграций, - здесь
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise SkipTest(f'Order search is not implemented for {connection.vendor}')
+        create_search_index()
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.create_orders(cls.warehouse, 20)
+        cls.ivanov, cls.petrova = Order.objects.bulk_create([
+            Order(warehouse=cls.warehouse, cargo_type='box', client_name='Иван Иванов', company='ООО Ромашка',
+                  phone_number='+7 (916) 123-45-67', email='ivanov@romashka.ru',
+                  pickup_address='Москва, ул. Ленина, д. 5'),
+            Order(warehouse=cls.warehouse, cargo_type='box', client_name='Мария Петрова', company='ИП Петрова',
+                  phone_number='+79035550011', email='maria@example.com', pickup_address='Химки, Ленинградское ш.'),
+        ])
+
+    def search(self, q, **params):
+        response = self.client.get('/orders/search/', {'q': q, **params})
+        return response.status_code, response.json()
+
+    def found_ids(self, q):
+        status_code, data = self.search(q)
+        self.assertEqual(status_code, 200, data)
+        return [item['id'] for item in data['results']]
+
+    def test_search_fields(self):
+        ivanov, petrova = str(self.ivanov.pk), str(self.petrova.pk)
+        cases = [
+            ('иванов', [ivanov]),
+            ('РОМАШК', [ivanov]),
+            ('123-45', [ivanov]),
+            ('1234567', [ivanov]),
+            ('903 555', [petrova]),
+            ('maria@example', [petrova]),
+            ('Ленин', [ivanov, petrova]),
+            ('Петрова Химки', [petrova]),
+            (ivanov, [ivanov]),
+        ]
+        for q, expected in cases:
+            with self.subTest(q=q):
+                self.assertCountEqual(self.found_ids(q), expected)
+
+    def test_results_are_ranked(self):
+        # Фамилия в имени и в компании - выше, чем только в имени
+        other = Order.objects.create(warehouse=self.warehouse, cargo_type='box', client_name='Петрова',
+                                     phone_number='+70000000000')
+        status_code, data = self.search('петрова')
+        self.assertEqual([item['id'] for item in data['results']], [str(self.petrova.pk), str(other.pk)])
+        self.assertLessEqual(len(self.search('клиент', limit=5)[1]['results']), 5)
+
+    def test_index_follows_order_writes(self):
+        Order.objects.filter(pk=self.ivanov.pk).update(client_name='Сидор Сидоров')
+        self.assertEqual(self.found_ids('иванов'), [])
+        self.assertEqual(self.found_ids('сидоров'), [str(self.ivanov.pk)])
+        self.petrova.delete()
+        self.assertEqual(self.found_ids('петрова'), [])
+
+    def test_short_query(self):
+        status_code, data = self.search('ив')
+        self.assertEqual(status_code, 400)
+        self.assertIn('q', data)
+
+    def test_admin_uses_index(self):
+        queryset = search_queryset(Order.objects.all(), 'ромашка')
+        self.assertIn('orders_order_fts' if connection.vendor == 'sqlite' else 'to_tsvector', str(queryset.query))
+        self.assertEqual(list(queryset), [self.ivanov])
+
+
+class ReferenceDataTests(OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.service = AdditionalService.objects.create(name='Маркировка', price=10, service_type='other')
+
+    def setUp(self):
+        # Кеш и прочитанные версии не откатываются вместе с транзакцией теста
+        cache.clear()
+        forget_versions()
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_cached_with_etag(self):
+        for url in ('/orders/warehouses/', '/orders/containers/', '/orders/additional-services/', '/orders/bootstrap/'):
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.get(url).content, response.content)
+                    not_modified = self.get(url, etag)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b'')
+                self.assertEqual(self.get(url, '"other"').status_code, 200)
+
+    def test_warehouses_invalidated_on_change(self):
+        etag = self.get('/orders/warehouses/')['ETag']
+        City.objects.filter(pk=self.warehouse.city_id).get().save()
+        # Содержимое не изменилось - ETag тот же
+        self.assertEqual(self.get('/orders/warehouses/', etag).status_code, 304)
+        self.warehouse.city.name = 'Подольск'
+        self.warehouse.city.save()
+        response = self.get('/orders/warehouses/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['city_name'], 'Подольск')
+
+    def test_services_invalidated_on_change(self):
+        etag = self.get('/orders/additional-services/')['ETag']
+        AdditionalService.objects.create(name='Паллетирование', price=20, service_type='palletizing')
+        response = self.get('/orders/additional-services/', etag)
+        self.assertEqual(response.status_code, 200)
+        names = [s['name'] for group in response.json()['serviceGroups'] for s in group['services']]
+        self.assertCountEqual(names, ['Маркировка', 'Паллетирование'])
+
+    def test_bootstrap(self):
+        data = self.get('/orders/bootstrap/').json()
+        self.assertEqual(set(data), {'tariff_version', 'marketplaces', 'container_types', 'additional_services'})
+        self.assertEqual(data['marketplaces'], [{
+            'id': self.warehouse.marketplace_id, 'name': 'Wildberries',
+            'warehouses': [{'id': self.warehouse.pk, 'name': 'Коледино', 'city': 'Москва'}],
+        }])
+        self.assertEqual(data['additional_services']['serviceGroups'][0]['services'][0]['name'], 'Маркировка')
+
+        Warehouse.objects.create(name='Электросталь', marketplace=self.warehouse.marketplace,
+                                 city=self.warehouse.city)
+        self.assertEqual(len(self.get('/orders/bootstrap/').json()['marketplaces'][0]['warehouses']), 2)
+
+    def test_change_from_other_process(self):
+        data = self.get('/orders/bootstrap/').json()
+        # Другой процесс меняет справочник и тарифы: здесь это видно по версиям в БД
+        Warehouse.objects.filter(pk=self.warehouse.pk).update(name='Подольск')
+        DataVersion.objects.filter(name__in=['reference:warehouses', TARIFFS]).update(version='other')
+        self.assertEqual(self.get('/orders/bootstrap/').json(), data)
+        forget_versions()
+        updated = self.get('/orders/bootstrap/').json()
+        self.assertEqual(updated['marketplaces'][0]['warehouses'][0]['name'], 'Подольск')
+        self.assertEqual(updated['tariff_version'], 'other')
+
+    def test_change_without_signals_expires(self):
+        etag = self.get('/orders/warehouses/')['ETag']
+        Warehouse.objects.filter(pk=self.warehouse.pk).update(name='Подольск')
+        self.assertEqual(self.get('/orders/warehouses/', etag).status_code, 304)
+        later = time.time() + settings.REFERENCE_CACHE_TTL + 1
+        with mock.patch('time.time', return_value=later):
+            response = self.get('/orders/warehouses/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Подольск')
+
+    def test_bootstrap_compressed(self):
+        response = self.client.get('/orders/bootstrap/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), self.get('/orders/bootstrap/').json())
+        not_modified = self.client.get('/orders/bootstrap/', HTTP_ACCEPT_ENCODING='gzip',
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_services_single_query(self):
+        AdditionalService.objects.create(name='Грузчик', price=30, service_type='loader')
+        AdditionalService.objects.create(name='Без типа', price=5)
+        AdditionalService.objects.create(name='Будущая', price=5, valid_from=timezone.now() + timedelta(days=1))
+        get_version('reference:additional_services')
+        with self.assertNumQueries(1):
+            data = self.get('/orders/additional-services/').json()
+        self.assertEqual([group['title'] for group in data['serviceGroups']],
+                         ['Услуги грузчика', 'Другое', 'Другие услуги'])
+
+    def test_services_delta(self):
+        since = timezone.now()
+        response = self.client.get('/orders/additional-services/', {'updated_since': since.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['serviceGroups'], [])
+        self.assertEqual(data['service_ids'], [self.service.pk])
+
+        loader = AdditionalService.objects.create(name='Грузчик', price=30, service_type='loader')
+        self.service.delete()
+        data = self.client.get('/orders/additional-services/', {'updated_since': data['updated_at']}).json()
+        self.assertEqual([s['id'] for group in data['serviceGroups'] for s in group['services']], [loader.pk])
+        self.assertEqual(data['service_ids'], [loader.pk])
+
+        response = self.client.get('/orders/additional-services/', {'updated_since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderDailyStatsTests(OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+
+    def create_order(self, **fields):
+        fields = {'cargo_type': 'box', 'box_count': 2, 'phone_number': '+70000000000', 'total_price': 100, **fields}
+        order = Order(warehouse=self.warehouse, client_name='Клиент', **fields)
+        order.skip_pricing = True
+        order.save()
+        return order
+
+    def rows(self):
+        return {
+            (row.status, row.cargo_type): (row.order_count, row.box_count, row.pallet_count, row.revenue)
+            for row in OrderDailyStats.objects.all()
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.rows()
+        rebuild_order_stats()
+        self.assertEqual({key: value for key, value in incremental.items() if value[0]}, self.rows())
+
+    def test_created_and_status_changed(self):
+        order = self.create_order()
+        self.create_order(status='completed', total_price=50)
+        self.assertEqual(self.rows(), {('new', 'box'): (1, 2, 0, 100), ('completed', 'box'): (1, 2, 0, 50)})
+
+        order.status = 'completed'
+        order.save()
+        self.assertEqual(self.rows(), {('new', 'box'): (0, 0, 0, 0), ('completed', 'box'): (2, 4, 0, 150)})
+        self.assertMatchesRebuild()
+
+        # Заказ из очереди обработки: значения до записи читаются из БД
+        order = Order.objects.only('pk', 'status').get(pk=order.pk)
+        order.status = 'canceled'
+        order.save(update_fields=['status'])
+        self.assertEqual(self.rows()[('canceled', 'box')], (1, 2, 0, 100))
+        self.assertMatchesRebuild()
+
+    def test_write_orders_and_delete(self):
+        orders = write_orders([
+            OrderDraft(Order(warehouse=self.warehouse, cargo_type='pallet', pallet_count=3, client_name='Клиент',
+                             phone_number='+70000000000', total_price=300), Quote([], None), ())
+            for _ in range(2)
+        ])
+        self.assertEqual(self.rows(), {('new', 'pallet'): (2, 0, 6, 600)})
+        orders[0].delete()
+        self.assertEqual(self.rows(), {('new', 'pallet'): (1, 0, 3, 300)})
+        self.assertMatchesRebuild()
+
+    def test_endpoint_reads_only_rollup(self):
+        self.create_order()
+        self.create_order(cargo_type='pallet', box_count=0, pallet_count=1, status='completed', total_price=40)
+        today = timezone.localdate().isoformat()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/orders/stats/', {'date_from': today, 'group_by': 'status'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'orders_order"' in q['sql']])
+        data = response.json()
+        self.assertEqual([(row['status'], row['order_count']) for row in data['results']],
+                         [('completed', 1), ('new', 1)])
+        self.assertEqual(data['totals']['order_count'], 2)
+        self.assertEqual(data['totals']['pallet_count'], 1)
+
+        data = self.client.get('/orders/stats/', {'cargo_type': 'pallet'}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['warehouse_id'], self.warehouse.pk)
+        self.assertEqual(data['results'][0]['date'], today)
+
+        for params in ({'date_from': 'yesterday'}, {'status': 'lost'}, {'group_by': 'client'}):
+            self.assertEqual(self.client.get('/orders/stats/', params).status_code, 400)
+
+
+class PriceBookTests(OrderFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.delivery = Pricing.objects.create(name='Доставка', pricing_type='delivery', warehouse=cls.warehouse,
+                                              base_price=1500)
+
+    def setUp(self):
+        # Версии, прочитанные процессом, не откатываются вместе с транзакцией теста
+        forget_versions()
+
+    def delivery_price(self):
+        request = parse_quote_request({'delivery': {'warehouse_id': self.warehouse.pk}})
+        return get_price_book().quote(request).delivery
+
+    def test_rebuilt_when_tariff_saved(self):
+        self.assertEqual(self.delivery_price(), 1500)
+        version = get_tariff_version()
+        self.delivery.base_price = 1800
+        self.delivery.save()
+        self.assertNotEqual(get_tariff_version(), version)
+        self.assertEqual(self.delivery_price(), 1800)
+
+    def test_change_from_other_process(self):
+        self.assertEqual(self.delivery_price(), 1500)
+        # Другой процесс публикует тарифы: сигналы этого процесса не срабатывают
+        Pricing.objects.filter(pk=self.delivery.pk).update(base_price=1700)
+        DataVersion.objects.filter(name=TARIFFS).update(version='published')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.delivery_price(), 1500)
+        with override_settings(DATA_VERSION_CHECK_INTERVAL=0):
+            self.assertEqual(get_tariff_version(), 'published')
+            self.assertEqual(self.delivery_price(), 1700)
+
+    def test_load_pricing_data_bumps_version(self):
+        version = get_tariff_version()
+        call_command('load_pricing_data', stdout=io.StringIO())
+        self.assertNotEqual(DataVersion.objects.get(name=TARIFFS).version, version)
+        self.assertNotEqual(self.delivery_price(), 1500)
+
+
+class PricingFixturesMixin(OrderFixturesMixin):
+    """Склад с тарифами доставки, коробок и паллет"""
+
+    @classmethod
+    def create_tariffs(cls):
+        cls.warehouse = cls.create_warehouse()
+        cls.delivery = Pricing.objects.create(name='Доставка', pricing_type='delivery', warehouse=cls.warehouse,
+                                              base_price=1500)
+        cls.box = Pricing.objects.create(name='Коробка', pricing_type='box', base_price=100, unit_price=50)
+        cls.pallet = Pricing.objects.create(name='Паллета', pricing_type='pallet', specification='200-300 кг',
+                                            base_price=0, unit_price=2000)
+        cls.service = AdditionalService.objects.create(name='Маркировка', price=300, service_type='other')
+
+    def setUp(self):
+        forget_versions()
+
+    def form(self, boxes=0, pallets=0, services=(), **cargo):
+        """Данные формы калькулятора"""
+        return {
+            'delivery': {'warehouse_id': self.warehouse.pk},
+            'cargo': {'box_count': boxes, 'pallet_count': pallets, **cargo},
+            'additional_services': list(services),
+        }
+
+    def post(self, url, data, **headers):
+        return self.client.post(url, data, content_type='application/json', **headers)
+
+
+class PriceBatchTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def test_batch_matches_single_quotes(self):
+        items = [self.form(boxes=2), self.form(pallets=1, container_type='200-300 кг'),
+                 self.form(boxes=1, services=[self.service.pk])]
+        response = self.post('/orders/calculate-price/batch/', items)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['tariff_version'], get_tariff_version())
+        for item, result in zip(items, data['results']):
+            single = self.post('/orders/calculate-price/', item).json()
+            self.assertEqual(result['total_price'], single['total_price'])
+        self.assertEqual([result['total_price'] for result in data['results']], [1700, 3500, 1950])
+
+    def test_queries_do_not_grow_with_items(self):
+        self.post('/orders/calculate-price/batch/', [self.form(boxes=1)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post('/orders/calculate-price/batch/', {'items': [self.form(boxes=i) for i in range(50)]})
+        self.assertEqual(len(response.json()['results']), 50)
+        self.assertEqual(len(queries), 0)
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.post('/orders/calculate-price/batch/', {'items': 'x'}).status_code, 400)
+        too_many = [self.form(boxes=1)] * 1001
+        self.assertEqual(self.post('/orders/calculate-price/batch/', too_many).status_code, 400)
+
+
+class RepricingTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+        cls.client_user = User.objects.create(username='client', company_name='ООО Опт')
+        ClientRate.objects.create(user=cls.client_user, pricing_type='box', base_price=0, unit_price=30)
+        forget_versions()
+        for user in (None, cls.client_user):
+            order = Order(warehouse=cls.warehouse, cargo_type='box', box_count=4, client_name='Клиент',
+                          phone_number='+70000000000', user=user)
+            order.save()
+
+    def test_unchanged_draft_has_no_delta(self):
+        self.assertEqual(sorted(Order.objects.values_list('total_price', flat=True)), [1620, 1800])
+        report = reprice_orders(build_draft_book({}))
+        self.assertEqual(report.orders, 2)
+        self.assertEqual(report.current, 3420)
+        self.assertEqual(report.delta, 0)
+
+    def test_client_rate_kept_in_draft(self):
+        # Клиент платит по своей цене коробки: изменение общего тарифа его не касается
+        report = reprice_orders(build_draft_book({'pricing': [{'id': self.box.pk, 'unit_price': '60'}]}))
+        self.assertEqual(report.delta, 40)
+
+    def test_orders_without_lines_priced_at_creation(self):
+        OrderLine.objects.all().delete()
+        report = reprice_orders(build_draft_book({}))
+        self.assertEqual(report.current, 3420)
+        self.assertEqual(report.delta, 0)
+
+
+class OrderDirtyFieldsTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def setUp(self):
+        super().setUp()
+        order = Order(warehouse=self.warehouse, cargo_type='box', box_count=2, client_name='Клиент',
+                      phone_number='+70000000000')
+        order.save()
+        self.order = Order.objects.get(pk=order.pk)
+
+    def order_updates(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE "orders_order" ')]
+
+    def test_unchanged_save_skips_query(self):
+        with self.assertNumQueries(0):
+            self.order.save()
+
+    def test_status_save_writes_only_status(self):
+        self.order.status = 'processing'
+        with CaptureQueriesContext(connection) as queries:
+            self.order.save()
+        updates = self.order_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'^UPDATE "orders_order" SET "status" = \S+ WHERE')
+        self.assertFalse([q for q in queries if 'orders_pricing' in q['sql'] or 'orders_orderline' in q['sql']])
+        # Заказ переносится из строки сводки "new" в "processing": UPDATE прежней строки,
+        # строки "processing" еще нет - UPDATE без результата и INSERT
+        stats = [q['sql'].split()[0] for q in queries if 'orders_orderdailystats' in q['sql']]
+        self.assertEqual(stats, ['UPDATE', 'UPDATE', 'INSERT'])
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT')])
+
+    def test_status_save_of_partially_loaded_order(self):
+        order = Order.objects.only('id', 'status').get(pk=self.order.pk)
+        order.status = 'processing'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        # Недостающие поля сводки читаются одним SELECT
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')]), 1)
+        self.assertEqual(OrderDailyStats.objects.get(status='processing').order_count, 1)
+
+    def test_save_without_stats_fields_single_query(self):
+        self.order.client_name = 'Другой клиент'
+        with self.assertNumQueries(1):
+            self.order.save()
+
+    def test_pricing_field_change_reprices(self):
+        self.order.box_count = 6
+        self.order.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 1500 + 100 + 50 * 6)
+        self.assertEqual(self.order.lines.get(kind='box').quantity, 6)
+        self.assertEqual(self.order.lines.count(), 2)
+
+
+class QuoteCacheTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+        cls.loader = AdditionalService.objects.create(name='Грузчик', price=500, service_type='loader')
+
+    def setUp(self):
+        super().setUp()
+        get_quote_cache().clear()
+        quote_cache_stats.reset()
+
+    def test_key_ignores_service_order_and_form_format(self):
+        flat = parse_quote_request(self.form(boxes=2, services=[self.service.pk, self.loader.pk]))
+        order_form = parse_quote_request({
+            'delivery': {'warehouse_id': self.warehouse.pk},
+            'cargoType': {'type': 'Коробка', 'quantities': {'Коробка': 2}},
+            'additionalServices': [self.loader.pk, self.service.pk],
+        })
+        self.assertEqual(quote_cache_key(flat, 'v1'), quote_cache_key(order_form, 'v1'))
+        self.assertNotEqual(quote_cache_key(flat, 'v1'), quote_cache_key(flat, 'v2'))
+        self.assertNotEqual(quote_cache_key(flat, 'v1'), quote_cache_key(flat._replace(box_count=3), 'v1'))
+
+    def test_repeated_quote_is_cached_until_tariffs_change(self):
+        form = self.form(boxes=2, services=[self.service.pk])
+        first = self.post('/orders/calculate-price/', form).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post('/orders/calculate-price/', form).json()['total_price'], first['total_price'])
+        self.assertEqual(self.client.get('/orders/calculate-price/cache-stats/').json()['hits'], 1)
+
+        self.box.unit_price = 70
+        self.box.save()
+        self.assertEqual(self.post('/orders/calculate-price/', form).json()['total_price'], first['total_price'] + 40)
+        self.assertEqual(quote_cache_stats.as_dict()['misses'], 2)
+
+
+class QuoteTokenTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def quote(self, form):
+        book = get_price_book()
+        request = parse_quote_request(form)
+        return book.quote(request), request, book.version
+
+    def test_round_trip(self):
+        quote, request, version = self.quote(self.form(boxes=2, services=[self.service.pk]))
+        restored = load_quote_token(make_quote_token(quote, request), request, version)
+        self.assertEqual(restored.lines, quote.lines)
+        self.assertEqual(restored.total, quote.total)
+
+    def test_rejected_tokens(self):
+        quote, request, version = self.quote(self.form(boxes=2))
+        token = make_quote_token(quote, request)
+        self.assertIsNone(load_quote_token(token[:-1] + ('A' if token[-1] != 'A' else 'B'), request, version))
+        self.assertIsNone(load_quote_token(token, request._replace(box_count=3), version))
+        self.assertIsNone(load_quote_token(token, request, 'other-version'))
+        with override_settings(QUOTE_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(load_quote_token(token, request, version))
+
+    def test_order_uses_token_until_tariffs_change(self):
+        form = self.form(boxes=2)
+        token = self.post('/orders/calculate-price/', form).json()['quote_token']
+        quote, from_token = resolve_order_quote({**form, 'quoteToken': token})
+        self.assertTrue(from_token)
+        self.assertEqual(quote.total, 1700)
+
+        self.box.unit_price = 70
+        self.box.save()
+        quote, from_token = resolve_order_quote({**form, 'quoteToken': token})
+        self.assertFalse(from_token)
+        self.assertEqual(quote.total, 1740)
+
+        response = self.post('/api/order/', {**form, 'quoteToken': token, 'client': {'clientName': 'Клиент'}})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['order']['total_price'], '1740.00')
+
+
+class OrderLineTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def create_order(self):
+        order = Order(warehouse=self.warehouse, cargo_type='box', box_count=2, client_name='Клиент',
+                      phone_number='+70000000000')
+        order.save()
+        return order
+
+    def test_lines_saved_with_order(self):
+        order = self.create_order()
+        self.assertEqual([(line.kind, line.pricing_id, line.total) for line in order.lines.all()],
+                         [('delivery', self.delivery.pk, 1500), ('box', self.box.pk, 200)])
+        self.assertEqual(order.stored_quote().total, order.total_price)
+
+        # Изменение тарифа не меняет сохраненный расчет
+        self.box.unit_price = 70
+        self.box.save()
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual(order.stored_quote().total, 1700)
+
+    def test_services_rewrite_lines(self):
+        order = self.create_order()
+        order.services.add(self.service)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 2000)
+        self.assertEqual([line.kind for line in order.lines.all()], ['delivery', 'box', 'service'])
+
+        revenue = list(OrderLine.objects.revenue_by_service())
+        self.assertEqual([(row['service_id'], row['orders'], row['revenue']) for row in revenue],
+                         [(self.service.pk, 1, 300)])
+
+
+class TieredTariffTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+        # Паллеты по весу одной паллеты: до 200 кг - 3000, от 200 кг - 4000 и 100 за каждые начатые 20 кг
+        Pricing.objects.create(name='Паллета до 200 кг', pricing_type='pallet', tier_basis='weight', tier_from=0,
+                               base_price=3000)
+        Pricing.objects.create(name='Паллета от 200 кг', pricing_type='pallet', tier_basis='weight',
+                               tier_from=200, base_price=4000, unit_price=100, step_size=20)
+
+    def pallet_form(self, weight=None):
+        form = self.form(pallets=2, container_type='200-300 кг', cargo_type='pallet')
+        if weight is not None:
+            form['cargo']['dimensions'] = {'weight': weight}
+        return form
+
+    def pallet_price(self, weight):
+        quote = get_price_book().quote(parse_quote_request(self.pallet_form(weight)))
+        return quote.line('pallet').unit_price
+
+    def test_tier_lookup(self):
+        self.assertEqual(self.pallet_price(300), 3000)
+        self.assertEqual(self.pallet_price(400), 4000)
+        self.assertEqual(self.pallet_price(440), 4100)
+        self.assertEqual(self.pallet_price(500), 4300)
+
+    def test_calculator_quote_reused_for_order_without_weight(self):
+        calculated = self.post('/orders/calculate-price/', self.pallet_form(weight=500)).json()
+        self.assertEqual(calculated['total_price'], 1500 + 2 * 4300)
+
+        # Форма заказа не передает вес: заказ создается по токену калькулятора
+        order_form = {**self.pallet_form(), 'quoteToken': calculated['quote_token'],
+                      'client': {'clientName': 'Клиент', 'phone': '+70000000000'}}
+        response = self.post('/api/order/', order_form)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['order']['total_price'], '10100.00')
+
+        # Вес из токена сохранен: пересчет заказа дает ту же стоимость
+        order = Order.objects.get(pk=response.json()['order']['id'])
+        self.assertEqual(order.weight, 500)
+        self.assertEqual(order.calculate_quote().total, 10100)
+
+    def test_draft_tier_replaces_live_tier(self):
+        order = Order(warehouse=self.warehouse, cargo_type='pallet', container_type='200-300 кг', pallet_count=2,
+                      weight=500, client_name='Клиент', phone_number='+70000000000')
+        order.save()
+        self.assertEqual(order.total_price, 1500 + 2 * 4300)
+        # Как в действии админки simulate_revenue: новая строка с той же границей ступени
+        draft = {'pricing': [{'name': 'Паллета от 200 кг', 'pricing_type': 'pallet', 'tier_basis': 'weight',
+                              'tier_from': '200', 'base_price': '5000', 'unit_price': '100', 'step_size': '20'}]}
+        report = reprice_orders(build_draft_book(draft))
+        self.assertEqual(report.delta, 2 * 1000)
+
+
+class LoadedPalletTariffTests(OrderFixturesMixin, TestCase):
+    """Монопаллеты из load_pricing_data: ступени по весу с ценой за паллету"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = cls.create_warehouse()
+        call_command('load_pricing_data', stdout=io.StringIO())
+
+    def setUp(self):
+        forget_versions()
+
+    def pallet_line(self, spec, weight=None):
+        cargo = {'pallet_count': 2, 'container_type': spec, 'cargo_type': 'pallet'}
+        if weight is not None:
+            cargo['dimensions'] = {'weight': weight}
+        request = parse_quote_request({'delivery': {'warehouse_id': self.warehouse.pk}, 'cargo': cargo})
+        return get_price_book().quote(request).line('pallet')
+
+    def test_same_price_with_and_without_weight(self):
+        without_weight, with_weight = self.pallet_line('200-300 кг'), self.pallet_line('200-300 кг', weight=500)
+        self.assertEqual((without_weight.unit_price, without_weight.total), (4000, 8000))
+        self.assertEqual((with_weight.pricing_id, with_weight.total), (without_weight.pricing_id, 8000))
+
+    def test_step_tier_priced_per_pallet(self):
+        self.assertEqual(self.pallet_line('Другой вес').total, 2 * 5000)
+        self.assertEqual(self.pallet_line('Другой вес', weight=1400).total, 2 * (5000 + 2 * 1000))
+
+
+class TariffValidityTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+        cls.switch_at = timezone.now() + timedelta(hours=1)
+        Pricing.objects.filter(pk=cls.delivery.pk).update(valid_from=cls.switch_at - timedelta(days=30),
+                                                         valid_to=cls.switch_at)
+        cls.next_delivery = Pricing.objects.create(name='Доставка 2027', pricing_type='delivery',
+                                                   warehouse=cls.warehouse, base_price=2500, valid_from=cls.switch_at)
+
+    def delivery_price(self):
+        request = parse_quote_request({'delivery': {'warehouse_id': self.warehouse.pk}})
+        return get_price_book().quote(request).delivery
+
+    def test_effective_at(self):
+        self.assertEqual(list(Pricing.objects.effective_at().filter(pricing_type='delivery')), [self.delivery])
+        self.assertEqual(list(Pricing.objects.effective_at(self.switch_at).filter(pricing_type='delivery')),
+                         [self.next_delivery])
+
+    def test_price_book_switches_at_boundary(self):
+        self.assertEqual(self.delivery_price(), 1500)
+        self.assertEqual(get_price_book().valid_until, self.switch_at)
+        tariff_version, version = get_tariff_version(), get_price_book().version
+        with mock.patch('django.utils.timezone.now', return_value=self.switch_at + timedelta(seconds=1)):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.delivery_price(), 2500)
+            # Новый период - новая версия справочника: расчеты и токены прежнего периода не используются
+            self.assertNotEqual(get_price_book().version, version)
+        # Версия тарифов в БД не меняется: смена периода - только чтение
+        self.assertEqual(get_tariff_version(), tariff_version)
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+
+    def test_historical_quote_uses_tariffs_at_creation(self):
+        order = Order(warehouse=self.warehouse, cargo_type='box', box_count=1, client_name='Клиент',
+                      phone_number='+70000000000')
+        order.save()
+        Order.objects.filter(pk=order.pk).update(created_at=self.switch_at + timedelta(days=1))
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 1650)
+        self.assertEqual(order.historical_quote().total, 2650)
+
+
+class ClientRateTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+        cls.client_user = User.objects.create(username='client', company_name='ООО Опт')
+
+    def box_price(self, user=None):
+        book = get_price_book()
+        request = parse_quote_request(self.form(boxes=2), client=book.client_for(user or self.client_user))
+        return book.quote(request).cargo
+
+    def test_rate_applied_as_soon_as_saved(self):
+        self.assertEqual(self.box_price(), 200)
+        rate = ClientRate.objects.create(user=self.client_user, pricing_type='box', base_price=0, unit_price=30)
+        self.assertEqual(self.box_price(), 60)
+        self.assertIn('индивидуальная', render_rate_card(client_keys(self.client_user.pk)))
+
+        rate.unit_price = 40
+        rate.save()
+        self.assertEqual(self.box_price(), 80)
+        rate.delete()
+        self.assertEqual(self.box_price(), 200)
+        self.assertNotIn('индивидуальная', render_rate_card(client_keys(self.client_user.pk)))
+
+    def test_company_rate_follows_company_name(self):
+        ClientRate.objects.create(company='ООО Опт', service=self.service, base_price=100)
+        colleague = User.objects.create(username='colleague', company_name='Другая')
+        book = get_price_book()
+        self.assertIsNone(book.client_for(colleague))
+        # Карта выбирается по компании клиента в момент расчета - пересборка справочника не нужна
+        colleague.company_name = 'ооо опт'
+        self.assertEqual(book.client_for(colleague), ('company:ооо опт',))
+        self.assertEqual(book.service(self.service.pk, client=book.client_for(colleague)).price, 100)
+
+
+class OrderImportTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def test_csv_import_with_row_errors(self):
+        content = (
+            'warehouse_id,cargo_type,box_count,client_name,phone_number,services\n'
+            f'{self.warehouse.pk},box,2,Иванов,+79990000001,{self.service.pk}\n'
+            f'{self.warehouse.pk},crate,2,Петров,+79990000002,\n'
+            f'{self.warehouse.pk},box,3,Сидоров,+79990000003,\n'
+        ).encode()
+        response = self.client.post('/orders/import/?batch_size=1', content, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 1))
+        self.assertEqual(data['errors'][0]['row'], 3)
+
+        orders = {order.client_name: order for order in Order.objects.prefetch_related('services', 'lines')}
+        self.assertEqual(orders['Иванов'].total_price, 1500 + 200 + 300)
+        self.assertEqual(list(orders['Иванов'].services.all()), [self.service])
+        self.assertEqual(len(orders['Сидоров'].lines.all()), 2)
+
+    def test_ndjson_import(self):
+        rows = [
+            {'warehouse_id': self.warehouse.pk, 'cargo_type': 'pallet', 'pallet_count': 1,
+             'container_type': '200-300 кг', 'client_name': 'Иванов', 'phone_number': '+79990000001'},
+            {'warehouse_id': 0, 'cargo_type': 'box', 'client_name': 'Петров', 'phone_number': '+79990000002'},
+        ]
+        content = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows) + '\nnot json\n'
+        response = self.client.post('/orders/import/', content.encode(), content_type='application/x-ndjson')
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (1, 2))
+        self.assertEqual(Order.objects.get().total_price, 3500)
+
+
+class IdempotencyTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def order_form(self, **client):
+        return {**self.form(boxes=2), 'client': {'clientName': 'Клиент', **client}}
+
+    def test_replay_returns_stored_response(self):
+        first = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(first.status_code, 201)
+        replay = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_same_key_with_other_body_rejected(self):
+        self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        response = self.post('/api/order/', self.order_form(clientName='Другой'), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_in_progress_conflicts(self):
+        self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        IdempotencyKey.objects.update(status_code=None, response=None)
+        response = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_interrupted_request_taken_over_after_lease(self):
+        # Первый запрос оборвался: ключ остался в обработке, заказ откатился
+        self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        Order.objects.all().delete()
+        IdempotencyKey.objects.update(status_code=None, response=None,
+                                      claimed_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE + 1))
+        response = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+        # Ключ снова с ответом: следующий повтор получает сохраненный ответ
+        self.assertEqual(self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1').json(), response.json())
+
+    def test_concurrent_first_use_conflicts(self):
+        first = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        stored = IdempotencyKey.objects.get()
+        stored.delete()
+        create = IdempotencyKey.objects.create
+
+        def lose_race(**fields):
+            # Параллельный запрос вставляет ключ между проверкой и INSERT
+            create(**{**fields, 'request_hash': stored.request_hash})
+            raise IntegrityError('duplicate key')
+
+        with mock.patch.object(IdempotencyKey.objects, 'create', side_effect=lose_race):
+            response = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_scoped_per_client(self):
+        for username in ('first', 'second'):
+            self.client.force_login(User.objects.create(username=username))
+            response = self.post('/api/order/', self.order_form(), HTTP_IDEMPOTENCY_KEY='k1')
+            self.assertEqual(response.status_code, 201)
+            self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.client.logout()
+        for telegram_user_id in (101, 102):
+            response = self.post('/api/order/', self.order_form(telegram_user_id=telegram_user_id),
+                                 HTTP_IDEMPOTENCY_KEY='k2')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 4)
+        self.assertEqual(set(IdempotencyKey.objects.values_list('client', flat=True)),
+                         {f'user:{user.pk}' for user in User.objects.all()} | {'telegram:101', 'telegram:102'})
+
+
+class OrderIntakeTests(PricingFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def payload(self, boxes=2):
+        return {
+            'delivery': {'warehouse': self.warehouse.pk},
+            'cargoType': {'type': 'Коробка', 'quantities': {'Коробка': boxes}},
+            'clientData': {'name': 'Клиент', 'phone': '+79990000000'},
+        }
+
+    def test_async_order_created_by_worker(self):
+        response = self.post('/orders/', self.payload(), HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(process_batch(), (1, 0))
+        intake = OrderIntake.objects.get(pk=response.json()['tracking_id'])
+        self.assertEqual(intake.status, OrderIntake.STATUS_DONE)
+        self.assertEqual(intake.order.total_price, 1700)
+        self.assertEqual(NotificationOutbox.objects.filter(order=intake.order).count(), 1)
+
+    def test_invalid_payload_fails_without_retry(self):
+        intake = submit_order(self.payload(boxes='много'))
+        self.assertEqual(process_batch(max_attempts=3), (0, 1))
+        intake.refresh_from_db()
+        self.assertEqual((intake.status, intake.attempts), (OrderIntake.STATUS_FAILED, 1))
+        self.assertIsNotNone(intake.processed_at)
+
+    def test_database_error_retried(self):
+        intake = submit_order(self.payload())
+        with mock.patch('orders.serializers.write_order', side_effect=OperationalError('database is locked')):
+            process_batch(max_attempts=2)
+            intake.refresh_from_db()
+            self.assertEqual((intake.status, intake.attempts), (OrderIntake.STATUS_PENDING, 1))
+            process_batch(max_attempts=2)
+        intake.refresh_from_db()
+        self.assertEqual((intake.status, intake.attempts), (OrderIntake.STATUS_FAILED, 2))
+        self.assertFalse(Order.objects.exists())
+
+    def test_health_fails_while_queue_is_stalled(self):
+        self.assertEqual(self.client.get('/orders/health/').status_code, 200)
+        intake = submit_order(self.payload())
+        OrderIntake.objects.filter(pk=intake.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        response = self.client.get('/orders/health/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['stalled_intakes'], 1)
+        process_batch()
+        self.assertEqual(self.client.get('/orders/health/').status_code, 200)
+
+
+class MiniAppOrderTests(PricingFixturesMixin, TestCase):
+    """Заказы из мини-приложения: тип груза приходит в selectedTypes, а не в type"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_tariffs()
+
+    def order_form(self, types, quantities, **cargo):
+        return {
+            'delivery': {'warehouse_id': self.warehouse.pk},
+            'cargoType': {'selectedTypes': types, 'quantities': quantities, **cargo},
+            'client': {'clientName': 'Клиент'},
+        }
+
+    def test_cargo_type_from_selected_types(self):
+        request = parse_quote_request(self.order_form(['Паллета'], {}))
+        self.assertEqual((request.cargo_type, request.pallet_count), ('pallet', 0))
+        request = parse_quote_request(self.order_form(['Коробка', 'Паллета'], {'Паллета': 1}))
+        self.assertEqual(request.cargo_type, 'pallet')
+        self.assertEqual(parse_quote_request(self.form(boxes=2)).cargo_type, 'box')
+
+    def test_pallet_order_keeps_cargo_on_reprice(self):
+        form = self.order_form(['Паллета'], {'Паллета': 1}, selectedPalletWeights=['200-300 кг'])
+        self.assertEqual(self.post('/api/order/', form).status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.cargo_type, order.container_type, order.total_price), ('pallet', '200-300 кг', 3500))
+        report = reprice_orders(build_draft_book({'pricing': [{'id': self.pallet.pk, 'unit_price': '2500'}]}))
+        self.assertEqual((report.current, report.delta), (3500, 500))
+
+    def test_mixed_order_keeps_both_cargo_lines(self):
+        form = self.order_form(['Коробка', 'Паллета'], {'Коробка': 2, 'Паллета': 1},
+                               selectedPalletWeights=['200-300 кг'])
+        self.assertEqual(self.post('/api/order/', form).status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.cargo_type, order.box_count, order.pallet_count), ('mixed', 2, 1))
+        self.assertEqual(order.total_price, 1500 + 200 + 2000)
+        report = reprice_orders(build_draft_book({'pricing': [{'id': self.box.pk, 'unit_price': '60'}]}))
+        self.assertEqual((report.current, report.delta), (3700, 20))
+
+    def test_mixed_order_containers_info(self):
+        order = Order(warehouse=self.warehouse, cargo_type='mixed', container_type='200-300 кг', box_count=2,
+                      pallet_count=1, client_name='Клиент', phone_number='+70000000000')
+        self.assertEqual(OrderSerializer(order).data['containers_info'], [
+            {'type': 'Коробка', 'size': None, 'quantity': 2},
+            {'type': 'Паллета', 'size': '200-300 кг', 'quantity': 1},
+        ])
+        order.container_type, order.pallet_count = '60x40x40 см', 0
+        self.assertEqual(OrderSerializer(order).data['containers_info'],
+                         [{'type': 'Коробка', 'size': '60x40x40 см', 'quantity': 2}])
+
+
+class NotificationDispatcherTests(TestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.reply(200, {'status': 'ok'})
+        self.notifications = [enqueue_notification({'order_id': str(i)}) for i in range(3)]
+
+    def reply(self, status_code, body):
+        self.session.post.return_value = mock.Mock(status_code=status_code, text=json.dumps(body),
+                                                   json=mock.Mock(return_value=body))
+
+    def dispatcher(self, **options):
+        return NotificationDispatcher(session=self.session, timeout=1, **options)
+
+    def test_claimed_batch_not_given_to_other_dispatcher(self):
+        self.assertEqual(len(self.dispatcher(batch_size=2).claim_batch()), 2)
+        self.assertEqual(len(self.dispatcher().claim_batch()), 1)
+        self.assertEqual(self.dispatcher().claim_batch(), [])
+
+        # Обработчик упал, не отправив пачку: после CLAIM_TIMEOUT она снова доступна
+        later = timezone.now() + timedelta(seconds=CLAIM_TIMEOUT + 1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(len(self.dispatcher().claim_batch()), 3)
+
+    def test_sent(self):
+        self.assertEqual(self.dispatcher().dispatch_batch(), (3, 0))
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', 'attempts', 'claimed_by')),
+                         {(NotificationOutbox.STATUS_SENT, 1, None)})
+
+    def test_failed_attempt_backs_off(self):
+        self.reply(200, {'status': 'error', 'message': 'chat not found'})
+        started = timezone.now()
+        self.assertEqual(self.dispatcher().dispatch_batch(), (0, 3))
+        for notification in NotificationOutbox.objects.all():
+            self.assertEqual((notification.status, notification.attempts), (NotificationOutbox.STATUS_PENDING, 1))
+            self.assertEqual(notification.last_error, 'chat not found')
+            self.assertGreaterEqual(notification.next_attempt_at, started + timedelta(seconds=5))
+        # До наступления времени повтора уведомления не отправляются
+        self.assertEqual(self.dispatcher().dispatch_batch(), (0, 0))
+        self.assertEqual(self.session.post.call_count, 3)
+
+    def test_failed_after_max_attempts(self):
+        self.reply(502, {})
+        dispatcher = self.dispatcher(max_attempts=2)
+        for _ in range(2):
+            dispatcher.dispatch_batch()
+            NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', 'attempts')),
+                         {(NotificationOutbox.STATUS_FAILED, 2)})
+        self.assertEqual(dispatcher.dispatch_batch(), (0, 0))
+
+    def test_retry_delay_grows_exponentially_up_to_limit(self):
+        for attempts, seconds in ((1, 5), (2, 10), (4, 40), (30, 3600)):
+            delay = retry_delay(attempts).total_seconds()
+            self.assertTrue(seconds <= delay <= seconds * 1.2, (attempts, delay))
@@ -9,12 +9,20 @@ app_name = 'orders'
 
 urlpatterns = [
     path('', views.OrderViewSet.as_view({'get': 'list', 'post': 'create'}), name='order-list'),
-    path('<int:pk>/', views.OrderViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='order-detail'),
+    path('search/', views.OrderViewSet.as_view({'get': 'search'}), name='order-search'),
+    path('stats/', views.OrderViewSet.as_view({'get': 'stats'}), name='order-stats'),
+    path('export/', views.OrderViewSet.as_view({'get': 'export'}), name='order-export'),
+    path('import/', views.OrderViewSet.as_view({'post': 'import_orders'}), name='order-import'),
+    path('intake/<uuid:tracking_id>/', views.OrderViewSet.as_view({'get': 'intake_status'}), name='order-intake'),
+    path('<uuid:pk>/', views.OrderViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='order-detail'),
+    path('bootstrap/', views.bootstrap, name='bootstrap'),
     path('warehouses/', views.WarehouseViewSet.as_view({'get': 'list'}), name='warehouse-list'),
     path('containers/', views.ContainerTypesViewSet.as_view({'get': 'list'}), name='container-list'),
     path('pricing/', views.PricingViewSet.as_view({'get': 'list', 'post': 'create'}), name='pricing-list'),
     path('pricing/<int:pk>/', views.PricingViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='pricing-detail'),
     path('calculate-price/', views.PricingViewSet.as_view({'post': 'calculate_price'}), name='calculate-price'),
+    path('calculate-price/cache-stats/', views.PricingViewSet.as_view({'get': 'quote_cache_stats'}), name='calculate-price-cache-stats'),
+    path('calculate-price/batch/', views.PricingViewSet.as_view({'post': 'calculate_price_batch'}), name='calculate-price-batch'),
     path('additional-services/', views.PricingViewSet.as_view({'get': 'get_additional_services'}), name='additional-services'),
     
     # Новые эндпоинты для работы с дополнительными услугами
@@ -1,5 +1,5 @@
 from rest_framework import viewsets
-from .models import Order, Warehouse, Container, Marketplace, Pricing, AdditionalService
+from .models import Order, OrderIntake, Warehouse, Marketplace, Pricing, AdditionalService
 from .serializers import (
     OrderSerializer, 
     WarehouseSerializer, 
@@ -10,237 +10,139 @@ from .serializers import (
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action, api_view
-from django.db.models import Prefetch, Sum, F, ExpressionWrapper, DecimalField
+from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 from decimal import Decimal
-import requests
-import os
+from .pricing import get_price_book, parse_quote_request, DEFAULT_BOX_PRICE, DEFAULT_PALLET_PRICE
+from .quote_cache import get_or_calculate_quote, cache_info as quote_cache_info
+from .quote_tokens import make_quote_token, resolve_order_quote
+from .idempotency import idempotent
+from .notifications import build_order_notification, enqueue_notification
+from .intake import stalled_count, submit_order, validate_order_payload
+from .order_writer import write_order
+from .pagination import KeysetPagination
+from .order_filters import datetime_param, filter_orders, order_sort
+from .order_export import CONTENT_TYPES, EXPORT_FORMATS, export_filename, export_queryset, stream_export
+from .reference_data import (ADDITIONAL_SERVICES, BOOTSTRAP, CONTAINER_TYPES, MARKETPLACES, WAREHOUSES,
+                             reference_response, services_delta)
+from .search import MAX_SEARCH_RESULTS, SEARCH_RESULTS_LIMIT, search_orders
+from .order_stats import order_stats
+from .order_import import IMPORT_FORMATS, IMPORT_BATCH_SIZE, detect_format, import_orders
+import csv
+from django.db import transaction
 import logging
-from django.shortcuts import render
-from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.urls import reverse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
-from django.db import connection
-import datetime
 import uuid
 from django.views.decorators.http import require_http_methods
 import traceback
 
 logger = logging.getLogger(__name__)
 
+# Максимальное количество расчетов в одном пакетном запросе
+MAX_PRICE_BATCH_SIZE = 1000
+
+
+def _wants_async(request):
+    """Асинхронный прием заказа: включен в настройках или запрошен заголовком Prefer"""
+    prefer = request.META.get('HTTP_PREFER', '').lower()
+    return settings.ORDER_INTAKE_ASYNC or 'respond-async' in prefer
+
+
+def _intake_data(request, intake):
+    status_url = request.build_absolute_uri(reverse('orders:order-intake', args=[intake.pk]))
+    data = {
+        'tracking_id': str(intake.pk),
+        'status': intake.status,
+        'status_url': status_url,
+        'attempts': intake.attempts,
+        'created_at': intake.created_at,
+        'processed_at': intake.processed_at,
+        'order_id': intake.order_id,
+    }
+    if intake.status == OrderIntake.STATUS_FAILED:
+        data['error'] = intake.error
+    return data
+
+
+def _unit_and_total(line, default_unit_price):
+    """Цена за единицу и сумма строки расчета (для ответа о созданном заказе)"""
+    if line is None:
+        return default_unit_price, Decimal('0.00')
+    return line.unit_price, line.total
+
+
 class MarketplaceViewSet(viewsets.ModelViewSet):
     queryset = Marketplace.objects.all()
     serializer_class = MarketplaceSerializer
     
     @action(detail=False, methods=['get'])
     def with_warehouses(self, request):
-        marketplaces = Marketplace.objects.prefetch_related(
-            Prefetch('warehouse_set', queryset=Warehouse.objects.select_related('city'))
-        ).all()
-        
-        data = []
-        for marketplace in marketplaces:
-            warehouses = [{
-                'id': w.id,
-                'name': w.name,
-                'city': w.city.name
-            } for w in marketplace.warehouse_set.all()]
-            
-            data.append({
-                'id': marketplace.id,
-                'name': marketplace.name,
-                'warehouses': warehouses
-            })
-            
-        return Response(data)
-
-class ContainerTypesViewSet(viewsets.ViewSet):
-    def list(self, request):
-        data = {
-            'box_sizes': [
-                {'id': size[0], 'label': size[1]} 
-                for size in Container.BOX_SIZES
-            ],
-            'pallet_weights': [
-                {'id': weight[0], 'label': weight[1]} 
-                for weight in Container.PALLET_WEIGHT
-            ],
-            'container_types': [
-                {'id': type[0], 'label': type[1]} 
-                for type in Container.CONTAINER_TYPES
-            ]
-        }
-        return Response(data)
+        return reference_response(request, MARKETPLACES)
 
 class WarehouseViewSet(viewsets.ModelViewSet):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
     
     def list(self, request):
-        warehouses = Warehouse.objects.all()
-        serializer = self.serializer_class(warehouses, many=True)
-        return Response(serializer.data)
+        return reference_response(request, WAREHOUSES)
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = OrderSerializer.setup_eager_loading(Order.objects.all())
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
     
+    @idempotent('orders.create')
     def create(self, request, *args, **kwargs):
+        if _wants_async(request):
+            return self.create_async(request)
         try:
             request_data = request.data
             serializer = self.get_serializer(data=request_data)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            headers = self.get_success_headers(serializer.data)
-            
-            # Получаем данные о созданном заказе
-            order_id = serializer.data.get('id')
-            warehouse_name = ""
-            if 'delivery' in request_data and 'warehouse' in request_data['delivery']:
-                try:
-                    warehouse_id = request_data['delivery']['warehouse']
-                    warehouse = Warehouse.objects.get(id=warehouse_id)
-                    warehouse_name = str(warehouse)
-                except Warehouse.DoesNotExist:
-                    warehouse_name = "Не указан"
-            
-            # Собираем информацию о грузе
-            cargo_type_data = request_data.get('cargoType', {})
-            cargo_types = cargo_type_data.get('selectedTypes', [])
-            cargo_type_str = ', '.join(cargo_types) if cargo_types else "Не указан"
-            
-            # Получаем информацию о размерах коробок (если есть)
-            box_sizes = cargo_type_data.get('selectedBoxSizes', [])
-            box_size_str = ', '.join(box_sizes) if box_sizes else "Не указан"
-            
-            # Получаем количество коробок
-            box_count = 0
-            if 'quantities' in cargo_type_data and 'Коробка' in cargo_type_data['quantities']:
-                try:
-                    box_count = int(cargo_type_data['quantities']['Коробка'])
-                except (ValueError, TypeError):
-                    box_count = 0
-            
-            # Получаем информацию о весе паллет (если есть)
-            pallet_weights = cargo_type_data.get('selectedPalletWeights', [])
-            pallet_weight_str = ', '.join(pallet_weights) if pallet_weights else "Не указан"
+            # Заказ и уведомление в Telegram (в очередь отправки) - в одной транзакции
+            with transaction.atomic():
+                self.perform_create(serializer)
+                order = serializer.instance
+                quote = order.stored_quote()
+                notification = build_order_notification(order, request_data, quote)
+                enqueue_notification(notification, order=order)
             
-            # Получаем количество паллет
-            pallet_count = 0
-            if 'quantities' in cargo_type_data and 'Паллета' in cargo_type_data['quantities']:
-                try:
-                    pallet_count = int(cargo_type_data['quantities']['Паллета'])
-                except (ValueError, TypeError):
-                    pallet_count = 0
-            
-            # Получаем информацию о клиенте
             client_data = request_data.get('clientData', {})
-            client_name = client_data.get('clientName', 'Не указан')
-            phone = client_data.get('phone', 'Не указан')
-            company_name = client_data.get('companyName', 'Не указана')
-            email = client_data.get('email', 'Не указан')
-            
-            # Получаем адрес самовывоза (если есть)
-            pickup_address = request_data.get('pickupAddress', '')
-            
-            # Формируем данные для уведомления в Telegram
-            telegram_data = {
-                "order_id": order_id,
-                'warehouse_name': warehouse_name,
-                'cargo_type': cargo_type_str,
-                'box_size': box_size_str,
-                'box_count': box_count,
-                'pallet_weight': pallet_weight_str,
-                'pallet_count': pallet_count,
-                'company_name': company_name,
-                'client_name': client_name,
-                'client_email': email,
-                'client_phone': phone,
-                "telegram_user_id": client_data.get('telegram_user_id'),
-                'cost': serializer.data.get('total_price', 'Не указана'),
-                'comments': client_data.get('comments', 'Нет комментариев'),
-                'pickup_address': pickup_address
-            }
-            
-            # Отправляем уведомление в Telegram
-            try:
-                requests.post("http://telegram-bot:8080/api/send_notification", json=telegram_data)
-            except Exception as e:
-                print(f"Error sending Telegram notification: {str(e)}")
-            
-            # Рассчитываем стоимость заказа
-            box_price = 500.00  # Стоимость одной коробки
-            pallet_price = 2000.00  # Стоимость одной паллеты
-            base_price = 1000.00  # Базовая стоимость заказа
             
-            total_price = base_price + (box_count * box_price) + (pallet_count * pallet_price)
-            
-            # Получаем текущие дату/время
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Сохраняем информацию о грузе и клиенте в JSON-поле
-            additional_info = {
-                'cargo_info': cargo_type_data,
-                'client_info': client_data
-            }
-            
-            # Это минимальный набор полей для создания заказа
-            with connection.cursor() as cursor:
-                # Форматируем строки для прямого вставления в SQL
-                now_str = f"'{now}'"
-                total_price_str = f"'{str(total_price)}'"
-                status_str = "'new'"
-                # Используем более простой подход к экранированию кавычек
-                json_str = json.dumps(additional_info)
-                json_str = json_str.replace("'", "''")
-                additional_info_str = f"'{json_str}'"
-                user_id_str = '1'
-                warehouse_id_str = f"{warehouse_id if warehouse_id is not None else 'NULL'}"
-                pickup_address_str = f"'{pickup_address}'" if pickup_address else "NULL"
-                
-                # Прямой SQL запрос без плейсхолдеров
-                direct_sql = f"""
-                INSERT INTO orders_order (
-                    created_at, cost, status, additional_info, status_updated_at, 
-                    user_id_id, warehouse_id_id, pickup_address
-                ) VALUES (
-                    {now_str}, {total_price_str}, {status_str}, {additional_info_str}, {now_str}, 
-                    {user_id_str}, {warehouse_id_str}, {pickup_address_str}
-                )
-                """
-                
-                print(f"DEBUG: Direct SQL: {direct_sql}")
-                cursor.execute(direct_sql)
-                
-                # Получаем ID созданного заказа
-                cursor.execute("SELECT last_insert_rowid()")
-                order_id = cursor.fetchone()[0]
+            # Стоимость заказа по сохраненным строкам
+            box_price, box_total = _unit_and_total(quote.line('box'), DEFAULT_BOX_PRICE)
+            pallet_price, pallet_total = _unit_and_total(quote.line('pallet'), DEFAULT_PALLET_PRICE)
             
             # Формируем ответ
             return JsonResponse({
                 'success': True,
                 'message': 'Order created successfully',
                 'order': {
-                    'id': order_id,
-                    'status': 'new',
-                    'total_price': str(total_price),
-                    'created_at': now,
-                    'warehouse_id': warehouse_id,
-                    'pickup_address': pickup_address,
+                    'id': str(order.pk),
+                    'status': order.status,
+                    'total_price': str(order.total_price),
+                    'created_at': order.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                    'warehouse_id': order.warehouse_id,
+                    'pickup_address': order.pickup_address,
                     'client': {
-                        'name': client_data.get('clientName', ''),
+                        'name': client_data.get('clientName', order.client_name),
                         'phone': client_data.get('phone', '')
                     },
                     'pricing': {
-                        'base_price': str(base_price),
+                        'base_price': str(quote.delivery),
                         'box_price': {
                             'per_unit': str(box_price),
-                            'quantity': box_count,
-                            'total': str(box_count * box_price)
+                            'quantity': notification['box_count'],
+                            'total': str(box_total)
                         },
                         'pallet_price': {
                             'per_unit': str(pallet_price),
-                            'quantity': pallet_count,
-                            'total': str(pallet_count * pallet_price)
+                            'quantity': notification['pallet_count'],
+                            'total': str(pallet_total)
                         }
                     }
                 }
@@ -251,6 +153,25 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    def create_async(self, request):
+        """
+        Ставит заказ в очередь и сразу отвечает 202 с идентификатором заявки;
+        заказ создает обработчик очереди (manage.py process_orders)
+        """
+        errors = validate_order_payload(request.data)
+        if errors:
+            return Response({"error": "Invalid order data", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        intake = submit_order(request.data, user=request.user)
+        data = _intake_data(request, intake)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['status_url']})
+
+    @action(detail=False, methods=['get'], url_path=r'intake/(?P<tracking_id>[0-9a-f-]+)')
+    def intake_status(self, request, tracking_id=None):
+        """Статус заявки из очереди приема заказов"""
+        intake = get_object_or_404(OrderIntake, pk=tracking_id)
+        return Response(_intake_data(request, intake))
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -280,56 +201,162 @@ class OrderViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         instance.delete()
     
+    def get_ordering(self):
+        return order_sort(self.request.query_params)
+
     def list(self, request):
-        orders = Order.objects.all()
-        serializer = self.serializer_class(orders, many=True)
-        return Response(serializer.data)
+        """
+        Список заказов с фильтрами (см. orders.order_filters) и сортировкой ?sort=.
+
+        Постранично по ключу (поле сортировки, id): страница не зависит от
+        глубины. В режиме DEBUG с ?explain=1 ответ содержит примененные
+        фильтры и план запроса страницы.
+        """
+        orders, applied = filter_orders(self.get_queryset(), request.query_params)
+        page = self.paginate_queryset(orders)
+        serializer = self.serializer_class(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if settings.DEBUG and request.query_params.get('explain'):
+            response.data['query'] = {
+                'filters': applied,
+                'ordering': self.get_ordering(),
+                'plan': self.paginator.page_queryset.explain(),
+            }
+        return response
     
     def retrieve(self, request, pk=None):
         order = self.get_object()
         serializer = self.serializer_class(order)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Поиск заказов по имени клиента, компании, телефону (в том числе
+        фрагменту номера), email и адресу: ?q=...&limit=...
+
+        Результаты - по убыванию релевантности (см. orders.search).
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_RESULTS_LIMIT))
+        except ValueError:
+            return Response({'limit': 'Expected integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), MAX_SEARCH_RESULTS)
+
+        found = search_orders(self.get_queryset(), query, limit)
+        results = self.serializer_class([order for order, _ in found], many=True).data
+        for item, (_, rank) in zip(results, found):
+            item['rank'] = rank
+        return Response({'query': query, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Выгрузка заказов файлом CSV / NDJSON / XLSX (?file_format=, по
+        умолчанию CSV) с фильтрами и сортировкой списка заказов.
+
+        Файл отдается потоком по мере чтения заказов из базы
+        (см. orders.order_export).
+        """
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported format: {file_format} (expected one of {', '.join(EXPORT_FORMATS)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        orders = export_queryset(Order.objects.all(), request.query_params)
+        response = StreamingHttpResponse(stream_export(orders, file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(file_format)}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Сводка заказов для дашборда: количество, коробки, паллеты и выручка
+        по дням, складам, статусам и типам груза.
+
+        Читается только сводка OrderDailyStats, без агрегации по заказам
+        (см. orders.order_stats): ?date_from=&date_to=&warehouse=&status=
+        &cargo_type=&group_by=date,warehouse,status,cargo_type
+        """
+        return Response(order_stats(request.query_params))
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_orders(self, request):
+        """
+        Массовый импорт заказов из CSV / NDJSON.
+
+        Файл передается полем file (multipart) или телом запроса; формат
+        определяется по расширению / Content-Type или параметру file_format.
+        Ошибки возвращаются по строкам, корректные строки сохраняются.
+        """
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"error": "File is required"}, status=status.HTTP_400_BAD_REQUEST)
+            stream, file_format = upload, detect_format(upload.name, upload.content_type)
+        else:
+            stream, file_format = request.stream, detect_format(content_type=request.content_type)
+            if stream is None:
+                return Response({"error": "Request body is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.query_params.get('file_format', file_format)
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported format: {file_format} (expected one of {', '.join(IMPORT_FORMATS)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            batch_size = max(int(request.query_params.get('batch_size', IMPORT_BATCH_SIZE)), 1)
+        except ValueError:
+            batch_size = IMPORT_BATCH_SIZE
+
+        try:
+            result = import_orders(stream, file_format, user=request.user, batch_size=batch_size)
+        except (UnicodeDecodeError, csv.Error) as e:
+            logger.error(f"Error reading orders import file: {str(e)}")
+            return Response({"error": f"Unreadable file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info(f"Orders import: {result.created} created, {len(result.errors)} rows failed")
+        return Response(result.as_dict())
     
 class ContainerTypesViewSet(viewsets.ViewSet):
     def list(self, request):
-        data = {
-            'box_sizes': [
-                {'id': size[0], 'label': size[1]} 
-                for size in Container.BOX_SIZES
-            ],
-            'pallet_weights': [
-                {'id': weight[0], 'label': weight[1]} 
-                for weight in Container.PALLET_WEIGHT
-            ],
-            'container_types': [
-                {'id': type[0], 'label': type[1]} 
-                for type in Container.CONTAINER_TYPES
-            ]
-        }
-        return Response(data)
+        return reference_response(request, CONTAINER_TYPES)
 
 @api_view(['POST'])
 def send_telegram_notification(request):
-    """Отправить уведомление в Telegram"""
+    """Поставить уведомление в Telegram в очередь отправки (доставляет dispatch_notifications)"""
     try:
-        # Получаем данные из запроса
-        order_data = request.data
-        
-        # Отправляем запрос к Telegram боту
-        bot_url = os.getenv("TELEGRAM_BOT_URL", "http://telegram-bot:8080")
-        response = requests.post(f"{bot_url}/api/send_notification", json=order_data)
-        
-        if response.status_code == 200:
-            return Response({"status": "success"}, status=status.HTTP_200_OK)
-        else:
-            return Response({"status": "error", "message": response.text}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        notification = enqueue_notification(request.data)
+        return Response({"status": "queued", "id": notification.pk}, status=status.HTTP_202_ACCEPTED)
     except Exception as e:
         return Response({"status": "error", "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 def health_check(request):
+    # Без обработчика очереди асинхронно принятые заказы не создаются - сервис неисправен
+    stalled = stalled_count()
+    if stalled:
+        logger.error(f"Order intake queue is not being processed ({stalled} stalled), is process_orders running?")
+        return Response({
+            "status": "error",
+            "message": "Очередь заявок не обрабатывается: запустите manage.py process_orders",
+            "stalled_intakes": stalled,
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     return Response({"status": "ok"})
 
+@api_view(['GET'])
+def bootstrap(request):
+    """
+    Все справочники калькулятора одним ответом: маркетплейсы со складами,
+    типы контейнеров, дополнительные услуги и версия тарифов
+    (из кеша справочников, сжатый, с ETag - см. orders.reference_data)
+    """
+    return reference_response(request, BOOTSTRAP)
+
 class PricingViewSet(viewsets.ModelViewSet):
     queryset = Pricing.objects.all()
     serializer_class = PricingSerializer
@@ -338,173 +365,19 @@ class PricingViewSet(viewsets.ModelViewSet):
     def calculate_price(self, request):
         """Рассчитать стоимость заказа на основе переданных данных формы"""
         try:
-            # Извлекаем данные
-            delivery_data = request.data.get('delivery', {})
-            # Check for cargo data in both formats (cargoType and cargo)
-            cargo_type_data = request.data.get('cargoType', request.data.get('cargo', {}))
-            additional_services = request.data.get('additionalServices', [])
-            
-            # Log the received data for debugging
             logger.info(f"Received price calculation request: {request.data}")
-            logger.info(f"Extracted cargo data: {cargo_type_data}")
-            
-            total_price = Decimal('0.00')
-            
-            # 1. Расчет стоимости доставки
-            delivery_price = Decimal('0.00')
-            if delivery_data:
-                warehouse_id = delivery_data.get('warehouse_id') or delivery_data.get('warehouse')
-                if warehouse_id:
-                    try:
-                        # Ищем тариф доставки для выбранного склада
-                        delivery_pricing = Pricing.objects.filter(
-                            pricing_type='delivery',
-                            warehouse__id=warehouse_id,
-                            is_active=True
-                        ).first()
-                        
-                        # If no pricing found for specific warehouse, use any delivery pricing
-                        if not delivery_pricing:
-                            delivery_pricing = Pricing.objects.filter(
-                                pricing_type='delivery',
-                                is_active=True
-                            ).first()
-                            logger.info(f"No specific delivery pricing found for warehouse {warehouse_id}, using first available")
-                        
-                        if delivery_pricing:
-                            delivery_price = delivery_pricing.base_price
-                            total_price += delivery_price
-                            logger.info(f"Added delivery price: {delivery_price} using pricing {delivery_pricing.id}")
-                        else:
-                            # Если тариф не найден, используем базовую стоимость
-                            delivery_price = Decimal('2000.00')
-                            total_price += delivery_price
-                    except Exception as e:
-                        logger.error(f"Error calculating delivery price: {str(e)}")
-                        # Если тариф не найден, используем базовую стоимость
-                        delivery_price = Decimal('2000.00')
-                        total_price += delivery_price
-            
-            # 2. Расчет стоимости по типу груза
-            if cargo_type_data:
-                # Determine cargo type and counts
-                cargo_type = cargo_type_data.get('cargo_type', '')
-                box_count = int(cargo_type_data.get('box_count', 0))
-                pallet_count = int(cargo_type_data.get('pallet_count', 0))
-                container_type = cargo_type_data.get('container_type', '')
-                
-                logger.info(f"Processing cargo: type={cargo_type}, box_count={box_count}, pallet_count={pallet_count}")
-                
-                # Process boxes
-                if box_count > 0:
-                    # Ищем тариф для коробок указанного размера
-                    box_pricing = None
-                    if container_type:
-                        box_pricing = Pricing.objects.filter(
-                            pricing_type='box',
-                            specification=container_type,
-                            is_active=True
-                        ).first()
-                    
-                    if not box_pricing:
-                        # If no specific pricing found, get the first available box pricing
-                        box_pricing = Pricing.objects.filter(
-                            pricing_type='box',
-                            is_active=True
-                        ).first()
-                    
-                    if box_pricing:
-                        # Базовая цена + (цена за единицу * количество)
-                        box_cost = box_pricing.base_price + (box_pricing.unit_price * Decimal(box_count))
-                        total_price += box_cost
-                        logger.info(f"Added box price: {box_cost} for {box_count} boxes using pricing {box_pricing.id}")
-                    else:
-                        # Если тариф не найден, используем базовую стоимость
-                        box_cost = Decimal('500.00') * Decimal(box_count)
-                        total_price += box_cost
-                        logger.info(f"Using default box price: {box_cost} for {box_count} boxes (no pricing found)")
-                
-                # Process pallets
-                if pallet_count > 0:
-                    # Ищем тариф для паллет указанной весовой категории
-                    pallet_pricing = None
-                    if container_type:
-                        pallet_pricing = Pricing.objects.filter(
-                            pricing_type='pallet',
-                            specification=container_type,
-                            is_active=True
-                        ).first()
-                    
-                    if not pallet_pricing:
-                        # If no specific pricing found, get the first available pallet pricing
-                        pallet_pricing = Pricing.objects.filter(
-                            pricing_type='pallet',
-                            is_active=True
-                        ).first()
-                    
-                    if pallet_pricing:
-                        # Базовая цена + (цена за единицу * количество)
-                        pallet_cost = pallet_pricing.base_price + (pallet_pricing.unit_price * Decimal(pallet_count))
-                        total_price += pallet_cost
-                        logger.info(f"Added pallet price: {pallet_cost} for {pallet_count} pallets using pricing {pallet_pricing.id}")
-                    else:
-                        # Если тариф не найден, используем базовую стоимость
-                        pallet_cost = Decimal('2000.00') * Decimal(pallet_count)
-                        total_price += pallet_cost
-                        logger.info(f"Using default pallet price: {pallet_cost} for {pallet_count} pallets (no pricing found)")
-                
-                # If neither box nor pallet count is provided but we have a cargo type
-                if box_count == 0 and pallet_count == 0:
-                    # Default to 1 unit of the specified cargo type
-                    if cargo_type == 'box':
-                        total_price += Decimal('500.00')
-                        logger.info("Using default box price for unspecified count: 500.00")
-                    elif cargo_type == 'pallet':
-                        total_price += Decimal('2000.00')
-                        logger.info("Using default pallet price for unspecified count: 2000.00")
-            
-            # 3. Расчет стоимости дополнительных услуг
-            additional_services_cost = Decimal('0.00')
-            for service_id in additional_services:
-                try:
-                    # Try to find the service in the new AdditionalService model
-                    service = AdditionalService.objects.filter(id=service_id, is_active=True).first()
-                    if service:
-                        additional_services_cost += service.price
-                        logger.info(f"Added additional service price: {service.price} for {service.name}")
-                    else:
-                        # Fall back to the old Pricing model
-                        service_pricing = Pricing.objects.filter(
-                            pricing_type='additional',
-                            id=service_id,
-                            is_active=True
-                        ).first()
-                        
-                        if service_pricing:
-                            additional_services_cost += service_pricing.base_price
-                            logger.info(f"Added legacy additional service price: {service_pricing.base_price}")
-                except Exception as e:
-                    logger.error(f"Error processing additional service {service_id}: {str(e)}")
-            
-            total_price += additional_services_cost
-            
-            # Округляем до 2 знаков после запятой
-            total_price = total_price.quantize(Decimal('0.01'))
-            
-            logger.info(f"Final calculated price: {total_price}")
-            
-            # Prepare pricing details
-            cargo_price = total_price - delivery_price - additional_services_cost
-            
-            return Response({
-                'total_price': total_price,
-                'currency': 'RUB',
-                'details': {
-                    'delivery': str(delivery_price),
-                    'cargo': str(cargo_price),
-                    'additional_services': str(additional_services_cost)
-                }
-            })
+
+            book = get_price_book()
+            # Индивидуальные цены - только для авторизованного клиента
+            quote_request = parse_quote_request(request.data, client=book.client_for(request.user))
+            quote = get_or_calculate_quote(book, quote_request)
+
+            logger.info(f"Final calculated price: {quote.total} (tariff version {quote.version})")
+
+            response_data = quote.as_response()
+            # Токен позволяет создать заказ по этому расчету без повторного пересчета
+            response_data['quote_token'] = make_quote_token(quote, quote_request)
+            return Response(response_data)
         except Exception as e:
             logger.error(f"Error calculating price: {str(e)}")
             return Response(
@@ -513,66 +386,62 @@ class PricingViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['get'])
-    def get_additional_services(self, request):
+    def quote_cache_stats(self, request):
+        """Статистика кеша расчетов (попадания / промахи текущего процесса)"""
+        return Response(quote_cache_info())
+
+    @action(detail=False, methods=['post'])
+    def calculate_price_batch(self, request):
         """
-        Получение списка дополнительных услуг, сгруппированных по категориям
+        Рассчитать стоимость для списка конфигураций груза за один запрос.
+
+        Принимает список данных форм (или {"items": [...]}) и возвращает
+        расчеты в том же формате, что и calculate_price. Справочник тарифов
+        берется один раз на весь запрос.
         """
-        # Получаем все активные дополнительные услуги
-        services = AdditionalService.objects.filter(is_active=True)
-        
-        # Группируем услуги по типам
-        service_groups = []
-        
-        # Получаем все возможные типы услуг из модели
-        service_types = dict(AdditionalService.SERVICE_TYPES)
-        
-        # Для каждого типа услуг создаем группу
-        for service_type, type_display in service_types.items():
-            # Получаем услуги данного типа
-            type_services = services.filter(service_type=service_type)
-            
-            # Если есть услуги данного типа, добавляем группу
-            if type_services.exists():
-                service_group = {
-                    'title': type_display,
-                    'services': []
-                }
-                
-                # Добавляем каждую услугу в группу
-                for service in type_services:
-                    service_group['services'].append({
-                        'id': service.id,
-                        'name': service.name,
-                        'price': f"{service.price} ₽",
-                        'requires_location': service.requires_location,
-                        'description': service.description
-                    })
-                
-                service_groups.append(service_group)
-        
-        # Добавляем услуги без типа в отдельную группу
-        other_services = services.filter(service_type__isnull=True)
-        if other_services.exists():
-            other_group = {
-                'title': 'Другие услуги',
-                'services': []
-            }
-            
-            for service in other_services:
-                other_group['services'].append({
-                    'id': service.id,
-                    'name': service.name,
-                    'price': f"{service.price} ₽",
-                    'requires_location': service.requires_location,
-                    'description': service.description
-                })
-            
-            service_groups.append(other_group)
-        
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a list of price calculation requests"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_PRICE_BATCH_SIZE:
+            return Response(
+                {"error": f"Too many items in batch: {len(items)} (max {MAX_PRICE_BATCH_SIZE})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        book = get_price_book()
+        client = book.client_for(request.user)
+        results = []
+        for index, item in enumerate(items):
+            try:
+                results.append(book.quote(parse_quote_request(item, client=client)).as_response())
+            except Exception as e:
+                logger.error(f"Error calculating price for batch item {index}: {str(e)}")
+                results.append({"error": f"Error calculating price: {str(e)}"})
+
+        logger.info(f"Calculated {len(results)} prices in batch (tariff version {book.version})")
+
         return Response({
-            'serviceGroups': service_groups
+            'tariff_version': book.version,
+            'results': results
         })
 
+    @action(detail=False, methods=['get'])
+    def get_additional_services(self, request):
+        """
+        Получение списка дополнительных услуг, сгруппированных по категориям
+        (из кеша справочников, см. orders.reference_data).
+
+        С ?updated_since= (дата-время ISO 8601 из поля updated_at прошлого
+        ответа) - только изменения каталога, см. services_delta
+        """
+        updated_since, _ = datetime_param(request.query_params, 'updated_since')
+        if updated_since is not None:
+            return Response(services_delta(updated_since))
+        return reference_response(request, ADDITIONAL_SERVICES)
+
 class AdditionalServiceViewSet(viewsets.ModelViewSet):
     """
     ViewSet для управления дополнительными услугами
@@ -594,8 +463,10 @@ class AdditionalServiceViewSet(viewsets.ModelViewSet):
         # Фильтрация по активности
         is_active = self.request.query_params.get('active', None)
         if is_active is not None:
-            is_active = is_active.lower() == 'true'
-            queryset = queryset.filter(is_active=is_active)
+            if is_active.lower() == 'true':
+                queryset = queryset.effective_at()
+            else:
+                queryset = queryset.filter(is_active=False)
         
         return queryset
     
@@ -625,6 +496,7 @@ class AdditionalServiceViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @csrf_exempt
+@idempotent('api.order')
 def create_order(request):
     """
     Непосредственное создание заказа через SQL запрос
@@ -637,9 +509,6 @@ def create_order(request):
                 'message': 'Method not allowed',
             }, status=405)
             
-        import datetime
-        from orders.models import Warehouse, Pricing
-        
         # Получение данных заказа
         try:
             order_data = json.loads(request.body.decode('utf-8'))
@@ -652,143 +521,43 @@ def create_order(request):
         
         # Проверка обязательных полей
         delivery_data = order_data.get('delivery', {})
-        cargo_data = order_data.get('cargo', {})
         client_data = order_data.get('client', {})
         pickup_address = order_data.get('pickup_address', '')
         
-        # Расчет стоимости заказа
-        # Базовая стоимость
-        base_price = Decimal('1000.00')
-        total_price = base_price
-        box_price_per_unit = Decimal('500.00')
-        pallet_price_per_unit = Decimal('2000.00')
-        box_quantity = int(cargo_data.get('box_count', 0))
-        pallet_quantity = int(cargo_data.get('pallet_count', 0))
-        box_total = Decimal('0.00')
-        pallet_total = Decimal('0.00')
+        # Расчет стоимости заказа: по токену расчета или по справочнику тарифов
+        quote_request = parse_quote_request(order_data)
+        quote, from_token = resolve_order_quote(order_data, user=request.user)
+        logging.info(f"Order price {quote.total} ({'quote token' if from_token else 'price book'})")
         
-        # Получаем идентификатор склада
-        warehouse_id = delivery_data.get('warehouse_id')
+        warehouse_id = quote_request.warehouse_id
+        total_price = quote.total
+        base_price = quote.delivery
+        box_quantity = quote_request.box_count
+        pallet_quantity = quote_request.pallet_count
+        box_price_per_unit, box_total = _unit_and_total(quote.line('box'), DEFAULT_BOX_PRICE)
+        pallet_price_per_unit, pallet_total = _unit_and_total(quote.line('pallet'), DEFAULT_PALLET_PRICE)
         
-        # Расчет стоимости доставки
-        delivery_price = Decimal('0.00')
-        if warehouse_id:
-            try:
-                delivery_pricing = Pricing.objects.filter(
-                    pricing_type='delivery',
-                    warehouse__id=warehouse_id,
-                    is_active=True
-                ).first()
-                
-                # If no pricing found for specific warehouse, use any delivery pricing
-                if not delivery_pricing:
-                    delivery_pricing = Pricing.objects.filter(
-                        pricing_type='delivery',
-                        is_active=True
-                    ).first()
-                
-                if delivery_pricing:
-                    delivery_price = delivery_pricing.base_price
-                    base_price = delivery_price
-                    total_price = delivery_price
-            except Exception as e:
-                logging.error(f"Error calculating delivery price: {str(e)}")
-        
-        # Расчет стоимости коробок
-        cargo_type = cargo_data.get('cargo_type', '')
-        container_type = cargo_data.get('container_type', '')
-        
-        if box_quantity > 0:
-            # Ищем тариф для коробок
-            box_pricing = None
-            if container_type:
-                box_pricing = Pricing.objects.filter(
-                    pricing_type='box',
-                    specification=container_type,
-                    is_active=True
-                ).first()
-            
-            if not box_pricing:
-                # If no specific pricing found, get the first available box pricing
-                box_pricing = Pricing.objects.filter(
-                    pricing_type='box',
-                    is_active=True
-                ).first()
-            
-            if box_pricing:
-                box_price_per_unit = box_pricing.unit_price
-                box_total = box_pricing.base_price + (box_pricing.unit_price * box_quantity)
-            else:
-                box_total = box_price_per_unit * box_quantity
-            
-            total_price += box_total
-        
-        # Расчет стоимости паллет
-        if pallet_quantity > 0:
-            # Ищем тариф для паллет
-            pallet_pricing = None
-            if container_type:
-                pallet_pricing = Pricing.objects.filter(
-                    pricing_type='pallet',
-                    specification=container_type,
-                    is_active=True
-                ).first()
-            
-            if not pallet_pricing:
-                # If no specific pricing found, get the first available pallet pricing
-                pallet_pricing = Pricing.objects.filter(
-                    pricing_type='pallet',
-                    is_active=True
-                ).first()
-            
-            if pallet_pricing:
-                pallet_price_per_unit = pallet_pricing.unit_price
-                pallet_total = pallet_pricing.base_price + (pallet_pricing.unit_price * pallet_quantity)
-            else:
-                pallet_total = pallet_price_per_unit * pallet_quantity
-            
-            total_price += pallet_total
-        
-        # Получаем текущие дату/время
-        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Сохраняем информацию о грузе и клиенте в JSON-поле
-        additional_info = {
-            'cargo_info': cargo_data,
-            'client_info': client_data
-        }
-        
-        # Это минимальный набор полей для создания заказа
-        with connection.cursor() as cursor:
-            # Форматируем строки для прямого вставления в SQL
-            now_str = f"'{now}'"
-            total_price_str = f"'{str(total_price)}'"
-            status_str = "'new'"
-            # Используем более простой подход к экранированию кавычек
-            json_str = json.dumps(additional_info)
-            json_str = json_str.replace("'", "''")
-            additional_info_str = f"'{json_str}'"
-            user_id_str = '1'
-            warehouse_id_str = f"{warehouse_id if warehouse_id is not None else 'NULL'}"
-            pickup_address_str = f"'{pickup_address}'" if pickup_address else "NULL"
-            
-            # Прямой SQL запрос без плейсхолдеров
-            direct_sql = f"""
-            INSERT INTO orders_order (
-                created_at, cost, status, additional_info, status_updated_at, 
-                user_id_id, warehouse_id_id, pickup_address
-            ) VALUES (
-                {now_str}, {total_price_str}, {status_str}, {additional_info_str}, {now_str}, 
-                {user_id_str}, {warehouse_id_str}, {pickup_address_str}
-            )
-            """
-            
-            print(f"DEBUG: Direct SQL: {direct_sql}")
-            cursor.execute(direct_sql)
-            
-            # Получаем ID созданного заказа
-            cursor.execute("SELECT last_insert_rowid()")
-            order_id = cursor.fetchone()[0]
+        # Записываем заказ параметризованным INSERT (через ORM) со строками расчета
+        order = write_order(Order(
+            status='new',
+            warehouse_id=warehouse_id,
+            cargo_type=quote_request.cargo_type or 'mixed',
+            container_type=quote_request.pallet_spec if quote_request.cargo_type == 'pallet' else quote_request.box_spec,
+            box_count=box_quantity,
+            pallet_count=pallet_quantity,
+            # Вес, по которому рассчитана стоимость (из токена расчета, если в заказе его нет)
+            weight=quote.weight,
+            client_name=client_data.get('clientName') or client_data.get('name', ''),
+            phone_number=client_data.get('phone', ''),
+            company=client_data.get('companyName') or client_data.get('company'),
+            email=client_data.get('email') or None,
+            telegram_user_id=client_data.get('telegram_user_id'),
+            pickup_address=pickup_address or None,
+            total_price=total_price,
+            user=request.user if request.user.is_authenticated else None,
+        ), quote, [service.id for service in AdditionalService.objects.filter(id__in=quote_request.service_ids)])
+        order_id = str(order.pk)
+        now = order.created_at.strftime("%Y-%m-%d %H:%M:%S")
         
         # Формируем ответ
         return JsonResponse({
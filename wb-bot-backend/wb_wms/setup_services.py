@@ -18,6 +18,8 @@ def create_test_services():
         name='Забор груза (до 10 коробок)',
         pricing_type='pickup',
         specification='city_small',
+        tier_basis='boxes',
+        tier_from=1,
         base_price=500
     )
     
@@ -25,6 +27,8 @@ def create_test_services():
         name='Забор груза (свыше 10 коробок)',
         pricing_type='pickup',
         specification='city_large',
+        tier_basis='boxes',
+        tier_from=11,
         base_price=1000
     )
     
@@ -62,6 +66,8 @@ def create_test_services():
         name='Услуги грузчика (до 20 коробок)',
         pricing_type='loader',
         specification='20',
+        tier_basis='boxes',
+        tier_from=1,
         base_price=500
     )
     
@@ -69,6 +75,8 @@ def create_test_services():
         name='Услуги грузчика (21-40 коробок)',
         pricing_type='loader',
         specification='40',
+        tier_basis='boxes',
+        tier_from=21,
         base_price=1000
     )
     
@@ -76,6 +84,8 @@ def create_test_services():
         name='Услуги грузчика (41-60 коробок)',
         pricing_type='loader',
         specification='60',
+        tier_basis='boxes',
+        tier_from=41,
         base_price=1500
     )
     
@@ -83,6 +93,8 @@ def create_test_services():
         name='Услуги грузчика (свыше 60 коробок)',
         pricing_type='loader',
         specification='61plus',
+        tier_basis='boxes',
+        tier_from=61,
         base_price=2000
     )
     
@@ -89,11 +89,62 @@ WSGI_APPLICATION = "wb_wms.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # Общий файл базы для web-app и обработчиков очередей (том в docker-compose.yml)
+        "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Кеш "quotes" хранит расчеты calculate-price/. По умолчанию - LocMem в каждом
+# процессе; для общего кеша между воркерами укажите, например,
+# QUOTE_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и QUOTE_CACHE_LOCATION=/var/tmp/wb_wms_quotes (или DatabaseCache + имя таблицы).
+# Кеш "default" (готовые ответы справочников) настраивается так же: CACHE_BACKEND,
+# CACHE_LOCATION; актуальность ответов не зависит от него (см. orders.reference_data).
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+    "quotes": {
+        "BACKEND": os.getenv("QUOTE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("QUOTE_CACHE_LOCATION", "quotes"),
+        "TIMEOUT": int(os.getenv("QUOTE_CACHE_TTL", "600")),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("QUOTE_CACHE_MAX_ENTRIES", "5000")),
+        },
+    },
+}
+
+
+# Как часто процесс перечитывает из БД версии тарифов и справочников (orders.DataVersion), сек:
+# правка из другого процесса (админка, load_pricing_data, очередь заказов) видна не позже
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv("DATA_VERSION_CHECK_INTERVAL", "2"))
+
+# Сколько секунд готовый ответ справочника (orders.reference_data) живет в кеше:
+# предел задержки для правок, сделанных в обход сигналов (QuerySet.update, bulk_create)
+REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+# Срок действия токена расчета стоимости (секунды)
+QUOTE_TOKEN_MAX_AGE = int(os.getenv("QUOTE_TOKEN_MAX_AGE", "900"))
+
+# Окно повтора запросов создания заказа с заголовком Idempotency-Key, сек
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+# Через сколько секунд ключ запроса, оборвавшегося без ответа, может забрать повтор
+IDEMPOTENCY_KEY_LEASE = int(os.getenv("IDEMPOTENCY_KEY_LEASE", "120"))
+
+# Асинхронный прием заказов: POST /orders/ отвечает 202, заказы создает process_orders
+# (сервис order-worker в docker-compose.yml; без него /orders/health/ отвечает 503).
+# Для отдельного запроса включается заголовком "Prefer: respond-async"
+ORDER_INTAKE_ASYNC = os.getenv("ORDER_INTAKE_ASYNC", "False").lower() in ("true", "1", "yes")
+
+# Размер страницы списка заказов по умолчанию (GET /orders/?page_size= переопределяет)
+ORDER_LIST_PAGE_SIZE = int(os.getenv("ORDER_LIST_PAGE_SIZE", "50"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -147,3 +198,5 @@ CORS_ALLOW_HEADERS = ["*"]
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_GROUP_ID = os.getenv('TELEGRAM_GROUP_ID')
 TELEGRAM_BOT_URL = os.getenv('TELEGRAM_BOT_URL', 'http://telegram-bot:8080')
+# Таймаут запроса к боту при доставке уведомлений (manage.py dispatch_notifications), сек
+NOTIFICATION_TIMEOUT = float(os.getenv('NOTIFICATION_TIMEOUT', '5'))
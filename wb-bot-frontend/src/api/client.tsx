@@ -4,7 +4,7 @@ interface Warehouse {
     id: number;
     city: string;
     city_name: string;
-    marketplace: string;    
+    marketplace: number;
     marketplace_name: string;
     name: string;
 }
@@ -18,6 +18,19 @@ interface ContainerType {
     pallet_weight: string;
 }
 
+interface Marketplace {
+    id: number;
+    name: string;
+    warehouses: { id: number; name: string; city: string }[];
+}
+
+interface Bootstrap {
+    tariff_version: string;
+    marketplaces: Marketplace[];
+    container_types: any;
+    additional_services: any;
+}
+
 interface PriceResponse {
     total_price: string;
     currency: string;
@@ -26,38 +39,54 @@ interface PriceResponse {
         cargo: string;
         additional_services: string;
     };
+    quote_token?: string;
 }
 
+let bootstrapRequest: Promise<Bootstrap> | null = null;
+
 export const api = {
-    // Получение списка маркетплейсов со складами
-    async getWarehouses() : Promise<Warehouse[]> {
-        const response = await fetch(`${API_BASE_URL}/orders/warehouses/`);
-        if (!response.ok) {
-            throw new Error('Failed to fetch marketplaces');
+    // Все справочники калькулятора одним запросом (один запрос на все вызовы ниже)
+    getBootstrap() : Promise<Bootstrap> {
+        if (!bootstrapRequest) {
+            bootstrapRequest = fetch(`${API_BASE_URL}/orders/bootstrap/`).then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to fetch reference data');
+                }
+                return response.json();
+            }).catch(error => {
+                // Неудачный запрос не кешируется: следующий вызов повторит его
+                bootstrapRequest = null;
+                throw error;
+            });
         }
-        return response.json();
+        return bootstrapRequest;
+    },
+
+    // Получение списка складов (маркетплейсы со складами из bootstrap)
+    async getWarehouses() : Promise<Warehouse[]> {
+        const { marketplaces } = await api.getBootstrap();
+        return marketplaces.flatMap(marketplace => marketplace.warehouses.map(warehouse => ({
+            id: warehouse.id,
+            name: warehouse.name,
+            city: warehouse.city,
+            city_name: warehouse.city,
+            marketplace: marketplace.id,
+            marketplace_name: marketplace.name,
+        })));
     },
 
     // Получение списка типов контейнеров
     async getContainerTypes() : Promise<ContainerType[]> {
-        const response = await fetch(`${API_BASE_URL}/orders/containers/`);
-        if (!response.ok) {
-            throw new Error('Failed to fetch container types');
-        }
-        return response.json();
+        return (await api.getBootstrap()).container_types;
     },
 
     // Получение списка дополнительных услуг
     async getAdditionalServices() {
-        const response = await fetch(`${API_BASE_URL}/orders/additional-services/`);
-        if (!response.ok) {
-            throw new Error('Failed to fetch additional services');
-        }
-        return response.json();
+        return (await api.getBootstrap()).additional_services;
     },
 
     // Создание нового заказа
-    async createOrder(orderData) {
+    async createOrder(orderData, idempotencyKey?: string) {
         // Подготовим данные для отправки на сервер
         const apiOrderData = {
             delivery: {
@@ -79,7 +108,9 @@ export const api = {
                 email: orderData.email || ""
             },
             additionalServices: orderData.additionalServices || [],
-            pickupAddress: orderData.pickupAddress || ''
+            pickupAddress: orderData.pickupAddress || '',
+            // Токен последнего расчета стоимости: сервер не пересчитывает цену повторно
+            quoteToken: orderData.quoteToken || ''
         };
 
         // Если у нас нет selectedBoxSizes, но есть containerType, добавляем его
@@ -93,6 +124,7 @@ export const api = {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
             },
             body: JSON.stringify(apiOrderData),
         });
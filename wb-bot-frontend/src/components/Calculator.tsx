@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import styled from 'styled-components';
 import { Container, Paper, Button, Snackbar, Alert, Typography, Box } from '@mui/material';
 import DeliveryStep from './calculator-steps/DeliveryStep';
@@ -13,7 +13,7 @@ import { CheckCircleOutline } from '@mui/icons-material';
 interface Warehouse {
     id: number;
     name: string;
-    marketplace: string;
+    marketplace: number;
     city: string;
     city_name: string;
     marketplace_name: string;
@@ -160,6 +160,9 @@ const Calculator = () => {
   const [orderPrice, setOrderPrice] = useState<string | null>(null);
   const [isPriceLoading, setIsPriceLoading] = useState<boolean>(false);
   const [priceDetails, setPriceDetails] = useState<any>(null);
+  const [quoteToken, setQuoteToken] = useState<string | null>(null);
+  // Ключ идемпотентности: один на отправку формы, повторы не создают дубликатов заказа
+  const idempotencyKeyRef = useRef<string | null>(null);
   
   const [formData, setFormData] = useState<FormData>({
     // Шаг 1: Доставка
@@ -190,6 +193,11 @@ const Calculator = () => {
     deliveryWarehouse: ''
   });
 
+  useEffect(() => {
+    // Измененная форма - это новый заказ, а не повтор
+    idempotencyKeyRef.current = null;
+  }, [formData]);
+
   const [availableWarehouses, setAvailableWarehouses] = useState<Warehouse[]>([]);
   const [containerTypes, setContainerTypes] = useState<any>(null);
   const navigate = useNavigate();
@@ -199,10 +207,12 @@ const Calculator = () => {
       setIsLoading(true);
       setError(null);
       try {
-        const warehousesData: Warehouse[] = await api.getWarehouses();
+        // Оба справочника - из одного запроса /orders/bootstrap/
+        const [warehousesData, containerTypesData] = await Promise.all([
+          api.getWarehouses(),
+          api.getContainerTypes(),
+        ]);
         setAvailableWarehouses(warehousesData || []);
-
-        const containerTypesData = await api.getContainerTypes();
         setContainerTypes(containerTypesData);
       } catch (err) {
         console.error('Error fetching data:', err);
@@ -239,6 +249,7 @@ const Calculator = () => {
       if (!canCalculate) {
         setOrderPrice(null);
         setPriceDetails(null);
+        setQuoteToken(null);
         return;
       }
       
@@ -246,6 +257,7 @@ const Calculator = () => {
         setIsPriceLoading(true);
         const priceResponse = await api.calculatePrice(formData);
         setOrderPrice(priceResponse.total_price);
+        setQuoteToken(priceResponse.quote_token || null);
         
         // Сохраняем детали стоимости, если они есть в ответе
         if (priceResponse.details) {
@@ -255,6 +267,7 @@ const Calculator = () => {
         console.error('Error calculating price:', err);
         setOrderPrice(null);
         setPriceDetails(null);
+        setQuoteToken(null);
       } finally {
         setIsPriceLoading(false);
       }
@@ -349,7 +362,10 @@ const Calculator = () => {
     try {
       setIsSubmitting(true);
       
-      const response = await api.createOrder(formData);
+      if (!idempotencyKeyRef.current) {
+        idempotencyKeyRef.current = crypto.randomUUID();
+      }
+      const response = await api.createOrder({ ...formData, quoteToken }, idempotencyKeyRef.current);
       setOrderResponse(response);
       
       navigate('/success', {